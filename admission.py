@@ -0,0 +1,262 @@
+"""
+Admission control and upstream rate limiting for the RAG service.
+
+Two mechanisms, both configured in the [service] section of conf.ini:
+
+- AdmissionController caps the number of /api/chat requests processed at
+  once. Excess requests wait in a bounded queue with a deadline; when the
+  queue is full or the deadline passes they are rejected immediately with
+  ServiceOverloaded, which the service turns into 503 + Retry-After.
+  Background jobs (/api/batch) reserve slots for as long as they run, so
+  their LLM calls count against the same cap.
+- TokenBucket limits the request rate to each upstream (embedding API,
+  Doris, LLM). throttle(name) blocks until a token is available, or raises
+  UpstreamThrottled when the wait would exceed upstream_max_wait.
+"""
+
+import asyncio
+import contextlib
+import math
+import threading
+import time
+from typing import AsyncIterator
+
+from conf import settings
+import deadlines
+import metrics
+
+REJECTED = metrics.REGISTRY.counter(
+    "rag_admission_rejected_total", "Requests rejected by admission control.", ("reason",)
+)
+THROTTLE_WAIT = metrics.REGISTRY.histogram(
+    "rag_upstream_throttle_wait_seconds", "Time spent waiting for an upstream rate-limit token.", ("upstream",)
+)
+
+
+class ServiceOverloaded(Exception):
+    """Request rejected to protect the service; retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class UpstreamThrottled(ServiceOverloaded):
+    """An upstream token bucket could not grant a token in time."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket; rate <= 0 means unlimited."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token (possibly going negative) and return the wait in seconds."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1.0
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, max_wait: float) -> float:
+        """
+        Wait for a token. Returns the time waited, or raises UpstreamThrottled
+        without consuming a token if the wait would exceed max_wait.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            wait = self._reserve()
+            if wait > max_wait:
+                self._tokens += 1.0
+                raise UpstreamThrottled("upstream rate limit exceeded", retry_after=wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+_UPSTREAM_RATE_KEYS = {
+    "embedding": "embedding_rps",
+    "doris": "doris_qps",
+    "llm": "llm_rps",
+}
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(upstream: str) -> TokenBucket:
+    """Token bucket for an upstream, built from conf.ini on first use."""
+    with _buckets_lock:
+        bucket = _buckets.get(upstream)
+        if bucket is None:
+            conf = settings.service
+            key = _UPSTREAM_RATE_KEYS.get(upstream, f"{upstream}_rps")
+            rate = float(conf.get(key, 0) or 0)
+            burst = float(conf.get(f"{upstream}_burst", 0) or 0) or None
+            bucket = _buckets[upstream] = TokenBucket(rate, burst)
+        return bucket
+
+
+def throttle(upstream: str) -> None:
+    """Block until the upstream's token bucket grants a request."""
+    # Never wait past the request deadline
+    max_wait = deadlines.timeout(float(settings.service.get("upstream_max_wait", 5)), upstream)
+    try:
+        waited = get_bucket(upstream).acquire(max_wait)
+    except UpstreamThrottled as e:
+        REJECTED.inc(reason=f"{upstream}_rate_limit")
+        raise UpstreamThrottled(f"{upstream} rate limit exceeded", retry_after=e.retry_after)
+    THROTTLE_WAIT.observe(waited, upstream=upstream)
+
+
+class AdmissionController:
+    """Global concurrency cap with a bounded, deadline-limited wait queue."""
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        # Slots held by background jobs
+        self.reserved = 0
+        self.rejected = 0
+        # EWMA of request service time, used to estimate Retry-After
+        self._avg_service = 1.0
+        self._sem: asyncio.Semaphore | None = None
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        conf = settings.service
+        return cls(
+            max_concurrency=int(conf.get("max_concurrency", 16)),
+            max_queue=int(conf.get("max_queue", 64)),
+            queue_timeout=float(conf.get("queue_timeout", 10)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created on first use, inside the event loop
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        return self._sem
+
+    async def reserve(self, slots: int) -> int:
+        """
+        Hold up to `slots` processing slots for a background job, always
+        leaving one for requests; returns how many are held, to hand back
+        with release(). Waits for them like a queued request does.
+        """
+        if not self.enabled:
+            return 0
+        sem = self._semaphore()
+        held = 0
+        try:
+            for _ in range(max(0, min(slots, self.max_concurrency - 1 - self.reserved))):
+                await asyncio.wait_for(sem.acquire(), timeout=self.queue_timeout)
+                held += 1
+                self.reserved += 1
+        except BaseException as e:
+            self.release(held)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("reserve_timeout", "timed out waiting for processing slots")
+            raise
+        return held
+
+    def release(self, slots: int) -> None:
+        """Give back slots held by reserve()."""
+        for _ in range(slots):
+            self.reserved -= 1
+            self._sem.release()
+
+    def _retry_after(self) -> float:
+        # Time for the current queue to drain through the available slots
+        return self._avg_service * (self.waiting + 1) / max(1, self.max_concurrency)
+
+    def _reject(self, reason: str, message: str) -> ServiceOverloaded:
+        self.rejected += 1
+        REJECTED.inc(reason=reason)
+        return ServiceOverloaded(message, retry_after=self._retry_after())
+
+    @contextlib.asynccontextmanager
+    async def admit(self, deadline: deadlines.Deadline | None = None) -> AsyncIterator[None]:
+        """
+        Hold a processing slot for the duration of the block. A queued
+        request gives up as soon as `deadline` is cancelled or runs out.
+        """
+        if not self.enabled:
+            yield
+            return
+        self._semaphore()
+
+        if self._sem.locked():
+            if self.waiting >= self.max_queue:
+                raise self._reject("queue_full", "request queue is full")
+            self.waiting += 1
+            try:
+                await self._wait_for_slot(deadline)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._sem.acquire()
+
+        self.active += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._avg_service = 0.8 * self._avg_service + 0.2 * (time.monotonic() - start)
+            self._sem.release()
+
+    async def _wait_for_slot(self, deadline: deadlines.Deadline | None, poll: float = 0.25) -> None:
+        """
+        Acquire a slot within queue_timeout; raises RequestCancelled or
+        DeadlineExceeded for a request abandoned while queued.
+        """
+        limit = self.queue_timeout if deadline is None else min(self.queue_timeout, max(0.0, deadline.remaining()))
+        give_up = time.monotonic() + limit
+        acquire = asyncio.ensure_future(self._sem.acquire())
+        try:
+            # Cancellation is a threading.Event, so it is polled between waits
+            while not acquire.done():
+                left = give_up - time.monotonic()
+                if left <= 0 or (deadline is not None and deadline.cancelled):
+                    break
+                await asyncio.wait({acquire}, timeout=min(poll, left))
+        except BaseException:
+            self._abandon(acquire)
+            raise
+        if acquire.done():
+            return
+        self._abandon(acquire)
+        if deadline is not None:
+            deadline.check("admission")
+        raise self._reject("queue_timeout", "timed out waiting in request queue")
+
+    def _abandon(self, acquire: "asyncio.Future") -> None:
+        # A slot granted just as the request gave up goes back
+        if not acquire.cancel() and not acquire.cancelled() and acquire.exception() is None:
+            self._sem.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "reserved": self.reserved,
+            "rejected": self.rejected,
+        }
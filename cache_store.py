@@ -0,0 +1,247 @@
+"""
+Key/value stores behind the service caches.
+
+Each cache (retrieval results, query embeddings, answers) lives in its own
+namespace of a store chosen by [cache] backend:
+
+- memory  an LRU in the process (default). Every uvicorn/gunicorn worker
+          has its own copy, so hit rates and memory are split per worker.
+- sqlite  one SQLite file in WAL mode shared by all workers on the host.
+          Values are pickled; each namespace is bounded by its byte budget
+          and evicts the least recently used entries. Triggers keep each
+          namespace's byte total in a counter row, so a write never sums
+          the namespace. Nothing else needs to run next to the service.
+
+Only the service writes the SQLite file; do not point [cache] path at a
+location other users can write to, as values are unpickled on read.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _pickled_size(value: Any) -> int:
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class MemoryStore:
+    """Thread-safe LRU of objects, bounded by the total of `sizeof(value)`."""
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = _pickled_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: Any) -> None:
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteStore:
+    """
+    Namespace of a SQLite file shared between processes. Connections are
+    per thread and per process, so the store survives gunicorn's fork.
+    """
+
+    # Access times are refreshed at most this often, to keep hits read-only
+    TOUCH_SECONDS = 30
+
+    def __init__(self, path: str, namespace: str, max_bytes: int):
+        self.path = path
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._ensure_schema()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _ensure_schema(self) -> None:
+        conn = self._conn()
+        # One write transaction, so the counter starts from the entries of a file written before it existed
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (namespace, accessed)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS namespaces (namespace TEXT PRIMARY KEY, bytes INTEGER NOT NULL)"
+            )
+            for name, event, delta in (
+                ("entries_added", "INSERT", "NEW.size"),
+                ("entries_resized", "UPDATE OF size", "NEW.size - OLD.size"),
+                ("entries_removed", "DELETE", "-OLD.size"),
+            ):
+                row = "OLD" if event == "DELETE" else "NEW"
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON entries BEGIN"
+                    f" UPDATE namespaces SET bytes = bytes + {delta} WHERE namespace = {row}.namespace; END"
+                )
+            conn.execute(
+                "INSERT OR IGNORE INTO namespaces (namespace, bytes)"
+                " SELECT ?, COALESCE(SUM(size), 0) FROM entries WHERE namespace = ?",
+                (self.namespace, self.namespace),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, key: str) -> Any | None:
+        try:
+            return self._get(key)
+        except sqlite3.Error as e:
+            # A locked or corrupt cache file must not fail requests
+            logger.warning("Cache %s read failed: %s", self.namespace, e)
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        try:
+            self._put(key, value)
+        except sqlite3.Error as e:
+            logger.warning("Cache %s write failed: %s", self.namespace, e)
+
+    def _get(self, key: str) -> Any | None:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, accessed FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > self.TOUCH_SECONDS:
+            conn.execute(
+                "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+            )
+        return pickle.loads(row[0])
+
+    def _put(self, key: str, value: Any) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        conn = self._conn()
+        # An upsert rather than REPLACE: the replaced row's size must reach the update trigger
+        conn.execute(
+            "INSERT INTO entries (namespace, key, value, size, accessed) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (namespace, key) DO UPDATE SET"
+            " value = excluded.value, size = excluded.size, accessed = excluded.accessed",
+            (self.namespace, key, blob, len(blob), time.time()),
+        )
+        self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        row = conn.execute("SELECT bytes FROM namespaces WHERE namespace = ?", (self.namespace,)).fetchone()
+        total = row[0] if row is not None else 0
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% so a full cache does not evict on every write
+        excess = total - int(self.max_bytes * 0.9)
+        rows = conn.execute(
+            "SELECT key, size FROM entries WHERE namespace = ? ORDER BY accessed", (self.namespace,)
+        )
+        victims = []
+        for key, size in rows:
+            victims.append((self.namespace, key))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self) -> int:
+        (count,) = self._conn().execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return count
+
+
+def digest(*parts: str) -> str:
+    """Compact cache key for arbitrary-length text parts."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+_named: dict[str, Any] = {}
+_named_lock = threading.Lock()
+
+
+def named_store(namespace: str):
+    """
+    Store for an optional [cache] namespace ("embeddings", "answers"), or
+    None unless `[cache] <namespace> = true`; sized by `<namespace>_max_mb`.
+    """
+    conf = settings.cache
+    if not conf.getboolean(namespace, False):
+        return None
+    with _named_lock:
+        if namespace not in _named:
+            max_bytes = int(float(conf.get(f"{namespace}_max_mb", 32)) * 1024 * 1024)
+            _named[namespace] = open_store(namespace, max_bytes)
+        return _named[namespace]
+
+
+def open_store(namespace: str, max_bytes: int, sizeof: Callable[[Any], int] = _pickled_size):
+    """The store for `namespace` on the configured [cache] backend."""
+    conf = settings.cache
+    backend = conf.get("backend", "memory").lower()
+    if backend == "memory":
+        return MemoryStore(max_bytes, sizeof)
+    if backend == "sqlite":
+        path = conf.get("path", "./rag_cache.sqlite")
+        logger.info("Cache %s shared through %s", namespace, path)
+        return SqliteStore(path, namespace, max_bytes)
+    raise ValueError(f"Unsupported cache backend: {backend}")
@@ -1,12 +1,36 @@
 import configparser
 import os
+import threading
+
+# Path of the configuration file; override with DORIS_RAG_CONF (used by the
+# benchmark and evaluation tools to point the libraries at generated configs)
+CONFIG_FILE = os.getenv("DORIS_RAG_CONF", "conf.ini")
+
 
 class Config:
-    def __init__(self, config_file='conf.ini'):
-        self.config = configparser.ConfigParser()
-        if not os.path.exists(config_file):
-            raise FileNotFoundError(f"Configuration file {config_file} not found.")
-        self.config.read(config_file)
+    def __init__(self, config_file=CONFIG_FILE):
+        # Read on first use, so importing modules never touches the filesystem
+        self.config_file = config_file
+        self._config = None
+        self._lock = threading.Lock()
+
+    @property
+    def config(self):
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    if not os.path.exists(self.config_file):
+                        raise FileNotFoundError(f"Configuration file {self.config_file} not found.")
+                    config = configparser.ConfigParser()
+                    config.read(self.config_file)
+                    self._config = config
+        return self._config
+
+    def _optional(self, name):
+        # Optional sections read as empty, so callers can always use .get() fallbacks
+        if not self.config.has_section(name):
+            self.config.add_section(name)
+        return self.config[name]
 
     @property
     def app(self):
@@ -26,7 +50,24 @@ class Config:
 
     @property
     def docs(self):
-        return self.config['docs']
+        # The query side reads [docs] sources for language routing; only the indexer needs it
+        return self._optional('docs')
+
+    @property
+    def service(self):
+        return self._optional('service')
+
+    @property
+    def batch(self):
+        return self._optional('batch')
+
+    @property
+    def retrieval(self):
+        return self._optional('retrieval')
+
+    @property
+    def cache(self):
+        return self._optional('cache')
 
 # Global configuration instance
 settings = Config()
@@ -0,0 +1,239 @@
+"""
+Small-to-big retrieval: expand search hits to their surrounding chunks.
+
+Small chunks keep the ANN search precise, but an isolated chunk often
+lacks the text around it. With [retrieval] expand set, every hit is
+widened after the search to:
+
+- neighbors  the `expand_neighbors` chunks before and after it in the same
+             file (by chunk_index with the markdown chunker, else by
+             location range, `expand_neighbors` x chunk_size characters)
+- section    its whole top-level section (needs [docs] chunker = markdown)
+
+All expansions of a search are fetched in one batched query on the same
+table (or from the local index with the local backend). Hits in the same
+file whose windows overlap are merged into one context block, so the
+result may have fewer rows than top_k. Blocks are capped at
+`expand_max_chars` around the hit. A FetchCache shared across the searches
+of one request (e.g. batch windows or multiple queries) keeps chunks that
+were already fetched from being fetched again.
+"""
+
+import json
+import threading
+from typing import Any
+
+import pandas as pd
+
+from conf import settings
+from doris_http import conf_client
+import deadlines
+import md_chunker
+import metrics
+
+MODES = ("none", "neighbors", "section")
+
+
+class FetchCache:
+    """Chunks fetched during one request, by (table, filename)."""
+
+    def __init__(self):
+        self._rows: dict[tuple[str, str], dict[Any, dict[str, Any]]] = {}
+        self._covered: dict[tuple[str, str], list[tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+
+    def missing(self, table: str, filename: str, window: tuple[int, int]) -> bool:
+        with self._lock:
+            return not any(lo <= window[0] and window[1] <= hi for lo, hi in self._covered.get((table, filename), []))
+
+    def add(self, table: str, filename: str, windows: list[tuple[int, int]], rows: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self._covered.setdefault((table, filename), []).extend(windows)
+            stored = self._rows.setdefault((table, filename), {})
+            for row in rows:
+                stored[row["_key"]] = row
+
+    def rows(self, table: str, filename: str) -> list[dict[str, Any]]:
+        with self._lock:
+            return list(self._rows.get((table, filename), {}).values())
+
+
+def mode() -> str:
+    """The configured [retrieval] expand mode."""
+    expand = settings.retrieval.get('expand', 'none').strip().lower()
+    if expand not in MODES:
+        raise ValueError(f"Unsupported retrieval.expand: {expand}. Use none, neighbors or section.")
+    if expand == 'section' and not md_chunker.configured():
+        raise ValueError("retrieval.expand = section needs [docs] chunker = markdown")
+    return expand
+
+
+def _location(value: Any) -> tuple[int, int] | None:
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    if hasattr(value, "tolist"):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return int(value[0]), int(value[1])
+    return None
+
+
+def _window(hit: dict[str, Any], mode: str, neighbors: int, span: int) -> tuple[str, tuple[int, int]] | None:
+    """(ordering column, inclusive window) of the chunks to fetch around a hit."""
+    if mode == 'section':
+        section = int(hit["section_index"])
+        return "section_index", (section, section)
+    if md_chunker.configured():
+        index = int(hit["chunk_index"])
+        return "chunk_index", (index - neighbors, index + neighbors)
+    location = _location(hit.get("location"))
+    if location is None:
+        return None
+    return "location", (location[0] - span, location[1] + span)
+
+
+def _in_window(row: dict[str, Any], column: str, lo: int, hi: int) -> bool:
+    if column == "location":
+        location = _location(row.get("location"))
+        return location is not None and location[1] >= lo and location[0] <= hi
+    return row.get(column) is not None and lo <= int(row[column]) <= hi
+
+
+def _order(row: dict[str, Any], column: str) -> int:
+    if column == "location":
+        return (_location(row.get("location")) or (0, 0))[0]
+    return int(row["chunk_index"])
+
+
+def _fetch_doris(table: str, requests: list[tuple[str, str, tuple[int, int]]], columns: list[str]) -> list[dict]:
+    db = settings.doris.get('db_name')
+    conditions, params = [], []
+    for filename, column, (lo, hi) in requests:
+        if column == "location":
+            # Chunks overlapping [lo, hi]; location is ARRAY<BIGINT> [start, end]
+            conditions.append("(`filename` = ? AND element_at(`location`, 2) >= ? AND element_at(`location`, 1) <= ?)")
+        else:
+            conditions.append(f"(`filename` = ? AND `{column}` BETWEEN ? AND ?)")
+        params.extend([filename, lo, hi])
+    cols = ", ".join(f"`{c}`" for c in columns)
+    sql = f"SELECT {cols} FROM `{db}`.`{table}` WHERE {' OR '.join(conditions)}"
+    timeout = max(1, int(deadlines.timeout(30, "expand")))
+    names, rows = conf_client(settings.doris).query_prepared(sql, params, timeout=timeout)
+    return [dict(zip(names, row)) for row in rows]
+
+
+def _fetch_local(requests: list[tuple[str, str, tuple[int, int]]], columns: list[str]) -> list[dict]:
+    from local_index import get_local_index
+
+    meta = get_local_index().meta_rows()
+    wanted: dict[str, list[tuple[str, tuple[int, int]]]] = {}
+    for filename, column, window in requests:
+        wanted.setdefault(filename, []).append((column, window))
+    rows = []
+    for m in meta:
+        if any(_in_window(m, column, lo, hi) for column, (lo, hi) in wanted.get(m.get("filename"), [])):
+            rows.append({c: m.get(c) for c in columns})
+    return rows
+
+
+def _stitch(rows: list[dict[str, Any]], column: str) -> str:
+    """Texts of consecutive chunks; overlapping recursive chunks are trimmed to their new part."""
+    if column != "location":
+        return "\n\n".join(str(r.get("text") or "") for r in rows)
+    parts: list[str] = []
+    prev_end = None
+    for r in rows:
+        text = str(r.get("text") or "")
+        location = _location(r.get("location"))
+        if prev_end is not None and location is not None and location[0] < prev_end:
+            text = text[prev_end - location[0]:]
+        if text:
+            parts.append(text)
+        if location is not None:
+            prev_end = max(prev_end or 0, location[1])
+    return "".join(parts)
+
+
+def _cap(rows: list[dict[str, Any]], hit_keys: set, max_chars: int) -> list[dict[str, Any]]:
+    """Drop chunks farthest from the hits until the block fits in max_chars."""
+    hit_pos = [i for i, r in enumerate(rows) if str(r["_key"]) in hit_keys] or [0]
+    kept = set(range(len(rows)))
+    by_distance = sorted(kept, key=lambda i: -min(abs(i - h) for h in hit_pos))
+    total = sum(len(str(r.get("text") or "")) for r in rows)
+    for i in by_distance:
+        if total <= max_chars or str(rows[i]["_key"]) in hit_keys:
+            break
+        kept.discard(i)
+        total -= len(str(rows[i].get("text") or ""))
+    return [r for i, r in enumerate(rows) if i in kept]
+
+
+def expand_hits(df: pd.DataFrame, table: str, local: bool = False, cache: FetchCache | None = None) -> pd.DataFrame:
+    """
+    Search hits (rows of `table`) widened per [retrieval] expand. Returns
+    one row per merged block, in the order of its best (first-ranked) hit.
+    """
+    expand = mode()
+    if expand == 'none' or df.empty:
+        return df
+    conf = settings.retrieval
+    neighbors = int(conf.get('expand_neighbors', 1))
+    span = neighbors * int(settings.docs.get('chunk_size', 500))
+    max_chars = int(conf.get('expand_max_chars', 4000))
+    cache = cache or FetchCache()
+    columns = list(df.columns.drop("distance", errors="ignore"))
+
+    hits = df.to_dict("records")
+    # Hits are ranked by the search (distance) or by fusion (rrf_score)
+    rank = {id(hit): i for i, hit in enumerate(hits)}
+    windows = [_window(hit, expand, neighbors, span) for hit in hits]
+    needed = [
+        (hit["filename"], w[0], w[1]) for hit, w in zip(hits, windows)
+        if w is not None and cache.missing(table, hit["filename"], w[1])
+    ]
+    with metrics.span("expand", hits=len(hits), fetch=len(needed)) as attrs:
+        if needed:
+            fetched = _fetch_local(needed, columns) if local else _fetch_doris(table, needed, columns)
+            attrs["rows"] = len(fetched)
+            by_file: dict[str, list[dict]] = {}
+            for row in fetched:
+                by_file.setdefault(row["filename"], []).append(row)
+            for filename, column, window in needed:
+                cache.add(table, filename, [window], by_file.get(filename, []))
+
+    # Merge hits of a file whose windows overlap into one block
+    blocks: list[dict[str, Any]] = []
+    for hit, w in sorted(zip(hits, windows), key=lambda p: (p[0]["filename"], p[1][1] if p[1] else (0, 0))):
+        last = blocks[-1] if blocks else None
+        if (w is not None and last is not None and last["filename"] == hit["filename"]
+                and last["window"] is not None and w[1][0] <= last["window"][1] + 1):
+            last["window"] = (last["window"][0], max(last["window"][1], w[1][1]))
+            last["hits"].append(hit)
+        else:
+            blocks.append({"filename": hit["filename"], "column": w[0] if w else None,
+                           "window": w[1] if w else None, "hits": [hit]})
+
+    records = []
+    for block in blocks:
+        best = min(block["hits"], key=lambda h: rank[id(h)])
+        record = dict(best)
+        record_rank = rank[id(best)]
+        if block["window"] is not None:
+            column, (lo, hi) = block["column"], block["window"]
+            rows = [r for r in cache.rows(table, block["filename"]) if _in_window(r, column, lo, hi)]
+            rows.sort(key=lambda r: _order(r, column))
+            hit_keys = {str(h["_key"]) for h in block["hits"]}
+            rows = _cap(rows, hit_keys, max_chars)
+            if rows:
+                record["text"] = _stitch(rows, column)
+                locations = [_location(r.get("location")) for r in rows]
+                locations = [loc for loc in locations if loc is not None]
+                if locations:
+                    record["location"] = [min(loc[0] for loc in locations), max(loc[1] for loc in locations)]
+        records.append((record_rank, record))
+    records.sort(key=lambda r: r[0])
+    return pd.DataFrame([r for _, r in records], columns=list(df.columns))
+
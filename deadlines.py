@@ -0,0 +1,145 @@
+"""
+Request deadlines and cancellation for the RAG pipeline.
+
+rag_service gives every /api/chat request a Deadline: the request's
+`timeout_ms`, capped at [service] request_timeout (also the default),
+counted from arrival, so time queued for admission is included. It is
+cancelled when the client disconnects. The deadline is held in a context
+variable for the request's thread (and the fan-out threads that copy its
+context), and the pipeline consults it through the module functions:
+
+- check(stage) raises DeadlineExceeded or RequestCancelled between stages,
+  so nothing new is sent upstream for an abandoned request
+- timeout(default) bounds each LLM, embedding-throttle and Doris call by
+  the time left (Doris queries also get it as their query_timeout, so the
+  FE aborts them)
+- allows(stage) tells optional steps (augmentation, multi-query fan-out,
+  context expansion) to skip themselves once less than
+  [service] generation_reserve_ms is left, keeping that time for the
+  answer itself
+
+Outside a request (CLI, batch, benchmarks) there is no deadline and all of
+these are no-ops. A blocking upstream call already in flight is not
+interrupted; it is bounded by the timeout it was given.
+"""
+
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from typing import Iterator
+
+from conf import settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_EVENTS = metrics.REGISTRY.counter(
+    "rag_deadline_events_total",
+    "Pipeline stages skipped, timed out or cancelled because of the request deadline.",
+    ("stage", "event"),
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of time before `stage`."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"request deadline exceeded before {stage}")
+        self.stage = stage
+
+
+class RequestCancelled(Exception):
+    """The request was cancelled (client disconnected) before `stage`."""
+
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"request cancelled before {stage}: {reason}")
+        self.stage = stage
+
+
+class Deadline:
+    """Absolute time budget of one request, which can also be cancelled."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.reason = ""
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def for_request(cls, timeout_ms: int | None = None) -> "Deadline":
+        """Deadline for a request asking for `timeout_ms`, capped at [service] request_timeout."""
+        limit = float(settings.service.get("request_timeout", 60))
+        seconds = limit if not timeout_ms or timeout_ms <= 0 else min(timeout_ms / 1000.0, limit)
+        return cls(seconds)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str) -> None:
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def check(self, stage: str) -> None:
+        if self.cancelled:
+            DEADLINE_EVENTS.inc(stage=stage, event="cancelled")
+            raise RequestCancelled(stage, self.reason)
+        if self.remaining() <= 0:
+            DEADLINE_EVENTS.inc(stage=stage, event="exceeded")
+            raise DeadlineExceeded(stage)
+
+
+_current: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar("rag_deadline", default=None)
+
+
+def current() -> Deadline | None:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def scope(deadline: Deadline | None) -> Iterator[Deadline | None]:
+    """Make `deadline` the current one for the enclosed pipeline calls."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def check(stage: str) -> None:
+    """Raise if the current request is cancelled or out of time."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+def timeout(default: float, stage: str = "upstream") -> float:
+    """Timeout for an upstream call: `default`, or less when the deadline is nearer."""
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    deadline.check(stage)
+    return min(default, deadline.remaining())
+
+
+def allows(stage: str) -> bool:
+    """
+    Whether an optional stage should run: False once less than
+    [service] generation_reserve_ms is left (or the request is gone).
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return True
+    deadline.check(stage)
+    reserve = float(settings.service.get("generation_reserve_ms", 10000)) / 1000.0
+    if deadline.remaining() >= reserve:
+        return True
+    DEADLINE_EVENTS.inc(stage=stage, event="skipped")
+    logger.info("Skipping %s: %.1fs left of the request deadline", stage, deadline.remaining())
+    return False
@@ -0,0 +1,123 @@
+"""
+Near-duplicate detection for chunks at index time.
+
+The doris-website tree repeats most pages across versions and sidebars.
+With [docs] dedup = exact or near, the indexer fingerprints every chunk
+by its normalized text (case, whitespace and markdown punctuation
+ignored), embeds each distinct text only once, and DorisTarget(dedup=...)
+keeps only one canonical row per group of duplicates in the table:
+
+- exact  chunks with the same normalized text (fingerprint: its hash)
+- near   chunks whose SimHash differs in at most `dedup_distance` bits
+
+The other members of a group go to the `<table>__dups` side table, which
+links each of them (with its filename, location and text) to the key of
+its canonical row. The ANN index then holds one vector per group, and
+results of a search are all distinct.
+
+SimHashIndex finds a fingerprint within the distance by splitting it into
+distance + 1 bands: two fingerprints that differ in at most that many
+bits agree on at least one band exactly.
+"""
+
+import hashlib
+import re
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_CJK = re.compile(r"[\u3040-\u30ff\u4e00-\u9fff\uac00-\ud7af]")
+_MASK = (1 << 64) - 1
+
+
+def normalize(text: str) -> str:
+    """Lower-cased words separated by single spaces; markup and punctuation dropped."""
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def _features(normalized: str) -> list[str]:
+    # Word trigrams; CJK text has no spaces, so character trigrams there
+    if _CJK.search(normalized):
+        chars = normalized.replace(" ", "")
+        return [chars[i:i + 3] for i in range(max(1, len(chars) - 2))]
+    words = normalized.split(" ")
+    return [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the normalized text."""
+    counts = [0] * 64
+    for feature in _features(normalize(text)):
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            counts[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if counts[bit] > 0) & _MASK
+
+
+def content_digest(text: str) -> str:
+    """Exact-duplicate key: 128-bit hash of the normalized text, as hex."""
+    return hashlib.blake2b(normalize(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def fingerprint(text: str, mode: str) -> str:
+    """Hex value stored in the `fingerprint` column: the content digest (exact) or SimHash (near)."""
+    if mode == "exact":
+        return content_digest(text)
+    return f"{simhash(text):016x}"
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    Keys by fingerprint; finds a key whose fingerprint is within max_distance
+    bits. With max_distance 0 it is an exact lookup (used for content digests).
+    """
+
+    def __init__(self, max_distance: int = 3, bits: int = 64):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self._width = -(-bits // self.bands)
+        self._buckets: list[dict[int, set]] = [{} for _ in range(self.bands)]
+        self.fingerprints: dict = {}
+
+    def _band_values(self, fp: int) -> list[int]:
+        mask = (1 << self._width) - 1
+        return [fp >> (i * self._width) & mask for i in range(self.bands)]
+
+    def add(self, key, fp: int | str) -> None:
+        fp = int(fp, 16) if isinstance(fp, str) else fp
+        self.remove(key)
+        self.fingerprints[key] = fp
+        for bucket, value in zip(self._buckets, self._band_values(fp)):
+            bucket.setdefault(value, set()).add(key)
+
+    def remove(self, key) -> None:
+        fp = self.fingerprints.pop(key, None)
+        if fp is None:
+            return
+        for bucket, value in zip(self._buckets, self._band_values(fp)):
+            keys = bucket.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del bucket[value]
+
+    def find(self, fp: int | str, exclude=None):
+        """Closest key within max_distance, or None."""
+        fp = int(fp, 16) if isinstance(fp, str) else fp
+        best, best_distance = None, self.max_distance + 1
+        for bucket, value in zip(self._buckets, self._band_values(fp)):
+            for key in bucket.get(value, ()):
+                if key == exclude:
+                    continue
+                distance = hamming(fp, self.fingerprints[key])
+                if distance < best_distance:
+                    best, best_distance = key, distance
+        return best
+
+    def __contains__(self, key) -> bool:
+        return key in self.fingerprints
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
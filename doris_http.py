@@ -1,7 +1,16 @@
+import itertools
 import json
-from typing import Dict, Optional
+import math
+import queue
+import threading
+import time
+from base64 import b64encode
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 from urllib.parse import urljoin
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 
 logger = logging.getLogger(__name__)
@@ -50,6 +59,168 @@ def put_with_manual_redirect(
     return resp
 
 
+def is_transport_error(error: BaseException) -> bool:
+    """
+    True for failures to reach or hear back from an FE/BE (worth retrying
+    elsewhere), False for errors Doris itself reported (bad SQL, bad data).
+    """
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError)):
+        return True
+    try:
+        from mysql.connector import errors  # type: ignore
+    except ImportError:
+        return False
+    # InterfaceError covers lost connections; OperationalError a refused/broken one
+    return isinstance(error, (errors.InterfaceError, errors.OperationalError))
+
+
+def is_connect_error(error: BaseException) -> bool:
+    """
+    True for failures to open a connection at all: nothing reached the FE,
+    so even a non-idempotent statement can be sent elsewhere.
+    """
+    if isinstance(error, (requests.exceptions.ConnectTimeout, ConnectionRefusedError)):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        from urllib3.exceptions import NewConnectionError
+
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    try:
+        from mysql.connector import errors  # type: ignore
+    except ImportError:
+        return False
+    # CR_CONNECTION_ERROR, CR_CONN_HOST_ERROR, CR_UNKNOWN_HOST
+    return isinstance(error, errors.Error) and error.errno in (2002, 2003, 2005)
+
+
+def new_session(pool_hosts: int = 10, pool_maxsize: int = 10) -> requests.Session:
+    """
+    Session with keep-alive pools sized for Stream Load: `pool_maxsize`
+    connections kept per host (FE or BE), `pool_hosts` hosts kept at once.
+    """
+    session = requests.Session()
+    # Avoid inheriting proxy/env that might strip or alter Authorization
+    session.trust_env = False
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def discover_backends(session: requests.Session, fe_base_url: str, timeout: int = 10) -> List[str]:
+    """HTTP addresses (host:port) of alive BEs, from the FE /api/backends endpoint."""
+    resp = session.get(f"{fe_base_url}/api/backends", params={"is_alive": "true"}, timeout=timeout)
+    resp.raise_for_status()
+    payload = resp.json()
+    data = payload.get("data", payload) if isinstance(payload, dict) else {}
+    backends = data.get("backends") or []
+    return [
+        f"{b['ip']}:{b['http_port']}"
+        for b in backends
+        if b.get("is_alive", True) and b.get("ip") and b.get("http_port")
+    ]
+
+
+def _is_stream_load_result(resp: requests.Response) -> bool:
+    """Whether an FE served a Stream Load itself: a 2xx answer with a Stream Load result body."""
+    if not 200 <= resp.status_code < 300:
+        return False
+    try:
+        body = resp.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and "Status" in body
+
+
+class StreamLoadTransport:
+    """
+    Sends Stream Load PUTs over one keep-alive session.
+
+    Through the FE, the redirect to a BE is resolved first with a bodiless
+    PUT carrying only the headers. requests does not wait for a
+    `100 Continue` and would upload the body to the FE before it answers
+    with 307, then upload it again to the BE. If the FE serves the probe
+    itself (a 2xx Stream Load result), probing stops and bodies are sent to
+    the FE directly.
+
+    With `backends` set, loads go straight to those BE addresses in
+    round-robin order (a retry moves on to the next BE). Otherwise, with an
+    `fe_pool` (fe_balancer.FrontendPool), each load goes through the least
+    busy healthy FE and a failed FE is skipped by the retry.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session,
+        fe_base_url: str,
+        backends: Optional[List[str]] = None,
+        protocol: str = "http",
+        probe_redirect: bool = True,
+        fe_pool: Optional[Any] = None,
+    ):
+        self.session = session
+        self.fe_base_url = fe_base_url
+        self.fe_pool = fe_pool
+        self.backends = list(backends or [])
+        self.protocol = protocol
+        self.probe_redirect = probe_redirect
+        self._next_backend = itertools.cycle(self.backends) if self.backends else None
+        self._lock = threading.Lock()
+
+    def url(self, database: str, table: str) -> str:
+        """Stream Load URL: the next BE in direct mode, else the FE."""
+        if self._next_backend is not None:
+            with self._lock:
+                base_url = f"{self.protocol}://{next(self._next_backend)}"
+        elif self.fe_pool is not None:
+            base_url = self.fe_pool.base_url(self.fe_pool.pick())
+        else:
+            base_url = self.fe_base_url
+        return f"{base_url}/api/{database}/{table}/_stream_load"
+
+    def put(self, url: str, headers: Dict[str, str], data: bytes, timeout: int) -> requests.Response:
+        if self.fe_pool is not None and self._next_backend is None:
+            fe = next(fe for fe in self.fe_pool.frontends if url.startswith(self.fe_pool.base_url(fe) + "/"))
+            with self.fe_pool.track(fe, "stream_load"):
+                return self._put(url, headers, data, timeout)
+        return self._put(url, headers, data, timeout)
+
+    def _put(self, url: str, headers: Dict[str, str], data: bytes, timeout: int) -> requests.Response:
+        if self._next_backend is not None or not self.probe_redirect:
+            return put_with_manual_redirect(self.session, url, headers, data, timeout)
+        # No label: should the FE serve the probe itself, nothing is committed under it
+        probe_headers = {k: v for k, v in headers.items() if k.lower() != "label"}
+        probe = self.session.put(url, data=b"", headers=probe_headers, allow_redirects=False, timeout=timeout)
+        # Read the (small) body so the connection goes back to the pool
+        probe.content
+        loc = probe.headers.get("Location")
+        if probe.status_code in (301, 302, 303, 307, 308) and loc:
+            redirect_url = urljoin(probe.url, loc)
+            logger.debug(f"Stream Load redirected to {redirect_url}")
+            return self.session.put(redirect_url, data=data, headers=headers, allow_redirects=False, timeout=timeout)
+        if _is_stream_load_result(probe):
+            logger.info("FE answered Stream Load without a redirect; sending bodies to it directly")
+            self.probe_redirect = False
+        else:
+            # A transient 5xx or an auth error says nothing about redirects; keep probing
+            logger.debug(f"Stream Load probe answered HTTP {probe.status_code}; sending this body to the FE")
+        return put_with_manual_redirect(self.session, url, headers, data, timeout)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+# (path, body key for the statement, accepts "database")
+_SQL_ENDPOINTS = (
+    ("/api/_sql", "stmt", False),
+    ("/api/sql", "sql", True),
+    ("/rest/v2/sql", "sql", True),
+)
+# Index into _SQL_ENDPOINTS of the endpoint that last worked, per FE base URL
+_working_endpoint: Dict[str, int] = {}
+
+
 def post_sql(
     session: requests.Session,
     base_url: str,
@@ -58,45 +229,378 @@ def post_sql(
     database: Optional[str],
     timeout: int,
 ) -> requests.Response:
-    """Attempt to execute SQL via Doris HTTP endpoints, trying multiple paths.
+    """Execute SQL via a Doris HTTP endpoint, trying several paths.
 
-    Tries in order:
-      1) POST /api/_sql with body {"stmt": sql}
-      2) POST /api/sql with body {"sql": sql, "database": database}
-      3) POST /rest/v2/sql with body {"sql": sql, "database": database}
+    Tries POST /api/_sql ({"stmt": sql}), /api/sql and /rest/v2/sql
+    ({"sql": sql, "database": database}), starting with the one that last
+    answered for this FE, so a working FE costs one round trip.
     Returns the final response.
     """
     headers = {
         "Authorization": auth_header,
         "Content-Type": "application/json",
     }
+    first = _working_endpoint.get(base_url, 0)
+    order = [first] + [i for i in range(len(_SQL_ENDPOINTS)) if i != first]
+    for n, i in enumerate(order):
+        path, key, with_database = _SQL_ENDPOINTS[i]
+        body = {key: sql}
+        if with_database and database:
+            body["database"] = database
+        resp = session.post(f"{base_url}{path}", json=body, headers=headers, allow_redirects=False, timeout=timeout)
+        if resp.status_code < 400:
+            _working_endpoint[base_url] = i
+            return resp
+        if n < len(order) - 1:
+            logger.warning(
+                f"HTTP SQL ({path}) failed: {resp.status_code} {resp.text[:512]}. Trying the next endpoint..."
+            )
+    return resp
 
-    # 1) /api/_sql with 'stmt'
-    url1 = f"{base_url}/api/_sql"
-    body1 = {"stmt": sql}
-    r1 = session.post(url1, json=body1, headers=headers, allow_redirects=False, timeout=timeout)
-    if r1.status_code < 400:
-        return r1
-    logger.warning(
-        f"HTTP SQL (stmt) failed: {r1.status_code} {r1.text}. Retrying with 'sql'..."
-    )
 
-    # 2) /api/sql with 'sql'
-    url2 = f"{base_url}/api/sql"
-    body2 = {"sql": sql}
-    if database:
-        body2["database"] = database
-    r2 = session.post(url2, json=body2, headers=headers, allow_redirects=False, timeout=timeout)
-    if r2.status_code < 400:
-        return r2
-    logger.error(
-        f"HTTP SQL (/api/sql) failed: {r2.status_code} {r2.text}. Retrying with /rest/v2/sql..."
-    )
+def parse_sql_result(resp: requests.Response) -> Tuple[List[str], List[list]]:
+    """Extract (column names, rows) from a Doris HTTP SQL response.
+
+    Accepts the FE query response shape
+    ``{"code": 0, "data": {"meta": [{"name": ...}], "data": [[...]]}}``.
+    Statements without a result set yield empty lists.
+    """
+    try:
+        payload = resp.json()
+    except ValueError:
+        raise RuntimeError(
+            f"HTTP SQL non-JSON response: HTTP {resp.status_code} {resp.text[:512]}"
+        )
+    if resp.status_code >= 400 or payload.get("code", 0) != 0:
+        msg = payload.get("msg") or payload.get("message") or resp.reason
+        raise RuntimeError(f"HTTP SQL failed: {msg} {payload.get('data') or ''}".rstrip())
+    data = payload.get("data") or {}
+    if not isinstance(data, dict):
+        return [], []
+    columns = [m.get("name") for m in data.get("meta") or []]
+    rows = data.get("data") or []
+    return columns, rows
+
+
+def execute_sql(
+    base_url: str,
+    user: str,
+    password: str,
+    sql: str,
+    database: Optional[str] = None,
+    timeout: int = 30,
+    session: Optional[requests.Session] = None,
+) -> Tuple[List[str], List[list]]:
+    """Run one statement over HTTP and return (column names, rows)."""
+    auth = b64encode(f"{user}:{password}".encode()).decode()
+    resp = post_sql(session or _shared_session(), base_url, f"Basic {auth}", sql, database, timeout)
+    return parse_sql_result(resp)
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _shared_session() -> requests.Session:
+    """Process-wide keep-alive session for HTTP SQL."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = new_session()
+        return _session
 
-    # 3) /rest/v2/sql
-    url3 = f"{base_url}/rest/v2/sql"
-    body3 = {"sql": sql}
-    if database:
-        body3["database"] = database
-    r3 = session.post(url3, json=body3, headers=headers, allow_redirects=False, timeout=timeout)
-    return r3
+
+def conf_base_url(doris_conf) -> str:
+    """FE HTTP base URL from a conf.ini [doris] section."""
+    return f"http://{doris_conf.get('host', 'localhost')}:{int(doris_conf.get('http_port', 8030))}"
+
+
+def execute_conf_sql(doris_conf, sql: str, timeout: int = 30) -> Tuple[List[str], List[list]]:
+    """Run one statement with the shared client of a conf.ini [doris] section."""
+    return conf_client(doris_conf).query(sql, timeout=timeout)
+
+
+def _sql_literal(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def inline_params(template: str, params: Sequence[Any]) -> str:
+    """Substitute `?` placeholders with SQL literals (for the HTTP path)."""
+    parts = template.split("?")
+    if len(parts) != len(params) + 1:
+        raise ValueError(f"Expected {len(parts) - 1} parameters, got {len(params)}")
+    out = [parts[0]]
+    for value, part in zip(params, parts[1:]):
+        out.append(_sql_literal(value))
+        out.append(part)
+    return "".join(out)
+
+
+class PoolTimeout(RuntimeError):
+    """No pooled connection freed up within the call's timeout."""
+
+
+class _PooledConnection:
+    def __init__(self, conn, max_statements: int = 32):
+        self.conn = conn
+        # Server-side prepared statements of this connection, by SQL template, least recently used first
+        self.statements: "OrderedDict[str, Any]" = OrderedDict()
+        self.max_statements = max_statements
+        self.last_used = time.monotonic()
+
+    def statement(self, template: str):
+        """The prepared cursor for `template`, closing the least recently used beyond max_statements."""
+        cur = self.statements.get(template)
+        if cur is not None:
+            self.statements.move_to_end(template)
+            return cur
+        cur = self.statements[template] = self.conn.cursor(prepared=True)
+        while len(self.statements) > self.max_statements:
+            _, evicted = self.statements.popitem(last=False)
+            try:
+                # Deallocates the statement on the FE
+                evicted.close()
+            except Exception:
+                pass
+        return cur
+
+    def set_timeout(self, timeout: Optional[float]) -> None:
+        if timeout is None:
+            return
+        seconds = max(1, math.ceil(timeout))
+        # Per-read/per-write socket timeouts (mysql-connector-python 9.2+)
+        self.conn.read_timeout = seconds
+        self.conn.write_timeout = seconds
+
+    def close(self) -> None:
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class MySQLPool:
+    """
+    Bounded LIFO pool of mysql.connector connections to one FE. Connections
+    keep up to `max_statements` prepared statements while they live; one
+    that fails is dropped, and one idle for longer than `ping_after` is
+    pinged first. Waiting for a free connection is bounded by the call's
+    timeout (PoolTimeout).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        database: Optional[str] = None,
+        size: int = 4,
+        ping_after: float = 60.0,
+        connect_timeout: int = 10,
+        max_statements: int = 32,
+    ):
+        self.params = dict(
+            host=host, port=port, user=user, password=password,
+            autocommit=True, connection_timeout=connect_timeout,
+        )
+        if database:
+            self.params["database"] = database
+        self.ping_after = ping_after
+        self.max_statements = max_statements
+        self._idle: "queue.LifoQueue[_PooledConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> _PooledConnection:
+        import mysql.connector  # type: ignore
+        return _PooledConnection(mysql.connector.connect(**self.params), self.max_statements)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[_PooledConnection]:
+        """A connection whose reads and writes time out after `timeout` seconds (None waits forever)."""
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout(
+                f"No free connection to {self.params['host']}:{self.params['port']} within {timeout}s"
+            )
+        try:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                entry = self._connect()
+            else:
+                if time.monotonic() - entry.last_used > self.ping_after:
+                    try:
+                        entry.conn.ping(reconnect=False)
+                    except Exception:
+                        entry.close()
+                        entry = self._connect()
+            try:
+                entry.set_timeout(timeout)
+                yield entry
+            except BaseException:
+                entry.close()
+                raise
+            entry.last_used = time.monotonic()
+            self._idle.put(entry)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class DorisSQL:
+    """
+    SQL against one Doris FE, over pooled MySQL-protocol connections
+    (`protocol="mysql"`) or the FE HTTP SQL endpoint (`protocol="http"`).
+
+    - query(): one statement, returns (columns, rows)
+    - execute(): statements in order, results discarded
+    - query_prepared(): a `?` template run as a server-side prepared
+      statement, prepared once per pooled connection, which keeps the most
+      recently used ones (MySQL only; the HTTP path inlines the parameters)
+    - iter_rows(): rows as dicts, fetched `batch_size` at a time, for exports
+      (over HTTP the whole result is still read at once)
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        query_port: int = 9030,
+        http_port: int = 8030,
+        user: str = "root",
+        password: str = "",
+        database: Optional[str] = None,
+        protocol: str = "mysql",
+        pool_size: int = 4,
+        prepared: bool = True,
+        https: bool = False,
+    ):
+        if protocol not in ("mysql", "http"):
+            raise ValueError(f"Unsupported SQL protocol: {protocol}")
+        self.protocol = protocol
+        self.database = database
+        self.user = user
+        self.password = password
+        self.base_url = f"{'https' if https else 'http'}://{host}:{http_port}"
+        self.prepared = prepared
+        self.pool = MySQLPool(host, query_port, user, password, database, pool_size) if protocol == "mysql" else None
+
+    def query(self, sql: str, params: Optional[Sequence[Any]] = None, timeout: int = 30) -> Tuple[List[str], List[list]]:
+        if self.pool is None:
+            sql = inline_params(sql, params) if params else sql
+            return execute_sql(self.base_url, self.user, self.password, sql, self.database, timeout)
+        with self.pool.connection(timeout) as entry:
+            cur = entry.conn.cursor()
+            try:
+                cur.execute(sql, tuple(params) if params else None)
+                columns = [d[0] for d in (cur.description or [])]
+                rows = [list(r) for r in cur.fetchall()] if cur.description else []
+            finally:
+                cur.close()
+        return columns, rows
+
+    def execute(self, statements: Sequence[str], timeout: int = 30) -> None:
+        if self.pool is None:
+            for sql in statements:
+                self.query(sql, timeout=timeout)
+            return
+        with self.pool.connection(timeout) as entry:
+            cur = entry.conn.cursor()
+            try:
+                for sql in statements:
+                    cur.execute(sql)
+                    if cur.description:
+                        cur.fetchall()
+            finally:
+                cur.close()
+
+    def query_prepared(self, template: str, params: Sequence[Any], timeout: int = 30) -> Tuple[List[str], List[list]]:
+        if self.pool is None or not self.prepared:
+            return self.query(inline_params(template, params), timeout=timeout)
+        from mysql.connector import errors  # type: ignore
+
+        try:
+            with self.pool.connection(timeout) as entry:
+                cur = entry.statement(template)
+                cur.execute(template, tuple(params))
+                columns = [d[0] for d in (cur.description or [])]
+                rows = [list(r) for r in cur.fetchall()] if cur.description else []
+            return columns, rows
+        except (errors.ProgrammingError, errors.NotSupportedError) as e:
+            prepared_error = e
+        # The failed connection was dropped; retry as plain text. Timeouts and
+        # transport errors are raised as they are: rerunning would double the wait.
+        result = self.query(inline_params(template, params), timeout=timeout)
+        # The text query worked, so the FE rejected the PREPARE itself
+        logger.warning(f"Prepared statement rejected ({prepared_error}); inlining parameters from now on")
+        self.prepared = False
+        return result
+
+    def iter_rows(self, sql: str, batch_size: int = 1000, timeout: int = 300) -> Iterator[Dict[str, Any]]:
+        if self.pool is None:
+            columns, rows = self.query(sql, timeout=timeout)
+            for row in rows:
+                yield dict(zip(columns, row))
+            return
+        with self.pool.connection(timeout) as entry:
+            cur = entry.conn.cursor(buffered=False)
+            try:
+                cur.execute(sql)
+                columns = [d[0] for d in (cur.description or [])]
+                while True:
+                    batch = cur.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    for row in batch:
+                        yield dict(zip(columns, row))
+            finally:
+                cur.close()
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+
+
+_clients: Dict[tuple, DorisSQL] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(**kwargs: Any) -> DorisSQL:
+    """Process-wide DorisSQL for these connection settings (see DorisSQL)."""
+    key = tuple(sorted(kwargs.items()))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = DorisSQL(**kwargs)
+        return client
+
+
+def conf_client(doris_conf):
+    """
+    Shared client for a conf.ini [doris] section: a fe_balancer.BalancedSQL
+    over the FEs listed in `host`. `query_protocol = http` uses the FE HTTP
+    endpoint; anything else the pooled MySQL protocol.
+    """
+    from fe_balancer import BalancedSQL, conf_pool
+
+    protocol = "http" if doris_conf.get('query_protocol', 'mysql').lower() == 'http' else "mysql"
+    return BalancedSQL(
+        conf_pool(doris_conf),
+        user=doris_conf.get('user', 'root'),
+        password=doris_conf.get('password', ''),
+        database=doris_conf.get('db_name'),
+        protocol=protocol,
+        pool_size=int(doris_conf.get('pool_size', 4)),
+        prepared=doris_conf.getboolean('prepared_statements', True),
+    )
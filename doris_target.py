@@ -26,14 +26,18 @@ Usage:
     )
 """
 
+import atexit
 import dataclasses
+import heapq
 import json
+import threading
 import time
 import logging
 import os
 import requests
 from requests.auth import HTTPBasicAuth
 import uuid
+import weakref
 from typing import cast
 
 # Optional NumPy support for serialization
@@ -44,9 +48,19 @@ except Exception:  # numpy not required
 from typing import Any
 from base64 import b64encode
 from doris_http import (
+    DorisSQL,
+    StreamLoadTransport,
+    discover_backends,
+    get_client,
+    inline_params,
+    new_session,
     sanitize_headers_for_log,
-    put_with_manual_redirect,
 )
+from fe_balancer import BalancedSQL, FrontendPool, get_pool
+import dedup
+import index_meta
+import load_checkpoint
+import metrics
 
 import cocoindex
 
@@ -59,6 +73,32 @@ if not logger.handlers:
 # Allow environment to control log level; default INFO
 _lvl = os.getenv("DORIS_LOG_LEVEL", "INFO").upper()
 logger.setLevel(getattr(logging, _lvl, logging.INFO))
+# Optionally expose Stream Load metrics from the indexer process
+_metrics_port = os.getenv("DORIS_METRICS_PORT")
+if _metrics_port:
+    metrics.start_metrics_server(int(_metrics_port))
+
+STREAM_LOAD_ROWS = metrics.REGISTRY.counter(
+    "doris_stream_load_rows_total", "Rows loaded via Stream Load.", ("table", "kind")
+)
+STREAM_LOAD_FILTERED_ROWS = metrics.REGISTRY.counter(
+    "doris_stream_load_filtered_rows_total", "Rows filtered by Doris during Stream Load.", ("table", "kind")
+)
+STREAM_LOAD_BYTES = metrics.REGISTRY.counter(
+    "doris_stream_load_bytes_total", "Request body bytes sent via Stream Load.", ("table", "kind")
+)
+STREAM_LOAD_SECONDS = metrics.REGISTRY.histogram(
+    "doris_stream_load_duration_seconds", "Stream Load request latency including redirects.", ("table", "kind")
+)
+STREAM_LOAD_RETRIES = metrics.REGISTRY.counter(
+    "doris_stream_load_retries_total", "Stream Load attempts retried after transport errors.", ("table", "kind")
+)
+STREAM_LOAD_FAILURES = metrics.REGISTRY.counter(
+    "doris_stream_load_failures_total", "Stream Load batches that failed permanently.", ("table", "kind")
+)
+STREAM_LOAD_SKIPPED_ROWS = metrics.REGISTRY.counter(
+    "doris_stream_load_skipped_rows_total", "Rows not reloaded because a checkpoint shows them committed.", ("table",)
+)
 
 
 # =============================================================================
@@ -82,6 +122,64 @@ class DorisTarget(cocoindex.op.TargetSpec):
         auto_create_table: Automatically create table if not exists (default: True)
         vector_dimension: Dimension for vector fields, if any (default: None)
         replication_num: Replication number for auto-created tables (default: 1)
+        max_retries: Retries per batch on transport errors, reusing the label (default: 2)
+        retry_backoff: Base backoff in seconds between retries, doubled each time (default: 1.0)
+        log_sample_every: Log every Nth batch at INFO; others only at DEBUG (default: 50)
+        summary_path: Also write the end-of-run load summary as JSON here (default: None)
+        publish_generation: Bump the index generation in meta_table after each load (default: True)
+        meta_table: Index metadata table in the same database (default: "rag_index_meta")
+        load_mode: "incremental" writes into the table in place; "rebuild" loads a fresh
+            `<table>__staging` table without indexes, builds the indexes once and swaps it
+            in when the run ends; "versioned" loads each run into a new `<table>_v<N>` the
+            same way and then moves the "current" pointer in meta_table to it
+            (default: "incremental")
+        index_build_timeout: Seconds to wait for BUILD INDEX in rebuild/versioned mode (default: 3600)
+        rebuild_min_ratio: In rebuild/versioned mode, keep the live table if the new table has fewer
+            rows than this fraction of it, e.g. after an interrupted run (default: 0.5)
+        keep_versions: Versioned mode: newest versions never garbage-collected (default: 2)
+        version_grace_seconds: Versioned mode: drop older versions this long after they
+            stopped being current (default: 3600)
+        partition_column: Auto-created tables are LIST partitioned by this row field,
+            so filtered searches only scan matching partitions (default: None)
+        http_pool_maxsize: Keep-alive connections kept per FE/BE host (default: 10)
+        http_pool_hosts: Hosts whose connection pools are kept at once (default: 10)
+        redirect_probe: Resolve the FE redirect with a bodiless request so batches are
+            uploaded once, to the BE (default: True)
+        direct_backends: Load straight to the alive BEs, round-robin, discovered via the
+            FE /api/backends endpoint or SHOW BACKENDS (default: False)
+        backend_nodes: Explicit BE HTTP addresses ("host:port") for direct loads;
+            implies direct_backends (default: None)
+        group_commit: Incremental mode: Doris group commit mode ("async_mode" or
+            "sync_mode", Doris 2.1+). Loads carry no label, so Doris cannot tell a resent
+            batch from a new one, and the auto-created DUPLICATE KEY table would keep both
+            copies. A batch whose request failed is therefore not retried (max_retries is
+            ignored); the error goes to cocoindex, and if the batch had committed, a later
+            retry of the mutation duplicates its rows (default: None)
+        coalesce_rows: Incremental mode: buffer upserts across mutate calls and send
+            them once this many rows are waiting; 0 disables buffering (default: 0)
+        coalesce_seconds: Flush buffered upserts at the latest this long after the
+            first one arrived. Rows still buffered when the process dies are not
+            loaded until their source changes again (default: 1.0)
+        fe_hosts: Further FEs ("host", "host:http_port" or "host:http_port:query_port")
+            that Stream Load and DDL balance across and fail over to; fe_host stays the
+            target's identity (default: None)
+        dedup: Keep one row per group of duplicate rows, by their dedup_field: "exact"
+            (equal content digests) or "near" (SimHashes within dedup_distance bits). The
+            other rows go to `<table>__dups`, linked to their canonical row's key; when a
+            canonical row is deleted, one of its duplicates takes its place with the same
+            vector. Needs a single key field (default: None)
+        dedup_distance: Near mode: largest Hamming distance between duplicates (default: 3)
+        dedup_field: Row field holding the fingerprint (see dedup.fingerprint)
+            (default: "fingerprint")
+        sql_protocol: How DDL and maintenance SQL reach the FE: "mysql" (query_port)
+            or "http" (the FE HTTP SQL endpoint, e.g. for fake_doris) (default: "mysql")
+        checkpoint_dir: Record committed loads in a local checkpoint here, so a failed run
+            is resumed by the next one: it reuses the staging/version table and skips rows
+            already loaded (see load_checkpoint.py) (default: None)
+        expected_rows: Rows the run is expected to load, for progress and ETA; in
+            rebuild/versioned mode the live table's row count is used when unset (default: None)
+        progress_seconds: Log load progress (rows, throughput, ETA) at most this often;
+            0 disables it (default: 30)
     """
     fe_host: str
     database: str
@@ -97,6 +195,62 @@ class DorisTarget(cocoindex.op.TargetSpec):
     replication_num: int = 1
     # MySQL query port for executing DDL (default Doris: 9030)
     query_port: int = 9030
+    max_retries: int = 2
+    retry_backoff: float = 1.0
+    log_sample_every: int = 50
+    summary_path: str | None = None
+    publish_generation: bool = True
+    meta_table: str = index_meta.META_TABLE
+    load_mode: str = "incremental"
+    index_build_timeout: int = 3600
+    rebuild_min_ratio: float = 0.5
+    keep_versions: int = 2
+    version_grace_seconds: int = 3600
+    partition_column: str | None = None
+    http_pool_maxsize: int = 10
+    http_pool_hosts: int = 10
+    redirect_probe: bool = True
+    direct_backends: bool = False
+    backend_nodes: list[str] | None = None
+    group_commit: str | None = None
+    coalesce_rows: int = 0
+    coalesce_seconds: float = 1.0
+    fe_hosts: list[str] | None = None
+    dedup: str | None = None
+    dedup_distance: int = 3
+    dedup_field: str = "fingerprint"
+    sql_protocol: str = "mysql"
+    checkpoint_dir: str | None = None
+    expected_rows: int | None = None
+    progress_seconds: float = 30.0
+
+
+@dataclasses.dataclass
+class DorisSetupState:
+    """
+    Setup state tracked by cocoindex: what apply_setup_change needs to reach
+    the table, plus the schema derived from the flow's declared field types.
+    Older states (a plain DorisTarget) load with an empty schema.
+    """
+    fe_host: str
+    database: str
+    table: str
+    fe_http_port: int = 8030
+    query_port: int = 9030
+    username: str = "root"
+    password: str = ""
+    enable_https: bool = False
+    auto_create_table: bool = True
+    replication_num: int = 1
+    load_mode: str = "incremental"
+    partition_column: str | None = None
+    fe_hosts: list[str] = dataclasses.field(default_factory=list)
+    sql_protocol: str = "mysql"
+    key_fields: list[str] = dataclasses.field(default_factory=list)
+    # Column name -> Doris type, key fields first
+    columns: dict[str, str] = dataclasses.field(default_factory=dict)
+    # Vector column -> dimension (0 when the flow does not declare one)
+    vector_fields: dict[str, int] = dataclasses.field(default_factory=dict)
 
 
 # =============================================================================
@@ -110,17 +264,232 @@ class DorisTarget(cocoindex.op.TargetSpec):
 # Prepared Target (for connection reuse)
 # =============================================================================
 
+@dataclasses.dataclass
+class LoadStats:
+    """Counters aggregated over all Stream Loads of one run."""
+    started_at: float = dataclasses.field(default_factory=time.time)
+    batches: int = 0
+    rows_loaded: int = 0
+    rows_filtered: int = 0
+    bytes_sent: int = 0
+    upsert_rows: int = 0
+    delete_rows: int = 0
+    retries: int = 0
+    failures: int = 0
+    load_seconds: float = 0.0
+    # Rows a checkpoint showed as already committed (not sent again)
+    rows_skipped: int = 0
+    # Rows the run should load in total, if known, for the ETA
+    expected_rows: int | None = None
+    last_progress: float = dataclasses.field(default_factory=time.time)
+    # Min-heap of (seconds, label, rows) holding the slowest batches
+    slowest: list = dataclasses.field(default_factory=list)
+    max_slowest: int = 5
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock, repr=False)
+
+    def record_batch(
+        self, kind: str, label: str, rows: int, loaded: int, filtered: int, nbytes: int, seconds: float
+    ) -> int:
+        """Record a committed batch; returns the run-wide batch number."""
+        with self.lock:
+            self.batches += 1
+            self.rows_loaded += loaded
+            self.rows_filtered += filtered
+            self.bytes_sent += nbytes
+            self.load_seconds += seconds
+            if kind == "delete":
+                self.delete_rows += rows
+            else:
+                self.upsert_rows += rows
+            entry = (seconds, label, rows)
+            if len(self.slowest) < self.max_slowest:
+                heapq.heappush(self.slowest, entry)
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+            return self.batches
+
+    def record_skipped(self, rows: int) -> None:
+        with self.lock:
+            self.rows_skipped += rows
+
+    def record_retry(self) -> None:
+        with self.lock:
+            self.retries += 1
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+
+    def summary(self) -> dict[str, Any]:
+        with self.lock:
+            wall = max(time.time() - self.started_at, 1e-9)
+            return {
+                "batches": self.batches,
+                "rows_loaded": self.rows_loaded,
+                "rows_filtered": self.rows_filtered,
+                "upsert_rows": self.upsert_rows,
+                "delete_rows": self.delete_rows,
+                "bytes_sent": self.bytes_sent,
+                "retries": self.retries,
+                "failures": self.failures,
+                "wall_seconds": round(wall, 3),
+                "load_seconds": round(self.load_seconds, 3),
+                "rows_skipped": self.rows_skipped,
+                "rows_per_second": round(self.rows_loaded / wall, 1),
+                "mb_per_second": round(self.bytes_sent / wall / 1e6, 3),
+                "slowest_batches": [
+                    {"label": label, "rows": rows, "seconds": round(sec, 3)}
+                    for sec, label, rows in sorted(self.slowest, reverse=True)
+                ],
+            }
+
+    def progress(self, every: float) -> dict[str, Any] | None:
+        """Rows done, throughput and ETA, at most once per `every` seconds (else None)."""
+        now = time.time()
+        with self.lock:
+            if every <= 0 or now - self.last_progress < every:
+                return None
+            self.last_progress = now
+            wall = max(now - self.started_at, 1e-9)
+            rate = self.upsert_rows / wall
+            done = self.upsert_rows + self.rows_skipped
+            eta = None
+            if self.expected_rows and rate > 0:
+                eta = max(0.0, (self.expected_rows - done) / rate)
+            return {
+                "rows_done": done,
+                "expected_rows": self.expected_rows,
+                "rows_skipped": self.rows_skipped,
+                "rows_per_second": round(rate, 1),
+                "mb_per_second": round(self.bytes_sent / wall / 1e6, 3),
+                "eta_seconds": None if eta is None else round(eta),
+            }
+
+
 @dataclasses.dataclass
 class PreparedDorisTarget:
     """Prepared Doris target with HTTP session for connection reuse."""
     spec: DorisTarget
     session: requests.Session
+    transport: StreamLoadTransport
     base_url: str
     auth_header: str
-    
+    stats: LoadStats = dataclasses.field(default_factory=LoadStats)
+    table_ensured: bool = False
+    meta_ensured: bool = False
+    # Table Stream Loads write to: the target table, or its staging table in rebuild mode
+    load_table: str = ""
+    table_schema: dict[str, str] | None = None
+    vector_fields: dict[str, int] | None = None
+    # Schema declared by the flow (see DorisSetupState); empty for legacy setup states
+    setup_state: DorisSetupState | None = None
+    aborted: bool = False
+    finalized: bool = False
+    # Upserts waiting to be coalesced into one load (spec.coalesce_rows)
+    buffer: list[dict] = dataclasses.field(default_factory=list)
+    buffer_since: float | None = None
+    buffer_lock: threading.RLock = dataclasses.field(default_factory=threading.RLock)
+    flush_timer: threading.Timer | None = None
+    flush_error: Exception | None = None
+    # spec.dedup: canonical rows by fingerprint, and duplicate key <-> canonical key links
+    dedup_index: dedup.SimHashIndex | None = None
+    alias_of: dict[str, str] = dataclasses.field(default_factory=dict)
+    aliases: dict[str, set[str]] = dataclasses.field(default_factory=dict)
+    dedup_lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+    # spec.checkpoint_dir: committed loads of this run; resumed when an unfinished run was found
+    checkpoint: load_checkpoint.LoadCheckpoint | None = None
+    resumed: bool = False
+    _summarized_batches: int = 0
+
+    def log_summary(self) -> None:
+        """Log (and optionally write) the load summary if anything new was loaded."""
+        summary = self.stats.summary()
+        if summary["batches"] + summary["failures"] <= self._summarized_batches:
+            return
+        self._summarized_batches = summary["batches"] + summary["failures"]
+        logger.info(
+            "Doris load summary %s.%s: batches=%d rows=%d filtered=%d skipped=%d bytes=%d retries=%d "
+            "failures=%d wall=%.1fs rows/s=%.1f MB/s=%.3f slowest=%s",
+            self.spec.database, self.spec.table,
+            summary["batches"], summary["rows_loaded"], summary["rows_filtered"], summary["rows_skipped"],
+            summary["bytes_sent"], summary["retries"], summary["failures"],
+            summary["wall_seconds"], summary["rows_per_second"], summary["mb_per_second"],
+            summary["slowest_batches"],
+        )
+        if self.spec.summary_path:
+            try:
+                with open(self.spec.summary_path, "w", encoding="utf-8") as f:
+                    json.dump(
+                        {"table": f"{self.spec.database}.{self.spec.table}", **summary}, f, indent=2
+                    )
+            except OSError as e:
+                logger.warning("Could not write load summary to %s: %s", self.spec.summary_path, e)
+
     def close(self):
-        """Close the HTTP session."""
-        self.session.close()
+        """
+        Flush buffered rows, finish a rebuild, log the load summary and close the HTTP session.
+
+        Each step runs even if an earlier one failed. On a failure the target
+        stays registered (and its session open), so the exit handler retries
+        the steps, and RuntimeError is raised.
+        """
+        failed = _run_close_steps(self)
+        if failed:
+            raise RuntimeError(
+                f"Closing Doris target {self.spec.database}.{self.spec.table} failed in {', '.join(failed)}"
+            )
+        with _open_targets_lock:
+            _open_targets.pop(id(self), None)
+        self.transport.close()
+
+
+def _run_close_steps(prepared: PreparedDorisTarget) -> list[str]:
+    """
+    Run the close steps each on its own, so a failed flush or swap still
+    settles the checkpoint and logs the summary. Returns the failed steps.
+    """
+    failed = []
+    for step in (_flush_buffer, _finalize_rebuild, _finish_checkpoint, PreparedDorisTarget.log_summary):
+        try:
+            step(prepared)
+        except Exception:
+            failed.append(step.__name__)
+            logger.exception("%s of Doris target %s.%s failed",
+                             step.__name__, prepared.spec.database, prepared.spec.table)
+    return failed
+
+
+# Prepared targets not closed yet, by id. Those with work that must run at exit
+# (a rebuild to swap in, coalesced rows, a checkpoint to settle) are held
+# strongly; the others only weakly, for their summary, so they can be freed.
+_open_targets: dict[int, Any] = {}
+_open_targets_lock = threading.Lock()
+
+
+def _register_open_target(prepared: PreparedDorisTarget) -> None:
+    spec = prepared.spec
+    key = id(prepared)
+    if prepared.load_table != spec.table or spec.coalesce_rows > 0 or prepared.checkpoint is not None:
+        entry: Any = prepared
+    else:
+        # No lock in the callback: it runs from garbage collection, possibly while the lock is held
+        entry = weakref.ref(prepared, lambda _: _open_targets.pop(key, None))
+    with _open_targets_lock:
+        _open_targets[key] = entry
+
+
+@atexit.register
+def _close_open_targets() -> None:
+    with _open_targets_lock:
+        entries = list(_open_targets.values())
+    for entry in entries:
+        prepared = entry() if isinstance(entry, weakref.ref) else entry
+        if prepared is None:
+            continue
+        try:
+            prepared.close()
+        except RuntimeError:
+            pass  # Each failed step is already logged
 
 
 # =============================================================================
@@ -158,6 +527,75 @@ def _get_doris_type(python_type: type, vector_dim: int | None = None) -> str:
     return type_mapping.get(type_name, 'VARCHAR(65533)')
 
 
+_BASIC_KIND_TO_DORIS = {
+    "Str": "TEXT",
+    "Bytes": "TEXT",
+    "Bool": "BOOLEAN",
+    "Int64": "BIGINT",
+    "Float32": "FLOAT",
+    "Float64": "DOUBLE",
+    "Uuid": "VARCHAR(36)",
+    "Date": "DATE",
+    "Time": "VARCHAR(32)",
+    "LocalDateTime": "DATETIME(6)",
+    "OffsetDateTime": "DATETIME(6)",
+    "Range": "ARRAY<BIGINT>",
+    "Json": "JSON",
+}
+
+
+def _doris_type_for_field(value_type: Any, is_key: bool = False) -> tuple[str, int | None]:
+    """
+    Map a cocoindex field type (EnrichedValueType) to a Doris column type.
+    Returns (type, vector dimension); the dimension is None for non-vectors
+    and 0 for vectors of undeclared dimension.
+    """
+    basic = value_type.type
+    kind = getattr(basic, "kind", None)
+    if kind == "Vector" and basic.vector is not None:
+        elem_kind = getattr(basic.vector.element_type, "kind", None)
+        if elem_kind in ("Float32", "Float64", "Int64"):
+            return "ARRAY<FLOAT>", basic.vector.dimension or 0
+        return "JSON", None
+    doris_type = _BASIC_KIND_TO_DORIS.get(kind, "JSON")
+    if is_key and doris_type == "TEXT":
+        # Key columns cannot be TEXT/STRING in Doris
+        doris_type = "VARCHAR(1024)"
+    return doris_type, None
+
+
+def setup_state_for(spec: DorisTarget, key_fields_schema: list, value_fields_schema: list) -> DorisSetupState:
+    """Build the setup state, deriving the table schema from the declared fields."""
+    columns: dict[str, str] = {}
+    vector_fields: dict[str, int] = {}
+    for field in key_fields_schema:
+        columns[field.name], _ = _doris_type_for_field(field.value_type, is_key=True)
+    for field in value_fields_schema:
+        doris_type, dim = _doris_type_for_field(field.value_type)
+        columns[field.name] = doris_type
+        if dim is not None:
+            vector_fields[field.name] = dim or (spec.vector_dimension or 0)
+    return DorisSetupState(
+        fe_host=spec.fe_host,
+        database=spec.database,
+        table=spec.table,
+        fe_http_port=spec.fe_http_port,
+        query_port=spec.query_port,
+        username=spec.username,
+        password=spec.password,
+        enable_https=spec.enable_https,
+        auto_create_table=spec.auto_create_table,
+        replication_num=spec.replication_num,
+        load_mode=spec.load_mode,
+        partition_column=spec.partition_column,
+        fe_hosts=list(spec.fe_hosts or []),
+        sql_protocol=spec.sql_protocol,
+        key_fields=[f.name for f in key_fields_schema],
+        columns=columns,
+        vector_fields=vector_fields,
+    )
+
+
 def _serialize_value(value: Any) -> Any:
     """Serialize a Python value for JSON/Doris."""
     if value is None:
@@ -189,11 +627,6 @@ def _serialize_value(value: Any) -> Any:
     return value
 
 
-def _build_stream_load_url(base_url: str, database: str, table: str) -> str:
-    """Build the Stream Load URL."""
-    return f"{base_url}/api/{database}/{table}/_stream_load"
-
-
 def _infer_doris_type_from_value(value: Any) -> str:
     """Infer a Doris column type from a Python value."""
     if value is None:
@@ -297,48 +730,645 @@ def _guess_vector_fields(rows: list[dict]) -> dict[str, int]:
 
 def _ensure_table_exists(prepared: PreparedDorisTarget, sample_rows: list[dict]) -> None:
     spec = prepared.spec
-    if not spec.auto_create_table or not sample_rows:
+    rebuild = prepared.load_table != spec.table
+    if not (spec.auto_create_table or rebuild) or not sample_rows:
         return
-    schema = _infer_schema_from_rows(sample_rows)
-    pks = _guess_primary_keys(sample_rows)
-    vectors = _guess_vector_fields(sample_rows)
+    state = prepared.setup_state
+    if state is not None and state.columns:
+        schema = dict(state.columns)
+        pks = list(state.key_fields)
+        # Dimensions the flow did not declare come from the first row
+        vectors = {
+            col: dim or len(sample_rows[0].get(col) or [])
+            for col, dim in state.vector_fields.items()
+        }
+    else:
+        schema = _infer_schema_from_rows(sample_rows)
+        pks = _guess_primary_keys(sample_rows)
+        vectors = _guess_vector_fields(sample_rows)
+    # Staging tables are loaded without indexes; they are built once after the load
     ddl = create_doris_table_ddl(
         database=spec.database,
-        table=spec.table,
+        table=prepared.load_table,
         schema=schema,
         primary_keys=pks,
         vector_fields=vectors if vectors else None,
         replication_num=spec.replication_num,
+        include_indexes=not rebuild,
+        partition_column=spec.partition_column,
+    )
+    prepared.table_schema = schema
+    prepared.vector_fields = vectors or None
+    logger.info("Ensuring table exists with DDL:\n%s", ddl)
+    # Execute DDL statements sequentially to avoid multi=True generator issues
+    statements = [f"CREATE DATABASE IF NOT EXISTS `{spec.database}`"]
+    if rebuild and not prepared.resumed:
+        # Leftovers of an earlier, unfinished rebuild
+        statements.append(f"DROP TABLE IF EXISTS `{spec.database}`.`{prepared.load_table}`")
+    statements += [s.strip() for s in ddl.split(';') if s.strip()]
+    _execute_mysql(spec, statements)
+    logger.info("Table ensured via MySQL connector")
+
+
+def _create_table_from_state(state: DorisSetupState) -> None:
+    """Create the table from the declared schema (runs during `cocoindex setup`)."""
+    ddl = create_doris_table_ddl(
+        database=state.database,
+        table=state.table,
+        schema=dict(state.columns),
+        primary_keys=list(state.key_fields),
+        vector_fields=dict(state.vector_fields) or None,
+        replication_num=state.replication_num,
+        partition_column=state.partition_column,
+    )
+    logger.info("Creating table from declared schema:\n%s", ddl)
+    statements = [f"CREATE DATABASE IF NOT EXISTS `{state.database}`"]
+    statements += [s.strip() for s in ddl.split(';') if s.strip()]
+    _execute_mysql(state, statements)
+
+
+def _fe_pool(spec: DorisTarget | DorisSetupState) -> FrontendPool | None:
+    """FrontendPool over fe_host and fe_hosts, or None with a single FE."""
+    if not spec.fe_hosts:
+        return None
+    return get_pool(
+        [f"{spec.fe_host}:{spec.fe_http_port}:{spec.query_port}", *spec.fe_hosts],
+        spec.fe_http_port,
+        spec.query_port,
+        https=spec.enable_https,
     )
-    logger.info(f"Ensuring table exists with DDL:\n{ddl}")
-    # Use MySQL connector only; fail fast on errors
-    import mysql.connector  # type: ignore
-    conn = mysql.connector.connect(
+
+
+def _sql_client(spec: DorisTarget | DorisSetupState) -> DorisSQL | BalancedSQL:
+    """SQL client (pooled MySQL protocol by default) for the target's FE(s), shared by DDL and maintenance."""
+    pool = _fe_pool(spec)
+    if pool is not None:
+        return BalancedSQL(pool, user=spec.username, password=spec.password, protocol=spec.sql_protocol)
+    return get_client(
         host=spec.fe_host,
-        port=spec.query_port,
+        query_port=spec.query_port,
+        http_port=spec.fe_http_port,
         user=spec.username,
         password=spec.password,
+        protocol=spec.sql_protocol,
     )
-    cur = conn.cursor()
-    cur.execute(f"CREATE DATABASE IF NOT EXISTS `{spec.database}`;")
-    # Execute DDL statements sequentially to avoid multi=True generator issues
-    statements = [s.strip() for s in ddl.split(';') if s.strip()]
-    for stmt in statements:
-        cur.execute(stmt)
-    conn.commit()
-    cur.close()
-    conn.close()
-    logger.info("Table ensured via MySQL connector")
+
+
+def _execute_mysql(spec: DorisTarget | DorisSetupState, statements: list[str]) -> None:
+    """Run statements over the FE MySQL port; fail fast on errors."""
+    _sql_client(spec).execute(statements)
+
+
+def _query_mysql(spec: DorisTarget, sql: str) -> tuple[list[str], list[list]]:
+    """Run one query over the FE MySQL port; returns (columns, rows)."""
+    return _sql_client(spec).query(sql)
+
+
+def staging_table_name(table: str) -> str:
+    return f"{table}__staging"
+
+
+def _table_exists(spec: DorisTarget, table: str) -> bool:
+    _, rows = _query_mysql(spec, f"SHOW TABLES FROM `{spec.database}` LIKE '{table}'")
+    return bool(rows)
+
+
+def _table_row_count(spec: DorisTarget, table: str) -> int | None:
+    """Row count of a table, or None if it does not exist."""
+    if not _table_exists(spec, table):
+        return None
+    _, rows = _query_mysql(spec, f"SELECT COUNT(*) FROM `{spec.database}`.`{table}`")
+    return int(rows[0][0])
+
+
+def _wait_for_index_build(spec: DorisTarget, table: str) -> None:
+    """Poll SHOW BUILD INDEX until every build job on the table has finished."""
+    deadline = time.monotonic() + spec.index_build_timeout
+    sql = f"SHOW BUILD INDEX FROM `{spec.database}` WHERE TableName = '{table}'"
+    while True:
+        columns, rows = _query_mysql(spec, sql)
+        states = [dict(zip(columns, r)).get("State") for r in rows]
+        failed = [s for s in states if s == "CANCELLED"]
+        if failed:
+            raise RuntimeError(f"BUILD INDEX on {spec.database}.{table} was cancelled")
+        if all(s == "FINISHED" for s in states):
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(
+                f"BUILD INDEX on {spec.database}.{table} not finished after {spec.index_build_timeout}s"
+            )
+        time.sleep(2.0)
+
+
+def _finalize_rebuild(prepared: PreparedDorisTarget) -> None:
+    """
+    Build indexes on the staging (or new version) table and atomically make
+    it live: REPLACE the table in rebuild mode, move the "current" pointer in
+    versioned mode. Skipped, leaving the live table untouched, when the run
+    failed or loaded suspiciously few rows; the new table is kept for inspection.
+    """
+    spec = prepared.spec
+    staging = prepared.load_table
+    if staging == spec.table or prepared.finalized or not prepared.table_ensured:
+        return
+    prepared.finalized = True
+    db = spec.database
+    versioned = spec.load_mode == "versioned"
+    if prepared.aborted or prepared.stats.failures:
+        logger.error(
+            "Rebuild of %s.%s had failures; keeping the live table (staging table %s left in place)",
+            db, spec.table, staging,
+        )
+        return
+    try:
+        live_table = _current_version(spec) if versioned else spec.table
+        staged_rows = _table_row_count(spec, staging) or 0
+        live_rows = _table_row_count(spec, live_table) if live_table else None
+        if live_rows and staged_rows < live_rows * spec.rebuild_min_ratio:
+            logger.error(
+                "Rebuild of %s.%s loaded %d rows, fewer than %.0f%% of the live table's %d; not swapping",
+                db, spec.table, staged_rows, spec.rebuild_min_ratio * 100, live_rows,
+            )
+            return
+
+        start = time.perf_counter()
+        index_ddl = create_index_ddl(db, staging, prepared.table_schema or {}, prepared.vector_fields)
+        statements = [s.strip() for s in index_ddl.split(';') if s.strip()]
+        statements += build_index_statements(db, staging, prepared.table_schema or {}, prepared.vector_fields)
+        _execute_mysql(spec, statements)
+        _wait_for_index_build(spec, staging)
+        build_seconds = time.perf_counter() - start
+
+        if versioned:
+            swap = index_meta.switch_current_sql(db, spec.table, staging, live_table, spec.meta_table)
+        elif live_rows is None:
+            swap = [f"ALTER TABLE `{db}`.`{staging}` RENAME `{spec.table}`"]
+        else:
+            # swap=false drops the old table instead of keeping it under the staging name
+            swap = [f"ALTER TABLE `{db}`.`{spec.table}` REPLACE WITH TABLE `{staging}` PROPERTIES ('swap' = 'false')"]
+        if spec.dedup and not versioned:
+            # The duplicate links belong to the rows they were loaded with
+            live_dups, staged_dups = dups_table_name(spec.table), dups_table_name(staging)
+            swap += [
+                f"DROP TABLE IF EXISTS `{db}`.`{live_dups}`",
+                f"ALTER TABLE `{db}`.`{staged_dups}` RENAME `{live_dups}`",
+            ]
+        _execute_mysql(spec, swap)
+    except Exception as e:
+        logger.error("Rebuild of %s.%s could not be finalized: %s", db, spec.table, e)
+        return
+    logger.info(
+        "Rebuild of %s.%s swapped in from %s: rows=%d index_build=%.1fs",
+        db, spec.table, staging, staged_rows, build_seconds,
+    )
+    if prepared.checkpoint is not None:
+        prepared.checkpoint.complete()
+    if spec.publish_generation:
+        _publish_generation(prepared)
+    if versioned:
+        try:
+            _gc_versions(spec, staging)
+        except Exception as e:
+            logger.warning("Garbage collection of old %s.%s versions failed: %s", db, spec.table, e)
+
+
+def _ensure_meta_table(spec: DorisTarget) -> None:
+    _execute_mysql(spec, [
+        f"CREATE DATABASE IF NOT EXISTS `{spec.database}`",
+        index_meta.create_meta_table_ddl(spec.database, spec.meta_table, spec.replication_num),
+    ])
+
+
+def _current_version(spec: DorisTarget) -> str | None:
+    """Version table the "current" pointer names, if any."""
+    _, rows = _query_mysql(
+        spec, index_meta.select_meta_sql(spec.database, spec.table, index_meta.CURRENT_KEY, spec.meta_table)
+    )
+    return str(rows[0][0]) if rows else None
+
+
+def _version_tables(spec: DorisTarget) -> dict[int, str]:
+    """Existing version tables of the target: version number -> table name."""
+    _, rows = _query_mysql(spec, f"SHOW TABLES FROM `{spec.database}` LIKE '{spec.table}_v%'")
+    versions = {}
+    for (name,) in rows:
+        n = index_meta.parse_version(spec.table, name)
+        if n is not None:
+            versions[n] = name
+    return versions
+
+
+def _gc_versions(spec: DorisTarget, current: str) -> None:
+    """
+    Drop version tables that are not current, are not among the newest
+    keep_versions, and were retired more than version_grace_seconds ago.
+    Versions without a retired time (abandoned builds) count as retired long ago.
+    """
+    versions = _version_tables(spec)
+    keep = {versions[n] for n in sorted(versions, reverse=True)[: max(1, spec.keep_versions)]}
+    now = time.time()
+    for n, name in sorted(versions.items()):
+        if name == current or name in keep:
+            continue
+        _, rows = _query_mysql(spec, index_meta.select_meta_sql(
+            spec.database, spec.table, index_meta.RETIRED_PREFIX + name, spec.meta_table,
+        ))
+        retired_at = float(rows[0][0]) if rows else 0.0
+        if now - retired_at < spec.version_grace_seconds:
+            continue
+        logger.info("Dropping old version %s.%s", spec.database, name)
+        _execute_mysql(spec, [
+            f"DROP TABLE IF EXISTS `{spec.database}`.`{name}`",
+            f"DROP TABLE IF EXISTS `{spec.database}`.`{dups_table_name(name)}`",
+        ])
+
+
+def _publish_generation(prepared: PreparedDorisTarget) -> None:
+    """
+    Bump the table's index generation in the meta table so query-side caches
+    drop results computed before this load. Failures are logged, not raised:
+    the data is already loaded and caches still expire by LRU.
+    """
+    spec = prepared.spec
+    statements = []
+    if not prepared.meta_ensured:
+        statements.append(index_meta.create_meta_table_ddl(spec.database, spec.meta_table, spec.replication_num))
+    generation = index_meta.new_generation()
+    statements.append(index_meta.upsert_meta_sql(
+        spec.database, spec.table, index_meta.GENERATION_KEY, generation, spec.meta_table,
+    ))
+    try:
+        _execute_mysql(spec, statements)
+    except Exception as e:
+        logger.warning("Could not publish index generation for %s.%s: %s", spec.database, spec.table, e)
+        return
+    prepared.meta_ensured = True
+    logger.debug("Published index generation %s for %s.%s", generation, spec.database, spec.table)
+
+
+def _checkpoint_target(spec: DorisTarget) -> dict[str, Any]:
+    """What a checkpoint must match to be resumed."""
+    return {
+        "fe_host": spec.fe_host,
+        "fe_http_port": spec.fe_http_port,
+        "database": spec.database,
+        "table": spec.table,
+        "load_mode": spec.load_mode,
+    }
+
+
+def _resume_table(spec: DorisTarget, checkpoint: load_checkpoint.LoadCheckpoint | None) -> str | None:
+    """Load table of the checkpoint's unfinished run, if it can be loaded into again."""
+    if checkpoint is None or not checkpoint.resumable or not checkpoint.load_table:
+        return None
+    table = checkpoint.load_table
+    if spec.load_mode == "rebuild" and table != staging_table_name(spec.table):
+        return None
+    if spec.load_mode == "versioned" and (
+        index_meta.parse_version(spec.table, table) is None or table == _current_version(spec)
+    ):
+        # A version made current meanwhile is live and never loaded into again
+        return None
+    if spec.load_mode == "incremental" and table != spec.table:
+        return None
+    # A table dropped since then is recreated empty, so nothing in it can be skipped
+    return table if _table_exists(spec, table) else None
+
+
+def _expected_rows(spec: DorisTarget, load_table: str) -> int | None:
+    """Rows the run should load: spec.expected_rows, else the live table's size when rebuilding."""
+    if spec.expected_rows is not None or load_table == spec.table or spec.progress_seconds <= 0:
+        return spec.expected_rows
+    try:
+        live_table = _current_version(spec) if spec.load_mode == "versioned" else spec.table
+        return _table_row_count(spec, live_table) if live_table else None
+    except Exception as e:
+        logger.info("Could not count the live rows of %s.%s for the ETA: %s", spec.database, spec.table, e)
+        return None
+
+
+def _key_fields(prepared: PreparedDorisTarget) -> list[str]:
+    state = prepared.setup_state
+    return list(state.key_fields) if state is not None and state.key_fields else ['_key']
+
+
+def _log_progress(prepared: PreparedDorisTarget) -> None:
+    """Log rows done, throughput and ETA, every spec.progress_seconds."""
+    progress = prepared.stats.progress(prepared.spec.progress_seconds)
+    if progress is None:
+        return
+    eta = progress["eta_seconds"]
+    if eta is not None:
+        hours, rest = divmod(int(eta), 3600)
+        eta = f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+    expected = progress["expected_rows"]
+    logger.info(
+        "Load progress %s.%s: rows=%d%s skipped=%d rows/s=%.1f MB/s=%.3f eta=%s",
+        prepared.spec.database, prepared.load_table, progress["rows_done"],
+        f"/{expected}" if expected else "", progress["rows_skipped"],
+        progress["rows_per_second"], progress["mb_per_second"], eta or "unknown",
+    )
+
+
+def _finish_checkpoint(prepared: PreparedDorisTarget) -> None:
+    """
+    Remove the checkpoint after a clean incremental run (rebuilds remove it
+    when they swap); otherwise keep it for the next run to resume from.
+    """
+    checkpoint = prepared.checkpoint
+    if checkpoint is None or not checkpoint.active:
+        return
+    clean = not (prepared.aborted or prepared.stats.failures or prepared.buffer)
+    if clean and prepared.load_table == prepared.spec.table:
+        checkpoint.complete()
+    else:
+        checkpoint.close()
+        logger.info("Load of %s.%s can be resumed from %s", prepared.spec.database, prepared.load_table, checkpoint.path)
+
+
 # Removed local header sanitizer (using shared sanitize_headers_for_log)
 
 
-# Removed local redirect PUT (using shared put_with_manual_redirect)
+# Removed local redirect PUT (using shared StreamLoadTransport)
+
+
+def _load_backends(spec: DorisTarget, session: requests.Session, base_url: str) -> list[str]:
+    """BE HTTP addresses for direct loads, or [] to go through the FE."""
+    if spec.backend_nodes:
+        return list(spec.backend_nodes)
+    if not spec.direct_backends:
+        return []
+    pool = _fe_pool(spec)
+    try:
+        if pool is not None:
+            backends = pool.call(lambda fe: discover_backends(session, pool.base_url(fe)))
+        else:
+            backends = discover_backends(session, base_url)
+    except Exception as e:
+        logger.info("FE /api/backends unavailable (%s); trying SHOW BACKENDS", e)
+        columns, rows = _query_mysql(spec, "SHOW BACKENDS")
+        records = [dict(zip(columns, row)) for row in rows]
+        backends = [
+            f"{r['Host']}:{r['HttpPort']}" for r in records
+            if str(r.get("Alive", "true")).lower() == "true"
+        ]
+    if not backends:
+        raise RuntimeError("direct_backends is set but no alive BE was found")
+    logger.info("Stream Load goes directly to BEs: %s", ", ".join(backends))
+    return backends
+
+
+def _buffer_upserts(prepared: PreparedDorisTarget, rows: list[dict]) -> None:
+    """Queue rows for a coalesced load; flush now if the buffer is full."""
+    spec = prepared.spec
+    with prepared.buffer_lock:
+        prepared.buffer.extend(rows)
+        if prepared.buffer_since is None:
+            prepared.buffer_since = time.monotonic()
+        full = len(prepared.buffer) >= spec.coalesce_rows
+        if not full and prepared.flush_timer is None:
+            prepared.flush_timer = threading.Timer(spec.coalesce_seconds, _flush_in_background, (prepared,))
+            prepared.flush_timer.daemon = True
+            prepared.flush_timer.start()
+    if full:
+        _flush_buffer(prepared)
+
+
+def _flush_in_background(prepared: PreparedDorisTarget) -> None:
+    try:
+        _flush_buffer(prepared)
+    except Exception as e:
+        # The rows stay buffered; the next mutate() retries and raises to cocoindex
+        prepared.flush_error = e
+        logger.error("Background flush of %d buffered rows failed: %s", len(prepared.buffer), e)
+
+
+def _flush_buffer(prepared: PreparedDorisTarget) -> None:
+    """Load all buffered upserts in Stream Load (or group commit) requests of up to batch_size rows."""
+    with prepared.buffer_lock:
+        if prepared.flush_timer is not None:
+            prepared.flush_timer.cancel()
+            prepared.flush_timer = None
+        if not prepared.buffer:
+            return
+        age = time.monotonic() - (prepared.buffer_since or time.monotonic())
+        logger.debug("Flushing %d buffered rows (oldest %.2fs)", len(prepared.buffer), age)
+        # Committed batches leave the buffer one by one, so a flush that fails
+        # part-way resends only what did not load (under new labels)
+        while prepared.buffer:
+            batch = prepared.buffer[:prepared.spec.batch_size]
+            DorisTargetConnector._stream_load_batch(prepared, batch, is_delete=False)
+            del prepared.buffer[:len(batch)]
+        prepared.buffer_since = None
+        prepared.flush_error = None
+    if prepared.spec.publish_generation:
+        _publish_generation(prepared)
+
+def dups_table_name(table: str) -> str:
+    return f"{table}__dups"
+
+
+def create_dups_table_ddl(database: str, table: str, key_column: str, replication_num: int = 1) -> str:
+    """Side table linking duplicate rows (kept whole, without vectors) to their canonical row."""
+    return f"""
+CREATE TABLE IF NOT EXISTS `{database}`.`{table}` (
+    `{key_column}` VARCHAR(1024) NOT NULL,
+    `canonical_key` VARCHAR(1024) NOT NULL,
+    `filename` VARCHAR(1024),
+    `row` JSON
+)
+UNIQUE KEY(`{key_column}`)
+DISTRIBUTED BY HASH(`{key_column}`) BUCKETS AUTO
+PROPERTIES (
+    "replication_num" = "{replication_num}"
+)
+""".strip()
+
+
+def _single_key_field(prepared: PreparedDorisTarget) -> str:
+    state = prepared.setup_state
+    return state.key_fields[0] if state is not None and len(state.key_fields) == 1 else '_key'
+
+
+def _vector_columns(prepared: PreparedDorisTarget) -> list[str]:
+    state = prepared.setup_state
+    return list(prepared.vector_fields or (state.vector_fields if state is not None else None) or ["embedding"])
+
+
+def _load_dedup_state(prepared: PreparedDorisTarget) -> None:
+    """Read the canonical fingerprints and duplicate links of the load table, once per run."""
+    spec = prepared.spec
+    if spec.dedup not in ("exact", "near"):
+        raise ValueError(f"Unsupported dedup mode: {spec.dedup}. Use exact or near.")
+    state = prepared.setup_state
+    if state is not None and len(state.key_fields) > 1:
+        raise ValueError("dedup needs a single key field")
+    key, field = _single_key_field(prepared), spec.dedup_field
+    db, table = spec.database, prepared.load_table
+    dups = dups_table_name(table)
+    index = dedup.SimHashIndex(0, 128) if spec.dedup == "exact" else dedup.SimHashIndex(spec.dedup_distance)
+    statements = [f"CREATE DATABASE IF NOT EXISTS `{db}`"]
+    if table != spec.table and not prepared.resumed:
+        # A new staging/version table starts without duplicates
+        statements.append(f"DROP TABLE IF EXISTS `{db}`.`{dups}`")
+    statements.append(create_dups_table_ddl(db, dups, key, spec.replication_num))
+    _execute_mysql(spec, statements)
+    _, exists = _query_mysql(spec, f"SHOW TABLES FROM `{db}` LIKE '{table}'")
+    # A resumed staging/version table keeps what the previous attempt loaded
+    # (the checkpoint skips it), so its fingerprints and links are read back too
+    if (table == spec.table or prepared.resumed) and exists:
+        client = _sql_client(spec)
+        for r in client.iter_rows(f"SELECT `{key}`, `{field}` FROM `{db}`.`{table}` WHERE `{field}` IS NOT NULL"):
+            index.add(str(r[key]), r[field])
+        for r in client.iter_rows(f"SELECT `{key}`, `canonical_key` FROM `{db}`.`{dups}`"):
+            prepared.alias_of[str(r[key])] = str(r["canonical_key"])
+            prepared.aliases.setdefault(str(r["canonical_key"]), set()).add(str(r[key]))
+    prepared.dedup_index = index
+    logger.info(
+        "Dedup (%s) of %s.%s: %d canonical rows, %d duplicates",
+        spec.dedup, db, table, len(index), len(prepared.alias_of),
+    )
+
+
+def _dedup_mutations(
+    prepared: PreparedDorisTarget, upserts: list[dict], deletes: list[Any],
+) -> tuple[list[dict], list[Any], list[dict], list[str], list[tuple[str, str]]]:
+    """
+    Route mutations between the table and its dups table. Returns the
+    table's upserts and deletes, the dups table's upserts and deletes, and
+    (old, new) canonical keys whose duplicates move to a new canonical row.
+    """
+    spec = prepared.spec
+    key, field = _single_key_field(prepared), spec.dedup_field
+    index = prepared.dedup_index
+    vectors = set(_vector_columns(prepared))
+    rows, removed, dup_rows, dup_removed, moves = [], [], [], [], []
+
+    def unlink(k: str) -> bool:
+        canonical = prepared.alias_of.pop(k, None)
+        if canonical is None:
+            return False
+        group = prepared.aliases.get(canonical)
+        if group is not None:
+            group.discard(k)
+            if not group:
+                del prepared.aliases[canonical]
+        return True
+
+    def move_group(old: str, new: str) -> None:
+        group = prepared.aliases.pop(old, set())
+        group.discard(new)
+        if group:
+            for k in group:
+                prepared.alias_of[k] = new
+            prepared.aliases.setdefault(new, set()).update(group)
+            moves.append((old, new))
+
+    # Canonical rows that go away hand their group to one of their duplicates
+    leaving = []
+    for raw in deletes:
+        k = str(_serialize_value(raw))
+        if unlink(k):
+            dup_removed.append(k)
+            continue
+        index.remove(k)
+        removed.append(raw)
+        if prepared.aliases.get(k):
+            leaving.append(k)
+
+    for row in upserts:
+        k, fp = str(row[key]), row.get(field)
+        was_duplicate = unlink(k)
+        match = index.find(fp, exclude=k) if fp else None
+        if match is None:
+            if fp:
+                index.add(k, fp)
+            if was_duplicate:
+                dup_removed.append(k)
+            rows.append(row)
+            continue
+        if k in index:
+            # A canonical row that now duplicates another one
+            index.remove(k)
+            removed.append(k)
+            move_group(k, match)
+        prepared.alias_of[k] = match
+        prepared.aliases.setdefault(match, set()).add(k)
+        dup_rows.append({
+            key: k,
+            "canonical_key": match,
+            "filename": row.get("filename"),
+            "row": json.dumps({c: v for c, v in row.items() if c not in vectors}, ensure_ascii=False),
+        })
+
+    if leaving:
+        successors = {c: min(prepared.aliases[c]) for c in leaving}
+        promoted = _promoted_rows(prepared, successors)
+        for old, new in successors.items():
+            row = promoted.get(new)
+            if row is None:
+                logger.warning("Duplicate %s of deleted row %s not found; its group is dropped", new, old)
+                continue
+            unlink(new)
+            dup_removed.append(new)
+            if row.get(field):
+                index.add(new, row[field])
+            rows.append(row)
+            move_group(old, new)
+    return rows, removed, dup_rows, dup_removed, moves
+
+
+def _promoted_rows(prepared: PreparedDorisTarget, successors: dict[str, str]) -> dict[str, dict]:
+    """Full rows for duplicates that replace deleted canonical rows, with their vectors."""
+    spec = prepared.spec
+    key = _single_key_field(prepared)
+    vectors = _vector_columns(prepared)
+    db, table = spec.database, prepared.load_table
+    client = _sql_client(spec)
+    old_keys, new_keys = list(successors), list(successors.values())
+    cols = ", ".join(f"`{c}`" for c in [key, *vectors])
+    in_old = ", ".join("?" for _ in old_keys)
+    in_new = ", ".join("?" for _ in new_keys)
+    vector_rows = {
+        str(r[key]): r for r in client.iter_rows(inline_params(
+            f"SELECT {cols} FROM `{db}`.`{table}` WHERE `{key}` IN ({in_old})", old_keys,
+        ))
+    }
+    dup_rows = {
+        str(r[key]): r["row"] for r in client.iter_rows(inline_params(
+            f"SELECT `{key}`, `row` FROM `{db}`.`{dups_table_name(table)}` WHERE `{key}` IN ({in_new})", new_keys,
+        ))
+    }
+    promoted = {}
+    for old, new in successors.items():
+        if old not in vector_rows or new not in dup_rows:
+            continue
+        row = dup_rows[new]
+        row = json.loads(row) if isinstance(row, str) else dict(row)
+        for c in vectors:
+            value = vector_rows[old][c]
+            # The canonical vector stands for the whole group
+            row[c] = json.loads(value) if isinstance(value, str) else list(value)
+        promoted[new] = row
+    return promoted
+
+
+def _apply_dedup_links(prepared: PreparedDorisTarget, dup_rows: list[dict], moves: list[tuple[str, str]]) -> None:
+    if dup_rows:
+        DorisTargetConnector._stream_load_batch(prepared, dup_rows, table=dups_table_name(prepared.load_table))
+    if moves:
+        db, dups = prepared.spec.database, dups_table_name(prepared.load_table)
+        _execute_mysql(prepared.spec, [
+            inline_params(f"UPDATE `{db}`.`{dups}` SET `canonical_key` = ? WHERE `canonical_key` = ?", [new, old])
+            for old, new in moves
+        ])
+
 
 # =============================================================================
 # Target Connector
 # =============================================================================
 
-@cocoindex.op.target_connector(spec_cls=DorisTarget)
+@cocoindex.op.target_connector(spec_cls=DorisTarget, setup_state_cls=DorisSetupState)
 class DorisTargetConnector:
     """
     Target connector for Apache Doris.
@@ -363,16 +1393,26 @@ class DorisTargetConnector:
         """Return a human-readable description of the target."""
         return f"Doris table {key['database']}.{key['table']} @ {key['fe_host']}:{key['fe_http_port']}"
     
+    @staticmethod
+    def get_setup_state(
+        spec: DorisTarget,
+        key_fields_schema: list,
+        value_fields_schema: list,
+        index_options: Any,
+    ) -> DorisSetupState:
+        """Derive the table schema from the field types the flow declares."""
+        return setup_state_for(spec, key_fields_schema, value_fields_schema)
+
     @staticmethod
     def apply_setup_change(
         key: dict,
-        previous: DorisTarget | None,
-        current: DorisTarget | None
+        previous: DorisSetupState | None,
+        current: DorisSetupState | None
     ) -> None:
         """
         Apply setup changes to the target.
         
-        Creates or drops the Doris table based on configuration changes.
+        Creates the Doris table from the declared schema; tables are never dropped.
         """
         protocol = "https" if (current and current.enable_https) or (previous and previous.enable_https) else "http"
         base_url = f"{protocol}://{key['fe_host']}:{key['fe_http_port']}"
@@ -400,13 +1440,25 @@ class DorisTargetConnector:
             return
         
         # Handle target creation
-        if previous is None and current is not None and current.auto_create_table:
+        if current is not None and current.auto_create_table:
             logger.info(f"Doris target configured for {key['database']}.{key['table']}")
-            # Table creation will be handled lazily when we know the schema
-            # from the first batch of data
+            if previous is not None and previous.columns and previous.columns != current.columns:
+                logger.warning(
+                    "Schema of %s.%s changed; the existing table is not altered. "
+                    "Re-index with load_mode = rebuild to apply it.",
+                    key['database'], key['table'],
+                )
+            # Rebuild/versioned modes create their tables at load time; without a
+            # declared schema or vector dimension, creation waits for the first batch
+            if (
+                current.load_mode == "incremental"
+                and current.columns
+                and all(current.vector_fields.values())
+            ):
+                _create_table_from_state(current)
     
     @staticmethod
-    def prepare(spec: DorisTarget) -> PreparedDorisTarget:
+    def prepare(spec: DorisTarget, setup_state: DorisSetupState | None = None) -> PreparedDorisTarget:
         """
         Prepare for execution by creating an HTTP session.
         
@@ -416,22 +1468,60 @@ class DorisTargetConnector:
         protocol = "https" if spec.enable_https else "http"
         base_url = f"{protocol}://{spec.fe_host}:{spec.fe_http_port}"
         
-        session = requests.Session()
-        # Avoid inheriting proxy/env that might strip or alter Authorization
-        session.trust_env = False
+        session = new_session(spec.http_pool_hosts, spec.http_pool_maxsize)
         auth = b64encode(f"{spec.username}:{spec.password}".encode()).decode()
         logger.info(
-            f"Preparing Doris target: {spec.database}.{spec.table} @ {spec.fe_host}:{spec.fe_http_port}"
+            "Preparing Doris target: %s.%s @ %s:%s",
+            spec.database, spec.table, spec.fe_host, spec.fe_http_port,
         )
         # Default auth for all requests
         session.auth = HTTPBasicAuth(spec.username, spec.password)
         
+        if spec.load_mode not in ("incremental", "rebuild", "versioned"):
+            raise ValueError(f"Unsupported load_mode: {spec.load_mode}")
+        checkpoint = None
+        if spec.checkpoint_dir:
+            checkpoint = load_checkpoint.LoadCheckpoint.open(spec.checkpoint_dir, _checkpoint_target(spec))
+        if spec.load_mode == "versioned":
+            _ensure_meta_table(spec)
+        resume_table = _resume_table(spec, checkpoint)
+        if spec.load_mode == "incremental":
+            load_table = spec.table
+        elif spec.load_mode == "rebuild":
+            load_table = staging_table_name(spec.table)
+        elif resume_table:
+            load_table = resume_table
+            logger.info("Resuming version %s.%s", spec.database, load_table)
+        else:
+            load_table = index_meta.version_table(spec.table, max(_version_tables(spec), default=0) + 1)
+            logger.info("Loading new version %s.%s", spec.database, load_table)
+        resumed = resume_table == load_table
+        if checkpoint is not None:
+            checkpoint.start(load_table, resume=resumed)
+        if spec.group_commit and spec.group_commit not in ("async_mode", "sync_mode", "off_mode"):
+            raise ValueError(f"Unsupported group_commit mode: {spec.group_commit}")
+        transport = StreamLoadTransport(
+            session,
+            base_url,
+            backends=_load_backends(spec, session, base_url),
+            protocol=protocol,
+            probe_redirect=spec.redirect_probe,
+            fe_pool=_fe_pool(spec),
+        )
         prepared = PreparedDorisTarget(
             spec=spec,
             session=session,
+            transport=transport,
             base_url=base_url,
             auth_header=f"Basic {auth}",
+            load_table=load_table,
+            setup_state=setup_state,
+            checkpoint=checkpoint,
+            resumed=resumed,
         )
+        prepared.stats.expected_rows = _expected_rows(spec, load_table)
+        # cocoindex has no end-of-run hook; close (swap, flush, summarize) when the process exits
+        _register_open_target(prepared)
         return prepared
     
     @staticmethod
@@ -449,70 +1539,118 @@ class DorisTargetConnector:
         - Deletes use the __DORIS_DELETE_SIGN__ column
         """
         for prepared, mutations in all_mutations:
-            if not mutations:
-                continue
-            
-            spec = prepared.spec
-            
-            # Separate upserts and deletes
-            upserts = []
-            deletes = []
-            
-            for key, value in mutations.items():
-                if value is None:
-                    # Delete operation
-                    deletes.append(key)
+            try:
+                DorisTargetConnector._apply_mutations(prepared, mutations)
+            except Exception:
+                # Never swap a partially loaded staging table into place
+                prepared.aborted = True
+                raise
+
+    @staticmethod
+    def _apply_mutations(prepared: PreparedDorisTarget, mutations: dict[Any, Any | None]) -> None:
+        if not mutations:
+            return
+        
+        spec = prepared.spec
+        state = prepared.setup_state
+        single_key = state.key_fields[0] if state is not None and len(state.key_fields) == 1 else '_key'
+        
+        # Separate upserts and deletes
+        upserts = []
+        deletes = []
+        
+        for key, value in mutations.items():
+            if value is None:
+                # Delete operation
+                deletes.append(key)
+            else:
+                # Upsert operation
+                row = {}
+                
+                # Handle key fields
+                if isinstance(key, dict):
+                    row.update({k: _serialize_value(v) for k, v in key.items()})
+                elif hasattr(key, '_asdict'):
+                    # NamedTuple
+                    row.update({k: _serialize_value(v) for k, v in key._asdict().items()})
+                elif hasattr(key, '__dataclass_fields__'):
+                    # dataclass
+                    row.update({k: _serialize_value(getattr(key, k)) for k in key.__dataclass_fields__})
                 else:
-                    # Upsert operation
-                    row = {}
-                    
-                    # Handle key fields
-                    if isinstance(key, dict):
-                        row.update({k: _serialize_value(v) for k, v in key.items()})
-                    elif hasattr(key, '_asdict'):
-                        # NamedTuple
-                        row.update({k: _serialize_value(v) for k, v in key._asdict().items()})
-                    elif hasattr(key, '__dataclass_fields__'):
-                        # dataclass
-                        row.update({k: _serialize_value(getattr(key, k)) for k in key.__dataclass_fields__})
-                    else:
-                        # Single key field - will be handled by the flow definition
-                        row['_key'] = _serialize_value(key)
-                    
-                    # Handle value fields
-                    if isinstance(value, dict):
-                        row.update({k: _serialize_value(v) for k, v in value.items()})
-                    elif hasattr(value, '_asdict'):
-                        row.update({k: _serialize_value(v) for k, v in value._asdict().items()})
-                    elif hasattr(value, '__dataclass_fields__'):
-                        row.update({k: _serialize_value(getattr(value, k)) for k in value.__dataclass_fields__})
-                    
-                    upserts.append(row)
-            
-            logger.info(
-                f"Mutating Doris target {spec.database}.{spec.table}: upserts={len(upserts)} deletes={len(deletes)}"
-            )
+                    # Single key field: named by the flow, `_key` for legacy setup states
+                    row[single_key] = _serialize_value(key)
+                
+                # Handle value fields
+                if isinstance(value, dict):
+                    row.update({k: _serialize_value(v) for k, v in value.items()})
+                elif hasattr(value, '_asdict'):
+                    row.update({k: _serialize_value(v) for k, v in value._asdict().items()})
+                elif hasattr(value, '__dataclass_fields__'):
+                    row.update({k: _serialize_value(getattr(value, k)) for k in value.__dataclass_fields__})
+                
+                upserts.append(row)
+        
+        logger.debug(
+            "Mutating Doris target %s.%s: upserts=%d deletes=%d",
+            spec.database, spec.table, len(upserts), len(deletes),
+        )
 
-            # Ensure table exists before first upsert (fail fast)
-            if upserts and spec.auto_create_table:
-                _ensure_table_exists(prepared, upserts[: min(len(upserts), spec.batch_size)])
+        # Ensure table exists before first upsert (fail fast)
+        rebuild = prepared.load_table != spec.table
+        if upserts and (spec.auto_create_table or rebuild) and not prepared.table_ensured:
+            _ensure_table_exists(prepared, upserts[: min(len(upserts), spec.batch_size)])
+            prepared.table_ensured = True
 
-            # Process upserts in batches using Stream Load
-            if upserts:
-                DorisTargetConnector._stream_load_batch(prepared, upserts, is_delete=False)
-            
-            # Process deletes
+        if prepared.flush_error is not None:
+            # A background flush failed; retry it here so cocoindex sees the error
+            _flush_buffer(prepared)
+
+        dup_rows, dup_deletes = [], []
+        if spec.dedup:
+            if prepared.dedup_index is None:
+                _load_dedup_state(prepared)
             if deletes:
-                DorisTargetConnector._stream_load_deletes(
-                    prepared, deletes
-                )
+                # Promotions read the vectors of deleted rows, which may still be buffered
+                _flush_buffer(prepared)
+            with prepared.dedup_lock:
+                upserts, deletes, dup_rows, dup_deletes, moves = _dedup_mutations(prepared, upserts, deletes)
+            # Promoted duplicates leave the dups table only after they are in the table (below)
+            _apply_dedup_links(prepared, dup_rows, moves)
+
+        # Small incremental updates are coalesced; deletes flush them first, so a
+        # buffered upsert never lands after a later delete of the same key
+        if upserts and spec.coalesce_rows > 0 and not rebuild:
+            _buffer_upserts(prepared, upserts)
+            upserts = []
+        if deletes and not rebuild:
+            _flush_buffer(prepared)
+
+        # Process upserts in batches using Stream Load
+        if upserts:
+            DorisTargetConnector._stream_load_batch(prepared, upserts, is_delete=False)
+        
+        # Process deletes; a staging table starts empty, so there is nothing to delete
+        if deletes and not rebuild:
+            DorisTargetConnector._stream_load_deletes(
+                prepared, deletes
+            )
+        if dup_deletes:
+            DorisTargetConnector._stream_load_deletes(
+                prepared, dup_deletes, table=dups_table_name(prepared.load_table)
+            )
+
+        # In rebuild mode readers see the new data only after the swap;
+        # buffered rows publish when they are flushed
+        if spec.publish_generation and not rebuild and (upserts or deletes):
+            _publish_generation(prepared)
+
 
-    
     @staticmethod
     def _stream_load_batch(
         prepared: PreparedDorisTarget,
         rows: list[dict],
-        is_delete: bool = False
+        is_delete: bool = False,
+        table: str | None = None,
     ) -> None:
         """
         Execute Stream Load for a batch of rows.
@@ -521,11 +1659,24 @@ class DorisTargetConnector:
             prepared: Prepared target with HTTP session
             rows: List of row dictionaries to load
             is_delete: Whether these are delete operations
+            table: Table to load into (default: prepared.load_table)
         """
         spec = prepared.spec
-        url = _build_stream_load_url(prepared.base_url, spec.database, spec.table)
-        logger.info(
-            f"Stream Load to {url} with table: {spec.database}.{spec.table}: rows={len(rows)} delete={is_delete} batch_size={spec.batch_size}"
+        table = table or prepared.load_table
+        if prepared.checkpoint is not None and not is_delete:
+            pending = prepared.checkpoint.pending(table, rows, _key_fields(prepared))
+            skipped = len(rows) - len(pending)
+            if skipped:
+                STREAM_LOAD_SKIPPED_ROWS.inc(skipped, table=f"{spec.database}.{spec.table}")
+                prepared.stats.record_skipped(skipped)
+                logger.debug("Skipping %d rows already committed to %s.%s", skipped, spec.database, table)
+                _log_progress(prepared)
+            rows = pending
+            if not rows:
+                return
+        logger.debug(
+            "Stream Load to %s.%s: rows=%d delete=%s batch_size=%d",
+            spec.database, table, len(rows), is_delete, spec.batch_size,
         )
         # Prepare headers (align with doris_vector_search: send Basic Authorization header)
         headers = {
@@ -542,81 +1693,31 @@ class DorisTargetConnector:
         
         # Add timeout
         headers["timeout"] = str(spec.stream_load_timeout)
+
+        # Group commit batches many small loads into one transaction on the BE;
+        # it rejects labels. Staging loads are bulk and stay plain Stream Loads.
+        group_commit = spec.group_commit if table == spec.table and not is_delete else None
+        if group_commit:
+            headers["group_commit"] = group_commit
         
         # Process in batches
         batch_size = spec.batch_size
         for i in range(0, len(rows), batch_size):
             batch = rows[i:i + batch_size]
-            data = json.dumps(batch)
-            logger.debug(
-                f"Uploading batch {i // batch_size + 1} size={len(batch)} to {url}"
-            )
-            # Use a unique label per batch to aid FE diagnostics
+            logger.debug("Uploading batch %d size=%d", i // batch_size + 1, len(batch))
+            # Use a unique label per batch to aid FE diagnostics and make retries idempotent
             batch_headers = dict(headers)
-            batch_headers["label"] = f"cocoindex_{int(time.time()*1000)}_{(i // batch_size) + 1}"
-            
-            try:
-                response = put_with_manual_redirect(
-                    prepared.session,
-                    url,
-                    batch_headers,
-                    data.encode('utf-8'),
-                    spec.stream_load_timeout,
-                )
-                
-                # Parse response
-                text = response.text or ""
-                try:
-                    result = response.json()
-                except ValueError:
-                    result = None
-                if result is None:
-                    logger.error(
-                        f"Stream Load non-JSON response: HTTP {response.status_code} {response.reason} url={response.url}"
-                    )
-                    logger.error(
-                        f"Response headers: {json.dumps(sanitize_headers_for_log(dict(response.headers)), ensure_ascii=False)}"
-                    )
-                    body_preview = text if len(text) <= 4000 else text[:4000] + "... [truncated]"
-                    logger.error(f"Response body: {body_preview}")
-                    raise RuntimeError("Stream Load failed: non-JSON response from FE")
-                else:
-                    try:
-                        logger.info(f"Stream Load raw result: {json.dumps(result, ensure_ascii=False)}")
-                    except Exception:
-                        logger.info(f"Stream Load raw result (repr): {result!r}")
-                
-                status_val = None
-                if isinstance(result, dict):
-                    status_val = result.get('Status') or result.get('status')
-                status_ok = False
-                if isinstance(status_val, str):
-                    status_ok = status_val in ("Success", "Publish Timeout") or status_val.lower() in ("success", "publish timeout", "ok")
-                if not status_ok:
-                    error_msg = result.get('Message') or result.get('msg') or 'Unknown error'
-                    error_url = result.get('ErrorURL', '')
-                    logger.error(
-                        f"Stream Load failed: {error_msg}. Error URL: {error_url}"
-                    )
-                    raise RuntimeError(
-                        f"Stream Load failed: {error_msg}. "
-                        f"Error URL: {error_url}"
-                    )
-                
-                loaded = result.get('NumberLoadedRows', result.get('numberLoadedRows', 0))
-                filtered = result.get('NumberFilteredRows', result.get('numberFilteredRows', 0))
-                logger.debug(
-                    f"Stream Load completed: {loaded} loaded, {filtered} filtered"
-                )
-                
-            except requests.exceptions.RequestException as e:
-                logger.exception("Stream Load request failed")
-                raise RuntimeError(f"Stream Load request failed: {e}")
+            if not group_commit:
+                batch_headers["label"] = _new_label("cocoindex", (i // batch_size) + 1)
+            _execute_stream_load(
+                prepared, batch_headers, batch, "delete" if is_delete else "upsert", table
+            )
     
     @staticmethod
     def _stream_load_deletes(
         prepared: PreparedDorisTarget,
-        keys: list[Any]
+        keys: list[Any],
+        table: str | None = None,
     ) -> None:
         """
         Execute delete operations using Stream Load with __DORIS_DELETE_SIGN__.
@@ -624,6 +1725,8 @@ class DorisTargetConnector:
         For UNIQUE KEY model, we load rows with __DORIS_DELETE_SIGN__=1.
         """
         spec = prepared.spec
+        state = prepared.setup_state
+        single_key = state.key_fields[0] if state is not None and len(state.key_fields) == 1 else '_key'
         
         # Convert keys to rows with delete sign
         rows = []
@@ -637,16 +1740,15 @@ class DorisTargetConnector:
             elif hasattr(key, '__dataclass_fields__'):
                 row.update({k: _serialize_value(getattr(key, k)) for k in key.__dataclass_fields__})
             else:
-                row['_key'] = _serialize_value(key)
+                row[single_key] = _serialize_value(key)
             
             # Add delete sign
             row['__DORIS_DELETE_SIGN__'] = 1
             rows.append(row)
         
         if rows:
-            url = _build_stream_load_url(prepared.base_url, spec.database, spec.table)
-            logger.info(
-                f"Stream Load deletes to {spec.database}.{spec.table}: rows={len(rows)}"
+            logger.debug(
+                "Stream Load deletes to %s.%s: rows=%d", spec.database, table or prepared.load_table, len(rows)
             )
             
             headers = {
@@ -658,60 +1760,169 @@ class DorisTargetConnector:
                 "columns": ",".join(rows[0].keys()),
                 "merge_type": "MERGE",
                 "delete": "__DORIS_DELETE_SIGN__=1",
+                "label": _new_label("cocoindex_delete", 1),
                 "Authorization": prepared.auth_header,
                 "Content-Type": "application/json; charset=utf-8",
             }
-            
-            data = json.dumps(rows)
-            
-            try:
-                response = put_with_manual_redirect(
-                    prepared.session,
-                    url,
-                    headers,
-                    data.encode('utf-8'),
-                    spec.stream_load_timeout,
+            _execute_stream_load(prepared, headers, rows, "delete", table)
+
+
+def _new_label(prefix: str, batch_no: int) -> str:
+    return f"{prefix}_{int(time.time()*1000)}_{batch_no}_{uuid.uuid4().hex[:8]}"
+
+
+def _execute_stream_load(
+    prepared: PreparedDorisTarget,
+    headers: dict[str, str],
+    rows: list[dict],
+    kind: str,
+    table: str | None = None,
+) -> dict:
+    """
+    Send one Stream Load request and validate the result.
+
+    Transport errors are retried up to spec.max_retries times with the same
+    label, so a batch that committed before the connection dropped is
+    reported by Doris as "Label Already Exists" and treated as loaded once
+    its ExistingJobStatus is FINISHED. A RUNNING job is re-checked (within
+    the same retries); any other status fails the load.
+    Unlabeled (group commit) loads are never retried: a resend could not be
+    told apart and would duplicate the rows.
+    Each attempt asks the transport for a URL, so with direct BE loads a
+    retry goes to the next BE.
+    Load errors reported by Doris (bad data, schema mismatch) are not retried.
+
+    With a checkpoint, the batch is labelled by the run and its content
+    (so "Label Already Exists" on a first attempt means an earlier process
+    committed it) and recorded once committed.
+
+    Per-batch logging is sampled (every spec.log_sample_every batches at
+    INFO); raw Stream Load responses are only logged on failure or at DEBUG.
+
+    Returns the parsed Stream Load result.
+    """
+    spec = prepared.spec
+    what = "Delete Stream Load" if kind == "delete" else "Stream Load"
+    data = json.dumps(rows).encode('utf-8')
+    labels = {"table": f"{spec.database}.{spec.table}", "kind": kind}
+    table = table or prepared.load_table
+    checkpoint = prepared.checkpoint
+    if checkpoint is not None and "label" in headers:
+        headers = {**headers, "label": checkpoint.label(table, kind, data)}
+
+    max_retries = spec.max_retries if "label" in headers else 0
+    attempt = 0
+    while True:
+        start = time.time()
+        url = prepared.transport.url(spec.database, table)
+        try:
+            response = prepared.transport.put(url, headers, data, spec.stream_load_timeout)
+        except requests.exceptions.RequestException as e:
+            if attempt < max_retries:
+                attempt += 1
+                STREAM_LOAD_RETRIES.inc(**labels)
+                prepared.stats.record_retry()
+                delay = spec.retry_backoff * (2 ** (attempt - 1))
+                logger.warning(
+                    "%s request failed (%s); retrying in %.1fs (attempt %d/%d, label=%s)",
+                    what, e, delay, attempt, max_retries, headers.get("label"),
                 )
-                
-                text = response.text or ""
-                try:
-                    result = response.json()
-                except ValueError:
-                    result = None
-                if result is None:
-                    logger.error(
-                        f"Delete Stream Load non-JSON response: HTTP {response.status_code} {response.reason} url={response.url}"
-                    )
-                    logger.error(
-                        f"Response headers: {json.dumps(sanitize_headers_for_log(dict(response.headers)), ensure_ascii=False)}"
+                time.sleep(delay)
+                continue
+            STREAM_LOAD_FAILURES.inc(**labels)
+            prepared.stats.record_failure()
+            logger.exception("%s request failed (label=%s)", what, headers.get("label"))
+            raise RuntimeError(f"{what} request failed: {e}")
+        elapsed = time.time() - start
+
+        # Parse response
+        text = response.text or ""
+        try:
+            result = response.json()
+        except ValueError:
+            result = None
+        if result is None:
+            STREAM_LOAD_FAILURES.inc(**labels)
+            prepared.stats.record_failure()
+            logger.error(
+                "%s non-JSON response: HTTP %s %s url=%s",
+                what, response.status_code, response.reason, response.url,
+            )
+            logger.error(
+                "Response headers: %s",
+                json.dumps(sanitize_headers_for_log(dict(response.headers)), ensure_ascii=False),
+            )
+            body_preview = text if len(text) <= 4000 else text[:4000] + "... [truncated]"
+            logger.error("Response body: %s", body_preview)
+            raise RuntimeError(f"{what} failed: non-JSON response from FE")
+        logger.debug("%s raw result: %r", what, result)
+
+        status_val = None
+        if isinstance(result, dict):
+            status_val = result.get('Status') or result.get('status')
+        status_ok = False
+        if isinstance(status_val, str):
+            status_ok = status_val in ("Success", "Publish Timeout") or status_val.lower() in ("success", "publish timeout", "ok")
+            # A retried request whose first attempt (or, with a checkpoint, an
+            # earlier process of the same run) already used the label. Only a
+            # FINISHED job is loaded; a RUNNING one may still abort, so wait
+            # and resend to re-check it.
+            if (not status_ok and (attempt > 0 or checkpoint is not None)
+                    and status_val.lower() == "label already exists"):
+                existing = str(result.get("ExistingJobStatus") or "").upper()
+                if existing == "FINISHED":
+                    logger.warning("%s label %s already committed by an earlier attempt", what, headers.get("label"))
+                    status_ok = True
+                elif existing == "RUNNING" and attempt < max_retries:
+                    attempt += 1
+                    STREAM_LOAD_RETRIES.inc(**labels)
+                    prepared.stats.record_retry()
+                    delay = spec.retry_backoff * (2 ** (attempt - 1))
+                    logger.warning(
+                        "%s label %s is still RUNNING; re-checking in %.1fs (attempt %d/%d)",
+                        what, headers.get("label"), delay, attempt, max_retries,
                     )
-                    body_preview = text if len(text) <= 4000 else text[:4000] + "... [truncated]"
-                    logger.error(f"Response body: {body_preview}")
-                    raise RuntimeError("Delete Stream Load failed: non-JSON response from FE")
-                else:
-                    try:
-                        logger.info(f"Delete Stream Load raw result: {json.dumps(result, ensure_ascii=False)}")
-                    except Exception:
-                        logger.info(f"Delete Stream Load raw result (repr): {result!r}")
-                
-                status_val = None
-                if isinstance(result, dict):
-                    status_val = result.get('Status') or result.get('status')
-                status_ok = False
-                if isinstance(status_val, str):
-                    status_ok = status_val in ("Success", "Publish Timeout") or status_val.lower() in ("success", "publish timeout", "ok")
-                if not status_ok:
-                    error_msg = result.get('Message') or result.get('msg') or 'Unknown error'
-                    logger.error(f"Delete Stream Load failed: {error_msg}")
-                    raise RuntimeError(f"Delete Stream Load failed: {error_msg}")
-                
-                logger.debug(
-                    f"Delete Stream Load completed: {result.get('NumberLoadedRows', 0)} rows"
-                )
-                
-            except requests.exceptions.RequestException as e:
-                logger.exception("Delete Stream Load request failed")
-                raise RuntimeError(f"Delete Stream Load request failed: {e}")
+                    time.sleep(delay)
+                    continue
+        if not status_ok:
+            STREAM_LOAD_FAILURES.inc(**labels)
+            prepared.stats.record_failure()
+            error_msg = result.get('Message') or result.get('msg') or 'Unknown error'
+            error_url = result.get('ErrorURL', '')
+            logger.error("%s failed: %s. Error URL: %s", what, error_msg, error_url)
+            try:
+                logger.error("%s raw result: %s", what, json.dumps(result, ensure_ascii=False))
+            except Exception:
+                logger.error("%s raw result (repr): %r", what, result)
+            raise RuntimeError(
+                f"{what} failed: {error_msg}. "
+                f"Error URL: {error_url}"
+            )
+
+        loaded = result.get('NumberLoadedRows', result.get('numberLoadedRows', 0)) or 0
+        filtered = result.get('NumberFilteredRows', result.get('numberFilteredRows', 0)) or 0
+        STREAM_LOAD_SECONDS.observe(elapsed, **labels)
+        STREAM_LOAD_ROWS.inc(loaded, **labels)
+        STREAM_LOAD_FILTERED_ROWS.inc(filtered, **labels)
+        STREAM_LOAD_BYTES.inc(len(data), **labels)
+        batch_no = prepared.stats.record_batch(
+            kind, headers.get("label", ""), len(rows), loaded, filtered, len(data), elapsed
+        )
+        if checkpoint is not None:
+            checkpoint.record(table, kind, headers.get("label", ""), rows, _key_fields(prepared), data)
+        sample_every = max(1, spec.log_sample_every)
+        level = logging.INFO if batch_no % sample_every == 1 or sample_every == 1 else logging.DEBUG
+        if filtered:
+            level = logging.WARNING
+        if logger.isEnabledFor(level):
+            logger.log(
+                level,
+                "%s batch #%d to %s.%s: rows=%d loaded=%d filtered=%d bytes=%d %.3fs",
+                what, batch_no, spec.database, spec.table, len(rows), loaded, filtered,
+                len(data), elapsed,
+            )
+        _log_progress(prepared)
+        return result
 
 
 # =============================================================================
@@ -725,6 +1936,8 @@ def create_doris_table_ddl(
     primary_keys: list[str],
     vector_fields: dict[str, int] | None = None,
     replication_num: int = 1,
+    include_indexes: bool = True,
+    partition_column: str | None = None,
 ) -> str:
     """
     Generate DDL statement for creating a Doris table with ANN index (Doris 4.x).
@@ -736,6 +1949,9 @@ def create_doris_table_ddl(
         primary_keys: List of key column names used for DUPLICATE KEY
         vector_fields: Dictionary mapping vector column names to dimensions
         replication_num: Number of replicas
+        include_indexes: Also emit the ANN/inverted CREATE INDEX statements
+        partition_column: Optional VARCHAR column to AUTO LIST partition by; it is
+            made NOT NULL and prepended to the key columns, as Doris requires
 
     Returns:
         CREATE TABLE DDL statement using ARRAY<FLOAT> and USING ANN index.
@@ -768,6 +1984,13 @@ def create_doris_table_ddl(
             if not filtered_pks:
                 filtered_pks = ['id']
 
+    # Distribution stays on the original keys; a partition column leads the sort key
+    dist_cols = list(filtered_pks)
+    if partition_column:
+        schema[partition_column] = 'VARCHAR(128) NOT NULL'
+        filtered_pks = [partition_column] + [k for k in filtered_pks if k != partition_column]
+        dist_cols = [k for k in dist_cols if k != partition_column] or dist_cols
+
     pk_set = set(filtered_pks)
     # Original order from inferred schema
     original_cols = list(schema.keys())
@@ -802,23 +2025,48 @@ def create_doris_table_ddl(
             columns.append(f"    `{col_name}` {col_type}")
     
     # Build DDL
+    column_defs = ',\n'.join(columns)
+    # New partition values (e.g. a new doc section) get their partition at load time
+    partition_clause = f"\nAUTO PARTITION BY LIST (`{partition_column}`) ()" if partition_column else ""
     ddl = f"""
 CREATE TABLE IF NOT EXISTS `{database}`.`{table}` (
-    {',\n'.join(columns)}
+    {column_defs}
 )
-DUPLICATE KEY({', '.join(f'`{k}`' for k in filtered_pks)})
-DISTRIBUTED BY HASH({', '.join(f'`{k}`' for k in filtered_pks)}) BUCKETS AUTO
+DUPLICATE KEY({', '.join(f'`{k}`' for k in filtered_pks)}){partition_clause}
+DISTRIBUTED BY HASH({', '.join(f'`{k}`' for k in dist_cols)}) BUCKETS AUTO
 PROPERTIES (
     "replication_num" = "{replication_num}"
 );
 """
     
-    # Add ANN index inline statements after table DDL (Doris also supports inline within CREATE TABLE,
+    if include_indexes:
+        ddl += "\n" + create_index_ddl(database, table, schema, vec_fields)
+
+    return ddl.strip()
+
+
+def _index_columns(schema: dict[str, str], vector_fields: dict[str, int] | None) -> dict[str, str]:
+    """Secondary indexes for a schema: index name -> column."""
+    indexes = {f"idx_{vec_col}_ann": vec_col for vec_col in (vector_fields or {})}
+    text_col_type = schema.get('text')
+    if text_col_type and 'TEXT' in str(text_col_type).upper():
+        indexes["idx_text_inverted"] = "text"
+    return indexes
+
+
+def create_index_ddl(
+    database: str,
+    table: str,
+    schema: dict[str, str],
+    vector_fields: dict[str, int] | None = None,
+) -> str:
+    """CREATE INDEX statements: HNSW ANN per vector field, inverted index on `text`."""
+    ddl = ""
+    # Add ANN index statements after table DDL (Doris also supports inline within CREATE TABLE,
     # but executing separate CREATE INDEX is acceptable and clearer here.)
-    if vec_fields:
-        for vec_col, dim in vec_fields.items():
-            # Default to HNSW + L2; quantizer flat
-            ddl += f"""
+    for vec_col, dim in (vector_fields or {}).items():
+        # Default to HNSW + L2; quantizer flat
+        ddl += f"""
 CREATE INDEX IF NOT EXISTS `idx_{vec_col}_ann`
 ON `{database}`.`{table}` (`{vec_col}`)
 USING ANN PROPERTIES (
@@ -828,19 +2076,30 @@ USING ANN PROPERTIES (
     "quantizer" = "flat"
 );
 """
-    
+
     # Add inverted index for TEXT column named 'text'
-    text_col_type = schema.get('text')
-    if text_col_type and 'TEXT' in str(text_col_type).upper():
+    if "idx_text_inverted" in _index_columns(schema, vector_fields):
         ddl += f"""
 CREATE INDEX IF NOT EXISTS `idx_text_inverted`
 ON `{database}`.`{table}` (`text`)
 USING INVERTED;
 """
-    
     return ddl.strip()
 
 
+def build_index_statements(
+    database: str,
+    table: str,
+    schema: dict[str, str],
+    vector_fields: dict[str, int] | None = None,
+) -> list[str]:
+    """BUILD INDEX statements materializing indexes added to an already loaded table."""
+    return [
+        f"BUILD INDEX `{name}` ON `{database}`.`{table}`"
+        for name in _index_columns(schema, vector_fields)
+    ]
+
+
 # =============================================================================
 # Example Usage
 # =============================================================================
@@ -0,0 +1,1320 @@
+"""
+Fake Doris FE/BE for offline benchmarking and connector testing.
+
+An in-process HTTP server that implements enough of the Doris HTTP API
+for doris_http, DorisTargetConnector, rag_lib and the benchmark harness:
+
+- PUT  /api/{db}/{table}/_stream_load   JSON Stream Load. With `backends`,
+                                        the FE answers 307 to a fake BE,
+                                        which does the load (as Doris does).
+                                        Labels are deduplicated ("Label
+                                        Already Exists"), merge_type
+                                        APPEND/DELETE/MERGE with a `delete`
+                                        condition and __DORIS_DELETE_SIGN__
+                                        work on UNIQUE KEY tables, and
+                                        group_commit rejects labels.
+- POST /api/_sql (/api/sql, /rest/v2/sql)
+                                        a small SQL engine: CREATE/DROP/
+                                        ALTER ... RENAME/REPLACE WITH TABLE,
+                                        SHOW TABLES/BACKENDS/BUILD INDEX,
+                                        INSERT, UPDATE, DELETE and SELECT
+                                        with WHERE (AND/OR/NOT, comparisons,
+                                        IN, BETWEEN, IS NULL, LIKE,
+                                        element_at), COUNT(*), ORDER BY and
+                                        LIMIT, including ANN queries ordered
+                                        by l2_distance_approximate(...).
+                                        SET_VAR(query_timeout = n) hints
+                                        are honored.
+- GET  /api/backends, /api/health
+
+Tables are kept in memory. Unknown tables are created as DUPLICATE KEY
+tables on their first Stream Load, so benchmarks need no DDL. The MySQL
+protocol is not implemented: point clients at it with
+`query_protocol = http` (rag_lib) or `sql_protocol="http"` (DorisTarget).
+
+Every request can be given a fixed latency (plus jitter), and faults can
+be injected per request kind (stream_load, redirect, sql, health):
+
+- error             Doris reports a failure (Stream Load Status "Fail",
+                    SQL code 1)
+- http_500          HTTP 500 with a plain-text body
+- drop              the connection is closed without an answer
+- commit_then_drop  the request takes effect, then the connection is
+                    closed (a retried Stream Load then hits its label)
+- slow              `delay_ms` more latency
+- label_running     a Stream Load whose label exists is answered with
+                    ExistingJobStatus RUNNING (still publishing) instead
+                    of FINISHED
+- label_aborted     the same, with ExistingJobStatus ABORTED
+
+with a probability (`rate`) and/or a number of times (`times`).
+
+Usage:
+    python fake_doris.py --port 18030 --latency-ms 5 --backends 2 \\
+        --fault stream_load:drop:rate=0.05 --fault sql:slow:delay_ms=200
+"""
+
+import argparse
+import base64
+import dataclasses
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_STREAM_LOAD_PATH = re.compile(r"^/api/(?P<db>[^/]+)/(?P<table>[^/]+)/_stream_load$")
+_SQL_PATHS = ("/api/_sql", "/api/sql", "/rest/v2/sql")
+DELETE_SIGN = "__DORIS_DELETE_SIGN__"
+
+FAULT_KINDS = ("stream_load", "redirect", "sql", "health", "*")
+FAULT_MODES = ("error", "http_500", "drop", "commit_then_drop", "slow", "label_running", "label_aborted")
+# ExistingJobStatus reported for a label conflict under the label_* modes
+_LABEL_FAULT_STATUS = {"label_running": "RUNNING", "label_aborted": "ABORTED"}
+
+
+class SQLError(ValueError):
+    """A statement Doris would reject; reported as {"code": 1, "msg": ...}."""
+
+
+# =============================================================================
+# Fault injection
+# =============================================================================
+
+@dataclasses.dataclass
+class Fault:
+    kind: str
+    mode: str
+    # Probability per matching request
+    rate: float = 1.0
+    # Injections left; None for unlimited
+    times: int | None = None
+    delay_ms: float = 0.0
+    injected: int = 0
+
+    def __post_init__(self):
+        if self.kind not in FAULT_KINDS:
+            raise ValueError(f"Unknown fault kind {self.kind!r}; use one of {', '.join(FAULT_KINDS)}")
+        if self.mode not in FAULT_MODES:
+            raise ValueError(f"Unknown fault mode {self.mode!r}; use one of {', '.join(FAULT_MODES)}")
+
+
+def parse_fault(spec: str) -> Fault:
+    """Fault from "kind:mode[:key=value,...]", e.g. "stream_load:drop:rate=0.1,times=5"."""
+    parts = spec.split(":", 2)
+    if len(parts) < 2:
+        raise ValueError(f"Invalid fault {spec!r}; expected kind:mode[:key=value,...]")
+    options: dict[str, Any] = {}
+    for item in (parts[2].split(",") if len(parts) > 2 and parts[2] else []):
+        key, sep, value = item.partition("=")
+        if not sep or key.strip() not in ("rate", "times", "delay_ms"):
+            raise ValueError(f"Invalid fault option {item!r} in {spec!r}")
+        options[key.strip()] = int(value) if key.strip() == "times" else float(value)
+    return Fault(parts[0].strip(), parts[1].strip(), **options)
+
+
+# =============================================================================
+# Tables
+# =============================================================================
+
+class FakeTable:
+    """Rows of one table; UNIQUE KEY tables keep one row per key."""
+
+    def __init__(self, name: str, columns: list[str] | None = None,
+                 key_columns: list[str] | None = None, unique: bool = False):
+        self.name = name
+        self.columns = list(columns or [])
+        self.key_columns = list(key_columns or [])
+        self.unique = unique and bool(self.key_columns)
+        self._rows: dict[Any, dict] = {}
+        self._seq = itertools.count()
+        # Bumped on every write; invalidates the cached vector matrices
+        self._version = 0
+        self._vectors: dict[str, tuple] = {}
+
+    def _key(self, row: dict) -> Any:
+        return tuple(_hashable(row.get(c)) for c in self.key_columns)
+
+    def upsert(self, rows: list[dict]) -> None:
+        for row in rows:
+            row = {k: v for k, v in row.items() if k != DELETE_SIGN}
+            for column in row:
+                if column not in self.columns:
+                    self.columns.append(column)
+            self._rows[self._key(row) if self.unique else next(self._seq)] = row
+        self._version += 1
+
+    def delete(self, rows: list[dict]) -> int:
+        """Delete the rows with the keys of `rows` (UNIQUE KEY tables)."""
+        deleted = 0
+        for row in rows:
+            if self._rows.pop(self._key(row), None) is not None:
+                deleted += 1
+        self._version += 1
+        return deleted
+
+    def delete_where(self, predicate: Callable[[dict], Any]) -> int:
+        doomed = [k for k, row in self._rows.items() if predicate(row)]
+        for k in doomed:
+            del self._rows[k]
+        self._version += 1
+        return len(doomed)
+
+    def rows(self) -> list[dict]:
+        return list(self._rows.values())
+
+    def vectors(self, column: str) -> tuple[list[dict], np.ndarray, np.ndarray]:
+        """Rows, `column` of each as one float32 matrix, and a mask of rows that have it.
+
+        Cached until the next write, so an ANN query scores the whole table
+        with one numpy call rather than a Python loop per row.
+        """
+        cached = self._vectors.get(column)
+        if cached is not None and cached[0] == self._version:
+            return cached[1:]
+        rows = self.rows()
+        arrays = [_as_array(row.get(column)) for row in rows]
+        dim = next((len(a) for a in arrays if a), 0)
+        mask = np.array([a is not None and len(a) == dim for a in arrays], dtype=bool)
+        matrix = np.zeros((len(rows), dim), dtype=np.float32)
+        if mask.any():
+            matrix[mask] = np.asarray([a for a, ok in zip(arrays, mask) if ok], dtype=np.float32)
+        self._vectors[column] = (self._version, rows, matrix, mask)
+        return rows, matrix, mask
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+# =============================================================================
+# SQL engine
+# =============================================================================
+
+_TOKEN = re.compile(
+    r"\s*(?:(?P<str>'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")|(?P<num>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)"
+    r"|(?P<ident>`[^`]+`|[A-Za-z_][\w$]*)|(?P<op><=|>=|<>|!=|[^\s\w]))",
+    re.S,
+)
+_HINT = re.compile(r"/\*\+(.*?)\*/", re.S)
+_COMMENT = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+_QUERY_TIMEOUT = re.compile(r"query_timeout\s*=\s*(\d+)", re.I)
+_KEY_CLAUSE = re.compile(r"\b(UNIQUE|DUPLICATE|AGGREGATE)\s+KEY\s*\(([^)]*)\)", re.I)
+
+
+@dataclasses.dataclass
+class _Tok:
+    kind: str  # str, num, ident, quoted, op
+    value: Any
+    upper: str = ""
+    # Offsets in the statement, for naming result columns
+    start: int = 0
+    end: int = 0
+
+
+def _tokenize(sql: str) -> list[_Tok]:
+    tokens, pos = [], 0
+    sql = sql.rstrip()
+    while pos < len(sql):
+        m = _TOKEN.match(sql, pos)
+        if not m or m.end() == pos:
+            raise SQLError(f"Syntax error near: {sql[pos:pos + 40]!r}")
+        pos = m.end()
+        if m.group("str") is not None:
+            tok = _Tok("str", re.sub(r"\\(.)", r"\1", m.group("str")[1:-1], flags=re.S))
+        elif m.group("num") is not None:
+            text = m.group("num")
+            tok = _Tok("num", float(text) if any(c in text for c in ".eE") else int(text))
+        elif m.group("ident") is not None:
+            text = m.group("ident")
+            tok = _Tok("quoted", text[1:-1]) if text.startswith("`") else _Tok("ident", text, text.upper())
+        else:
+            tok = _Tok("op", m.group("op"), m.group("op"))
+        tok.start, tok.end = m.end() - len(m.group(m.lastgroup)), m.end()
+        tokens.append(tok)
+    return tokens
+
+
+def _as_array(value: Any) -> list | None:
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    return list(value) if isinstance(value, (list, tuple)) else None
+
+
+def _coerce(a: Any, b: Any) -> tuple[Any, Any]:
+    # Doris compares '3' = 3 numerically; do the same for mixed operands
+    if isinstance(a, (int, float)) and isinstance(b, str):
+        try:
+            return a, float(b)
+        except ValueError:
+            return str(a), b
+    if isinstance(a, str) and isinstance(b, (int, float)):
+        try:
+            return float(a), b
+        except ValueError:
+            return a, str(b)
+    return a, b
+
+
+def _compare(op: str, a: Any, b: Any) -> bool | None:
+    if a is None or b is None:
+        return None
+    a, b = _coerce(a, b)
+    try:
+        return {
+            "=": a == b, "!=": a != b, "<>": a != b,
+            "<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b,
+        }[op]
+    except TypeError:
+        raise SQLError(f"Cannot compare {a!r} {op} {b!r}")
+
+
+def _like(value: Any, pattern: Any) -> bool | None:
+    if value is None or pattern is None:
+        return None
+    regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in str(pattern))
+    return re.fullmatch(regex, str(value), re.S) is not None
+
+
+def _l2(a: Any, b: Any) -> float | None:
+    a, b = _as_array(a), _as_array(b)
+    if a is None or b is None:
+        return None
+    return sum((float(x) - float(y)) ** 2 for x, y in zip(a, b)) ** 0.5
+
+
+def _inner_product(a: Any, b: Any) -> float | None:
+    a, b = _as_array(a), _as_array(b)
+    if a is None or b is None:
+        return None
+    return sum(float(x) * float(y) for x, y in zip(a, b))
+
+
+def _element_at(array: Any, index: Any) -> Any:
+    values = _as_array(array)
+    if values is None or index is None:
+        return None
+    i = int(index)
+    # 1-based; negative indexes count from the end
+    if 1 <= i <= len(values):
+        return values[i - 1]
+    if -len(values) <= i <= -1:
+        return values[i]
+    return None
+
+
+_FUNCTIONS: dict[str, Callable[..., Any]] = {
+    "L2_DISTANCE_APPROXIMATE": _l2,
+    "L2_DISTANCE": _l2,
+    "INNER_PRODUCT_APPROXIMATE": _inner_product,
+    "INNER_PRODUCT": _inner_product,
+    "ELEMENT_AT": _element_at,
+    "NOW": lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    "LOWER": lambda s: None if s is None else str(s).lower(),
+    "UPPER": lambda s: None if s is None else str(s).upper(),
+    "ARRAY_SIZE": lambda a: None if _as_array(a) is None else len(_as_array(a)),
+}
+
+Expr = Callable[[dict], Any]
+
+
+def _vector_operands(fn: Callable, a: Expr, b: Expr) -> tuple | None:
+    """(fn, column, query) for a distance of a column to a constant vector, else None."""
+    for column_ref, constant in ((a, b), (b, a)):
+        column = getattr(column_ref, "column", None)
+        if column is None:
+            continue
+        try:
+            query = _as_array(constant({}))
+        except Exception:
+            continue
+        if query is not None:
+            return fn, column, np.asarray(query, dtype=np.float32)
+    return None
+
+
+def _scored(table: FakeTable, expr: Expr) -> Expr:
+    """`expr` (a vector distance) scored for the whole table with one numpy call."""
+    fn, column, query = expr.vector
+    rows, matrix, mask = table.vectors(column)
+    if matrix.shape[1] != len(query):
+        return expr
+    if fn is _l2:
+        values = np.sqrt(((matrix - query) ** 2).sum(axis=1))
+    else:
+        values = matrix @ query
+    scores = {id(row): float(v) if ok else None for row, v, ok in zip(rows, values, mask)}
+    return lambda row: scores[id(row)] if id(row) in scores else expr(row)
+
+
+class _Parser:
+    """Recursive-descent parser; expressions compile to functions of a row."""
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.tokens = _tokenize(sql)
+        self.pos = 0
+
+    def text(self, start: int) -> str:
+        """Statement text of the tokens from index `start` up to the current one."""
+        if start >= self.pos:
+            return ""
+        return self.sql[self.tokens[start].start:self.tokens[self.pos - 1].end]
+
+    # -- token helpers --------------------------------------------------------
+
+    def peek(self, offset: int = 0) -> _Tok | None:
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def at(self, *words: str) -> bool:
+        tok = self.peek()
+        return tok is not None and tok.kind in ("ident", "op") and tok.upper in words
+
+    def accept(self, *words: str) -> bool:
+        if self.at(*words):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, word: str) -> None:
+        if not self.accept(word):
+            tok = self.peek()
+            raise SQLError(f"Expected {word} near {tok.value if tok else 'end of statement'!r}")
+
+    def name(self) -> str:
+        tok = self.peek()
+        if tok is None or tok.kind not in ("ident", "quoted"):
+            raise SQLError(f"Expected a name near {tok.value if tok else 'end of statement'!r}")
+        self.pos += 1
+        return tok.value
+
+    def table_ref(self, default_db: str | None) -> tuple[str, str]:
+        first = self.name()
+        if self.accept("."):
+            return first, self.name()
+        if not default_db:
+            raise SQLError(f"No database selected for table {first}")
+        return default_db, first
+
+    def done(self) -> bool:
+        self.accept(";")
+        return self.pos >= len(self.tokens)
+
+    def rest(self) -> list[_Tok]:
+        tokens, self.pos = self.tokens[self.pos:], len(self.tokens)
+        return tokens
+
+    # -- expressions ----------------------------------------------------------
+
+    def expr(self) -> Expr:
+        left = self.and_expr()
+        while self.accept("OR"):
+            right = self.and_expr()
+            left = (lambda l, r: lambda row: bool(l(row)) or bool(r(row)))(left, right)
+        return left
+
+    def and_expr(self) -> Expr:
+        left = self.not_expr()
+        while self.accept("AND"):
+            right = self.not_expr()
+            left = (lambda l, r: lambda row: bool(l(row)) and bool(r(row)))(left, right)
+        return left
+
+    def not_expr(self) -> Expr:
+        if self.accept("NOT"):
+            inner = self.not_expr()
+            return lambda row: not inner(row)
+        return self.predicate()
+
+    def predicate(self) -> Expr:
+        left = self.additive()
+        negate = self.accept("NOT")
+        if self.accept("IN"):
+            self.expect("(")
+            values = [self.additive()]
+            while self.accept(","):
+                values.append(self.additive())
+            self.expect(")")
+
+            def _in(row, left=left, values=values, negate=negate):
+                v = left(row)
+                if v is None:
+                    return None
+                found = any(_compare("=", v, e(row)) for e in values)
+                return not found if negate else found
+            return _in
+        if self.accept("BETWEEN"):
+            low = self.additive()
+            self.expect("AND")
+            high = self.additive()
+
+            def _between(row, left=left, low=low, high=high, negate=negate):
+                v = left(row)
+                inside = _compare(">=", v, low(row)) and _compare("<=", v, high(row))
+                return None if inside is None else (not inside if negate else inside)
+            return _between
+        if self.accept("LIKE"):
+            pattern = self.additive()
+            return lambda row: (lambda m: None if m is None else m != negate)(_like(left(row), pattern(row)))
+        if negate:
+            raise SQLError("Expected IN, BETWEEN or LIKE after NOT")
+        if self.accept("IS"):
+            is_not = self.accept("NOT")
+            self.expect("NULL")
+            return lambda row: (left(row) is None) != is_not
+        tok = self.peek()
+        if tok is not None and tok.kind == "op" and tok.value in ("=", "!=", "<>", "<", "<=", ">", ">="):
+            self.pos += 1
+            right = self.additive()
+            return lambda row: _compare(tok.value, left(row), right(row))
+        return left
+
+    def additive(self) -> Expr:
+        left = self.primary()
+        while self.at("+", "-"):
+            op = self.peek().value
+            self.pos += 1
+            right = self.primary()
+            left = (lambda l, r, op: lambda row: (
+                None if l(row) is None or r(row) is None
+                else l(row) + r(row) if op == "+" else l(row) - r(row)
+            ))(left, right, op)
+        return left
+
+    def primary(self) -> Expr:
+        tok = self.peek()
+        if tok is None:
+            raise SQLError("Unexpected end of statement")
+        if tok.kind in ("str", "num"):
+            self.pos += 1
+            return lambda row, v=tok.value: v
+        if self.accept("-"):
+            inner = self.primary()
+            return lambda row: None if inner(row) is None else -inner(row)
+        if self.accept("("):
+            inner = self.expr()
+            self.expect(")")
+            return inner
+        if tok.kind == "ident" and tok.upper in ("NULL", "TRUE", "FALSE"):
+            self.pos += 1
+            return lambda row, v={"NULL": None, "TRUE": True, "FALSE": False}[tok.upper]: v
+        if tok.kind == "ident" and tok.upper == "CAST":
+            self.pos += 1
+            self.expect("(")
+            inner = self.expr()
+            self.expect("AS")
+            type_tokens = []
+            depth = 0
+            while not (depth == 0 and self.at(")")):
+                t = self.peek()
+                if t is None:
+                    raise SQLError("Unterminated CAST")
+                depth += t.value == "(" and 1 or t.value == ")" and -1 or 0
+                type_tokens.append(str(t.value).upper())
+                self.pos += 1
+            self.expect(")")
+            return self._cast(inner, "".join(type_tokens))
+        nxt = self.peek(1)
+        if tok.kind == "ident" and nxt is not None and nxt.kind == "op" and nxt.value == "(":
+            self.pos += 2
+            fname = tok.upper
+            if fname == "COUNT":
+                if not self.accept("*"):
+                    self.expr()
+                self.expect(")")
+                raise _Aggregate()
+            args: list[Expr] = []
+            if not self.accept(")"):
+                args.append(self.expr())
+                while self.accept(","):
+                    args.append(self.expr())
+                self.expect(")")
+            fn = _FUNCTIONS.get(fname)
+            if fn is None:
+                raise SQLError(f"Unknown function {tok.value}")
+            call = lambda row, fn=fn, args=args: fn(*(a(row) for a in args))
+            if fn in (_l2, _inner_product) and len(args) == 2:
+                call.vector = _vector_operands(fn, *args)
+            return call
+        if tok.kind in ("ident", "quoted"):
+            column = self.name()
+            if self.accept("."):
+                column = self.name()
+            ref = lambda row, c=column: row.get(c)
+            ref.column = column
+            return ref
+        raise SQLError(f"Unexpected {tok.value!r}")
+
+    @staticmethod
+    def _cast(inner: Expr, type_name: str) -> Expr:
+        if type_name.startswith("ARRAY"):
+            return lambda row: _as_array(inner(row))
+        if any(t in type_name for t in ("INT", "BIGINT")):
+            return lambda row: None if inner(row) is None else int(float(inner(row)))
+        if any(t in type_name for t in ("FLOAT", "DOUBLE", "DECIMAL")):
+            return lambda row: None if inner(row) is None else float(inner(row))
+        return lambda row: None if inner(row) is None else str(inner(row))
+
+
+class _Aggregate(Exception):
+    """Raised while parsing COUNT(...): the select list is an aggregate."""
+
+
+# =============================================================================
+# Server
+# =============================================================================
+
+class FakeDorisServer(ThreadingHTTPServer):
+    """In-memory Doris FE stand-in for Stream Load and HTTP SQL, with optional fake BEs."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        backends: int = 0,
+        user: str = "root",
+        password: str = "",
+        auto_create_tables: bool = True,
+    ):
+        super().__init__((host, port), _FakeDorisHandler)
+        self.role = "fe"
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.user = user
+        self.password = password
+        self.auto_create_tables = auto_create_tables
+        self.tables: dict[tuple[str, str], FakeTable] = {}
+        self.databases: set[str] = set()
+        self.labels: dict[tuple[str, str], int] = {}
+        self.faults: list[Fault] = []
+        self.stats = {
+            "stream_loads": 0, "rows_loaded": 0, "rows_deleted": 0, "bytes_received": 0,
+            "queries": 0, "statements": 0, "redirects": 0, "label_conflicts": 0, "faults": 0,
+        }
+        self.lock = threading.RLock()
+        self._txn_id = 0
+        self._thread: threading.Thread | None = None
+        self.backends = [_FakeBackend(self, host) for _ in range(backends)]
+        self._next_backend = itertools.cycle(self.backends) if self.backends else None
+
+    @property
+    def http_port(self) -> int:
+        return self.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeDorisServer":
+        for be in self.backends:
+            be.start()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        for be in self.backends:
+            be.stop()
+        self.shutdown()
+        self.server_close()
+
+    # -- latency and faults ---------------------------------------------------
+
+    def delay_seconds(self) -> float:
+        return (self.latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)) / 1000.0
+
+    def sleep(self) -> None:
+        delay = self.delay_seconds()
+        if delay > 0:
+            time.sleep(delay)
+
+    def inject(self, kind: str, mode: str, rate: float = 1.0, times: int | None = None,
+               delay_ms: float = 0.0) -> Fault:
+        """Inject a fault into requests of `kind`; see the module docstring."""
+        fault = Fault(kind, mode, rate, times, delay_ms)
+        with self.lock:
+            self.faults.append(fault)
+        return fault
+
+    def clear_faults(self) -> None:
+        with self.lock:
+            self.faults.clear()
+
+    def next_fault(self, kind: str, label_conflict: bool = False) -> Fault | None:
+        with self.lock:
+            for fault in self.faults:
+                if fault.kind not in (kind, "*") or fault.times == 0:
+                    continue
+                # label_* faults only apply to (and are only used up by) label conflicts
+                if fault.mode in _LABEL_FAULT_STATUS and not label_conflict:
+                    continue
+                if fault.rate < 1.0 and random.random() >= fault.rate:
+                    continue
+                if fault.times is not None:
+                    fault.times -= 1
+                fault.injected += 1
+                self.stats["faults"] += 1
+                return fault
+        return None
+
+    # -- auth -------------------------------------------------------------------
+
+    def authorized(self, header: str | None) -> bool:
+        if not header or not header.startswith("Basic "):
+            return False
+        try:
+            user, _, password = base64.b64decode(header[6:]).decode().partition(":")
+        except ValueError:
+            return False
+        return user == self.user and password == self.password
+
+    # -- data -------------------------------------------------------------------
+
+    def table(self, db: str, name: str, create: bool = False) -> FakeTable | None:
+        with self.lock:
+            table = self.tables.get((db, name))
+            if table is None and create:
+                table = self.tables[(db, name)] = FakeTable(name)
+                self.databases.add(db)
+            return table
+
+    def rows(self, db: str, table: str) -> list[dict]:
+        """Current rows of a table (empty if it does not exist)."""
+        t = self.table(db, table)
+        return t.rows() if t is not None else []
+
+    def load_rows(self, db: str, table: str, rows: list[dict], nbytes: int) -> int:
+        """Append rows directly, as a committed load; returns its transaction id."""
+        with self.lock:
+            self.table(db, table, create=True).upsert(rows)
+            self.stats["stream_loads"] += 1
+            self.stats["rows_loaded"] += len(rows)
+            self.stats["bytes_received"] += nbytes
+            self._txn_id += 1
+            return self._txn_id
+
+    def stream_load(self, db: str, table_name: str, headers: dict[str, str], body: bytes,
+                    existing_status: str = "FINISHED") -> dict[str, Any]:
+        """
+        Apply one Stream Load as Doris would; returns its JSON result.
+        A label conflict reports the earlier job as `existing_status`.
+        """
+        label = headers.get("label") or ""
+        group_commit = (headers.get("group_commit") or "").lower()
+        merge_type = (headers.get("merge_type") or "APPEND").upper()
+        start = time.time()
+
+        def fail(message: str, **extra: Any) -> dict[str, Any]:
+            return {"Status": "Fail", "Label": label, "Message": message, **extra}
+
+        if group_commit and group_commit != "off_mode" and label:
+            return fail("label and group_commit can't be set at the same time")
+        if (headers.get("format") or "json").lower() != "json":
+            return fail("fake Doris only supports format=json")
+        if merge_type not in ("APPEND", "DELETE", "MERGE"):
+            return fail(f"unknown merge_type {merge_type}")
+        try:
+            rows = json.loads(body or b"[]")
+        except ValueError as e:
+            return fail(f"invalid JSON: {e}")
+        if isinstance(rows, dict):
+            rows = [rows]
+
+        with self.lock:
+            if label and (db, label) in self.labels:
+                self.stats["label_conflicts"] += 1
+                return {
+                    "Status": "Label Already Exists",
+                    "ExistingJobStatus": existing_status,
+                    "Label": label,
+                    "Message": f"Label [{label}] has already been used, relate to txn [{self.labels[(db, label)]}]",
+                }
+            table = self.table(db, table_name, create=self.auto_create_tables)
+            if table is None:
+                return fail(f"unknown table, tableName={table_name}")
+            if merge_type != "APPEND" and not table.unique:
+                return fail("load by MERGE or DELETE is only supported in unique table")
+
+            deleted = 0
+            if merge_type == "DELETE":
+                deleted = table.delete(rows)
+            else:
+                doomed: list[dict] = []
+                if merge_type == "MERGE":
+                    condition = headers.get("delete")
+                    if not condition:
+                        return fail("Excepted DELETE ON clause when merge type is MERGE")
+                    try:
+                        predicate = _Parser(condition).expr()
+                    except SQLError as e:
+                        return fail(f"invalid delete condition: {e}")
+                    doomed = [r for r in rows if bool(predicate(r))]
+                elif table.unique:
+                    # The hidden delete sign column can be loaded directly
+                    doomed = [r for r in rows if bool(r.get(DELETE_SIGN))]
+                kept = [r for r in rows if not any(r is d for d in doomed)]
+                deleted = table.delete(doomed)
+                table.upsert(kept)
+
+            self._txn_id += 1
+            if label:
+                self.labels[(db, label)] = self._txn_id
+            self.stats["stream_loads"] += 1
+            self.stats["rows_loaded"] += len(rows)
+            self.stats["rows_deleted"] += deleted
+            self.stats["bytes_received"] += len(body)
+            txn_id = self._txn_id
+        result = {
+            "TxnId": txn_id,
+            "Label": label or f"group_commit_{txn_id}" if group_commit else label or f"fake_{txn_id}",
+            "Status": "Success",
+            "Message": "OK",
+            "NumberTotalRows": len(rows),
+            "NumberLoadedRows": len(rows),
+            "NumberFilteredRows": 0,
+            "NumberUnselectedRows": 0,
+            "LoadBytes": len(body),
+            "LoadTimeMs": int((time.time() - start) * 1000),
+        }
+        if group_commit:
+            result["GroupCommit"] = True
+        return result
+
+    # -- SQL --------------------------------------------------------------------
+
+    def execute(self, sql: str, database: str | None = None) -> tuple[list[str], list[list]]:
+        """Run one statement; returns (columns, rows) or raises SQLError."""
+        sql = _COMMENT.sub(" ", _HINT.sub(" ", sql)).strip().rstrip(";").strip()
+        if not sql:
+            raise SQLError("Empty statement")
+        p = _Parser(sql)
+        with self.lock:
+            self.stats["statements"] += 1
+            if p.accept("SELECT"):
+                self.stats["queries"] += 1
+                return self._select(p, database)
+            if p.accept("INSERT"):
+                return self._insert(p, database)
+            if p.accept("UPDATE"):
+                return self._update(p, database)
+            if p.accept("DELETE"):
+                return self._delete(p, database)
+            if p.accept("CREATE"):
+                return self._create(p, sql, database)
+            if p.accept("DROP"):
+                return self._drop(p, database)
+            if p.accept("ALTER"):
+                return self._alter(p, database)
+            if p.accept("SHOW"):
+                return self._show(p, database)
+            if p.accept("TRUNCATE"):
+                p.accept("TABLE")
+                self._existing(*p.table_ref(database)).delete_where(lambda row: True)
+                return [], []
+            if p.accept("SET", "USE", "ADMIN", "ANALYZE", "BUILD", "CANCEL"):
+                return [], []
+        raise SQLError(f"fake Doris does not support statement: {sql[:200]}")
+
+    def _existing(self, db: str, name: str) -> FakeTable:
+        table = self.tables.get((db, name))
+        if table is None:
+            raise SQLError(f"Unknown table '{name}' in database '{db}'")
+        return table
+
+    def _select(self, p: _Parser, database: str | None) -> tuple[list[str], list[list]]:
+        items: list[tuple[str, Expr | None]] = []  # (name, expr); expr None for * / COUNT(*)
+        count = False
+        while True:
+            start = p.pos
+            if p.accept("*"):
+                items.append(("*", None))
+            else:
+                try:
+                    expr = p.expr()
+                except _Aggregate:
+                    count, expr = True, None
+                tok = p.tokens[start]
+                name = tok.value if p.pos - start == 1 and tok.kind in ("ident", "quoted") else p.text(start)
+                if p.accept("AS"):
+                    name = p.name()
+                items.append((name, expr))
+            if not p.accept(","):
+                break
+
+        table = None
+        if p.accept("FROM"):
+            table = self._existing(*p.table_ref(database))
+        where: Expr | None = p.expr() if p.accept("WHERE") else None
+        order: list[tuple[Expr, bool]] = []
+        if p.accept("ORDER"):
+            p.expect("BY")
+            while True:
+                order_start = p.pos
+                expr = p.expr()
+                # ORDER BY <select alias>
+                if p.pos - order_start == 1 and p.tokens[order_start].kind in ("ident", "quoted"):
+                    alias = p.tokens[order_start].value
+                    for name, item in items:
+                        if name == alias and item is not None:
+                            expr = item
+                descending = p.accept("DESC")
+                if not descending:
+                    p.accept("ASC")
+                order.append((expr, descending))
+                if not p.accept(","):
+                    break
+        limit = None
+        if p.accept("LIMIT"):
+            limit = int(p.peek().value)
+            p.pos += 1
+            if p.accept("OFFSET"):
+                p.pos += 1
+        if not p.done():
+            raise SQLError(f"Unexpected {p.peek().value!r}")
+
+        if table is not None:
+            # Vector distances (ANN queries) are scored per table, not per row
+            scored: dict[int, Expr] = {}
+            for expr in [e for _, e in items] + [e for e, _ in order]:
+                if getattr(expr, "vector", None) is not None and id(expr) not in scored:
+                    scored[id(expr)] = _scored(table, expr)
+            items = [(name, scored.get(id(e), e)) for name, e in items]
+            order = [(scored.get(id(e), e), d) for e, d in order]
+        rows = table.rows() if table is not None else [{}]
+        if where is not None:
+            rows = [r for r in rows if bool(where(r))]
+        if count:
+            return [name for name, _ in items], [[len(rows)]]
+        for expr, descending in reversed(order):
+            # NULLs first ascending, last descending, as in Doris
+            rows.sort(key=lambda r: (expr(r) is not None, expr(r)), reverse=descending)
+        if limit is not None:
+            rows = rows[:limit]
+        columns: list[str] = []
+        getters: list[Expr] = []
+        for name, expr in items:
+            if expr is None:
+                star = table.columns if table is not None else []
+                columns += star
+                getters += [(lambda c: lambda r: r.get(c))(c) for c in star]
+            else:
+                columns.append(name)
+                getters.append(expr)
+        return columns, [[g(r) for g in getters] for r in rows]
+
+    def _insert(self, p: _Parser, database: str | None) -> tuple[list[str], list[list]]:
+        p.expect("INTO")
+        table = self._existing(*p.table_ref(database))
+        columns = list(table.columns)
+        if p.accept("("):
+            columns = [p.name()]
+            while p.accept(","):
+                columns.append(p.name())
+            p.expect(")")
+        p.expect("VALUES")
+        rows = []
+        while True:
+            p.expect("(")
+            values = [p.expr()({})]
+            while p.accept(","):
+                values.append(p.expr()({}))
+            p.expect(")")
+            if len(values) != len(columns):
+                raise SQLError(f"Column count doesn't match value count ({len(columns)} vs {len(values)})")
+            rows.append(dict(zip(columns, values)))
+            if not p.accept(","):
+                break
+        table.upsert(rows)
+        return [], []
+
+    def _update(self, p: _Parser, database: str | None) -> tuple[list[str], list[list]]:
+        table = self._existing(*p.table_ref(database))
+        if not table.unique:
+            raise SQLError("Only unique table could be updated.")
+        p.expect("SET")
+        assignments = []
+        while True:
+            column = p.name()
+            p.expect("=")
+            assignments.append((column, p.additive()))
+            if not p.accept(","):
+                break
+        where = p.expr() if p.accept("WHERE") else (lambda row: True)
+        for row in table.rows():
+            if bool(where(row)):
+                updated = dict(row)
+                for column, expr in assignments:
+                    updated[column] = expr(row)
+                if any(updated.get(c) != row.get(c) for c in table.key_columns):
+                    raise SQLError("Can not update key columns")
+                table.upsert([updated])
+        return [], []
+
+    def _delete(self, p: _Parser, database: str | None) -> tuple[list[str], list[list]]:
+        p.expect("FROM")
+        table = self._existing(*p.table_ref(database))
+        p.expect("WHERE")
+        where = p.expr()
+        self.stats["rows_deleted"] += table.delete_where(lambda row: bool(where(row)))
+        return [], []
+
+    def _create(self, p: _Parser, sql: str, database: str | None) -> tuple[list[str], list[list]]:
+        if p.accept("DATABASE"):
+            if p.accept("IF"):
+                p.expect("NOT")
+                p.expect("EXISTS")
+            self.databases.add(p.name())
+            return [], []
+        if not p.accept("TABLE"):
+            # CREATE INDEX and the like change nothing here
+            return [], []
+        if_not_exists = False
+        if p.accept("IF"):
+            p.expect("NOT")
+            p.expect("EXISTS")
+            if_not_exists = True
+        db, name = p.table_ref(database)
+        if (db, name) in self.tables:
+            if if_not_exists:
+                return [], []
+            raise SQLError(f"Table '{name}' already exists")
+        # Column names: the first name of every top-level element of the column list
+        columns: list[str] = []
+        p.expect("(")
+        depth, expecting_name = 1, True
+        while depth:
+            tok = p.peek()
+            if tok is None:
+                raise SQLError("Unterminated column list")
+            p.pos += 1
+            if tok.kind == "op" and tok.value == "(":
+                depth += 1
+            elif tok.kind == "op" and tok.value == ")":
+                depth -= 1
+            elif tok.kind == "op" and tok.value == "," and depth == 1:
+                expecting_name = True
+                continue
+            elif expecting_name and depth == 1:
+                if tok.kind == "quoted" or (tok.kind == "ident" and tok.upper not in ("INDEX", "KEY")):
+                    columns.append(tok.value)
+            expecting_name = False
+        m = _KEY_CLAUSE.search(sql)
+        keys = [k.strip().strip("`") for k in m.group(2).split(",")] if m else columns[:1]
+        unique = bool(m) and m.group(1).upper() == "UNIQUE"
+        self.tables[(db, name)] = FakeTable(name, columns, keys, unique)
+        self.databases.add(db)
+        return [], []
+
+    def _drop(self, p: _Parser, database: str | None) -> tuple[list[str], list[list]]:
+        if not p.accept("TABLE"):
+            return [], []
+        if_exists = False
+        if p.accept("IF"):
+            p.expect("EXISTS")
+            if_exists = True
+        db, name = p.table_ref(database)
+        if self.tables.pop((db, name), None) is None and not if_exists:
+            raise SQLError(f"Unknown table '{name}'")
+        return [], []
+
+    def _alter(self, p: _Parser, database: str | None) -> tuple[list[str], list[list]]:
+        p.expect("TABLE")
+        db, name = p.table_ref(database)
+        table = self._existing(db, name)
+        if p.accept("RENAME"):
+            new_name = p.name()
+            if (db, new_name) in self.tables:
+                raise SQLError(f"Table '{new_name}' already exists")
+            del self.tables[(db, name)]
+            table.name = new_name
+            self.tables[(db, new_name)] = table
+        elif p.accept("REPLACE"):
+            p.expect("WITH")
+            p.expect("TABLE")
+            other_name = p.name()
+            other = self._existing(db, other_name)
+            swap = True
+            if p.accept("PROPERTIES"):
+                props = " ".join(str(t.value) for t in p.rest()).lower()
+                swap = "false" not in props
+            self.tables[(db, name)] = other
+            other.name = name
+            if swap:
+                table.name = other_name
+                self.tables[(db, other_name)] = table
+            else:
+                del self.tables[(db, other_name)]
+        # ADD INDEX, SET (...) and other schema changes are accepted as is
+        p.rest()
+        return [], []
+
+    def _show(self, p: _Parser, database: str | None) -> tuple[list[str], list[list]]:
+        if p.accept("TABLES"):
+            db = database
+            if p.accept("FROM", "IN"):
+                db = p.name()
+            pattern = None
+            if p.accept("LIKE"):
+                pattern = p.peek().value
+                p.pos += 1
+            names = sorted(name for (d, name) in self.tables if d == db)
+            if pattern is not None:
+                names = [n for n in names if _like(n, pattern)]
+            return [f"Tables_in_{db}"], [[n] for n in names]
+        if p.accept("BACKENDS"):
+            columns = ["BackendId", "Host", "HeartbeatPort", "BePort", "HttpPort", "BrpcPort", "Alive"]
+            return columns, [
+                [i + 10001, be.server_address[0], 9050, 9060, be.http_port, 8060, "true"]
+                for i, be in enumerate(self.backends)
+            ]
+        if p.accept("BUILD"):
+            # Index builds finish immediately
+            p.rest()
+            return ["JobId", "TableName", "PartitionName", "AlterInvertedIndexes",
+                    "CreateTime", "FinishTime", "State", "Msg", "Progress"], []
+        p.rest()
+        return [], []
+
+
+class _FakeBackend(ThreadingHTTPServer):
+    """A fake BE: serves the Stream Loads the FE redirects to it, on the FE's data."""
+
+    daemon_threads = True
+
+    def __init__(self, fe: FakeDorisServer, host: str):
+        super().__init__((host, 0), _FakeDorisHandler)
+        self.role = "be"
+        self.fe = fe
+        self._thread: threading.Thread | None = None
+
+    @property
+    def http_port(self) -> int:
+        return self.server_address[1]
+
+    @property
+    def address(self) -> str:
+        return f"{self.server_address[0]}:{self.http_port}"
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _FakeDorisHandler(BaseHTTPRequestHandler):
+    server: FakeDorisServer | _FakeBackend
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def doris(self) -> FakeDorisServer:
+        return self.server.fe if self.server.role == "be" else self.server
+
+    def log_message(self, format, *args):
+        logger.debug(f"fake-doris {self.server.role}: " + format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict, headers: dict[str, str] | None = None) -> None:
+        self._send(status, json.dumps(payload, default=str).encode("utf-8"), "application/json", headers)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _drop(self) -> None:
+        # No response at all: the client sees the connection closed
+        self.close_connection = True
+
+    def _fault(self, kind: str, label_conflict: bool = False) -> Fault | None:
+        """Apply latency and a pending fault; returns a fault still to be acted on."""
+        doris = self.doris
+        doris.sleep()
+        fault = doris.next_fault(kind, label_conflict)
+        if fault is not None and fault.mode == "slow":
+            time.sleep(fault.delay_ms / 1000.0)
+            return None
+        if fault is not None and fault.mode == "drop":
+            self._drop()
+        elif fault is not None and fault.mode == "http_500":
+            self._send(500, b"injected fault", "text/plain")
+        return fault
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/api/health":
+            fault = self._fault("health")
+            if fault is not None and fault.mode in ("drop", "http_500"):
+                return
+            if fault is not None and fault.mode == "error":
+                self._send_json(200, {"code": 1, "msg": "injected fault"})
+                return
+            n = len(self.doris.backends) or 1
+            self._send_json(200, {"code": 0, "msg": "success",
+                                  "data": {"online_backend_num": n, "total_backend_num": n}})
+        elif path == "/api/backends" and self.server.role == "fe":
+            self._send_json(200, {"code": 0, "msg": "success", "data": {"backends": [
+                {"ip": be.server_address[0], "http_port": be.http_port, "is_alive": True}
+                for be in self.doris.backends
+            ]}})
+        else:
+            self._send_json(404, {"code": 404, "msg": f"unknown path {self.path}"})
+
+    def do_PUT(self):
+        path = self.path.split("?", 1)[0]
+        m = _STREAM_LOAD_PATH.match(path)
+        body = self._read_body()
+        if not m:
+            self._send_json(404, {"status": "FAILED", "msg": f"unknown path {self.path}"})
+            return
+        doris = self.doris
+        if not doris.authorized(self.headers.get("Authorization")):
+            self._send_json(401, {"status": "FAILED", "msg": "Access denied; you need (at least one of) the LOAD privilege"})
+            return
+        if self.server.role == "fe" and doris.backends:
+            fault = self._fault("redirect")
+            if fault is not None and fault.mode in ("drop", "http_500"):
+                return
+            if fault is not None and fault.mode == "error":
+                self._send_json(200, {"Status": "Fail", "Message": "injected fault: no available backend"})
+                return
+            with doris.lock:
+                be = next(doris._next_backend)
+                doris.stats["redirects"] += 1
+            # The FE never reads the payload it redirects; the client resends it to the BE
+            self._send(307, b"", "text/plain", {"Location": f"http://{be.address}{self.path}"})
+            return
+
+        label = self.headers.get("label") or ""
+        if not body and not label:
+            # A bodiless probe that was not redirected loads nothing; faults are kept for loads
+            doris.sleep()
+            self._send_json(200, {"Status": "Success", "Label": "", "Message": "OK", "NumberLoadedRows": 0})
+            return
+        fault = self._fault("stream_load", bool(label) and (m.group("db"), label) in doris.labels)
+        if fault is not None and fault.mode in ("drop", "http_500"):
+            return
+        if fault is not None and fault.mode == "error":
+            self._send_json(200, {"Status": "Fail", "Label": label, "Message": "injected fault"})
+            return
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        existing_status = _LABEL_FAULT_STATUS.get(fault.mode, "FINISHED") if fault is not None else "FINISHED"
+        result = doris.stream_load(m.group("db"), m.group("table"), headers, body, existing_status)
+        if fault is not None and fault.mode == "commit_then_drop":
+            self._drop()
+            return
+        self._send_json(200, result)
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if self.server.role != "fe" or path not in _SQL_PATHS:
+            self._read_body()
+            self._send_json(404, {"code": 404, "msg": f"unknown path {self.path}"})
+            return
+        try:
+            req = json.loads(self._read_body() or b"{}")
+        except ValueError:
+            self._send_json(400, {"code": 400, "msg": "invalid JSON"})
+            return
+        doris = self.doris
+        if not doris.authorized(self.headers.get("Authorization")):
+            self._send_json(401, {"code": 401, "msg": "Unauthorized"})
+            return
+        sql = req.get("stmt") or req.get("sql") or ""
+        started = time.monotonic()
+        fault = self._fault("sql")
+        if fault is not None and fault.mode in ("drop", "http_500"):
+            return
+        if fault is not None and fault.mode == "error":
+            self._send_json(200, {"code": 1, "msg": "injected fault", "data": None})
+            return
+        hint = _HINT.search(sql)
+        timeout = _QUERY_TIMEOUT.search(hint.group(1)) if hint else None
+        if timeout and time.monotonic() - started > int(timeout.group(1)):
+            self._send_json(200, {"code": 1, "msg": "Query timeout", "data": None})
+            return
+        try:
+            columns, rows = doris.execute(sql, req.get("database"))
+        except SQLError as e:
+            self._send_json(200, {"code": 1, "msg": str(e), "data": None})
+            return
+        if fault is not None and fault.mode == "commit_then_drop":
+            self._drop()
+            return
+        self._send_json(200, {
+            "code": 0,
+            "msg": "success",
+            "data": {
+                "type": "result_set",
+                "meta": [{"name": c, "type": "STRING"} for c in columns],
+                "data": rows,
+                "time": int((time.monotonic() - started) * 1000),
+            },
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Doris FE/BE for offline benchmarks and tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18030)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--backends", type=int, default=0,
+                        help="Fake BEs that Stream Loads are redirected to (0: the FE loads itself)")
+    parser.add_argument("--fault", action="append", default=[], metavar="KIND:MODE[:key=value,...]",
+                        help="Inject faults, e.g. stream_load:drop:rate=0.1 (repeatable)")
+    args = parser.parse_args()
+
+    server = FakeDorisServer(
+        host=args.host, port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        backends=args.backends,
+    )
+    for spec in args.fault:
+        fault = parse_fault(spec)
+        server.inject(fault.kind, fault.mode, fault.rate, fault.times, fault.delay_ms)
+    for be in server.backends:
+        be.start()
+    print(f"Fake Doris FE listening on {server.base_url}"
+          + (f", BEs on {', '.join(be.address for be in server.backends)}" if server.backends else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for be in server.backends:
+            be.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
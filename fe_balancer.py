@@ -0,0 +1,284 @@
+"""
+Load balancing and failover across several Doris FEs.
+
+`[doris] host` (and `DorisTarget.fe_hosts`) may list several FEs, each as
+`host`, `host:http_port` or `host:http_port:query_port`. FrontendPool then:
+
+- sends each call to the healthy FE with the fewest outstanding requests
+  (ties go to the lowest recent latency)
+- takes an FE out of rotation for `cooldown_seconds` after a transport
+  error and retries the call on the next one; SQL errors are not retried,
+  and DDL/DML only when the FE could not be connected to at all. Within a
+  request, each attempt gets only the time left of its deadline, and no
+  FE is tried once it has run out
+- probes `/api/health` of every FE in the background, bringing FEs back
+  as soon as they answer again
+- keeps per-FE latency and error counts (`doris_fe_request_seconds`,
+  `doris_fe_errors_total` and snapshot())
+
+BalancedSQL puts the DorisSQL interface of doris_http on top of a pool,
+so the retriever, index_meta and the Doris target fail over transparently.
+"""
+
+import dataclasses
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Sequence, TypeVar
+
+import requests
+
+import deadlines
+import metrics
+from doris_http import DorisSQL, get_client, is_connect_error, is_transport_error
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+FE_SECONDS = metrics.REGISTRY.histogram(
+    "doris_fe_request_seconds", "Doris FE request latency by FE and kind.", ("fe", "kind")
+)
+FE_ERRORS = metrics.REGISTRY.counter(
+    "doris_fe_errors_total", "Doris FE transport errors by FE and kind.", ("fe", "kind")
+)
+
+
+@dataclasses.dataclass
+class Frontend:
+    host: str
+    http_port: int = 8030
+    query_port: int = 9030
+    outstanding: int = 0
+    # Out of rotation until this monotonic time after a failure
+    down_until: float = 0.0
+    latency_ewma: float = 0.0
+    requests: int = 0
+    errors: int = 0
+    last_error: str = ""
+
+    @property
+    def name(self) -> str:
+        return f"{self.host}:{self.http_port}"
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+
+def parse_frontends(hosts: str | Sequence[str], http_port: int = 8030, query_port: int = 9030) -> list[Frontend]:
+    """Frontends from "host[:http_port[:query_port]]" entries (a comma-separated string or a list)."""
+    entries = hosts.split(",") if isinstance(hosts, str) else list(hosts)
+    frontends = []
+    for entry in entries:
+        parts = entry.strip().split(":")
+        if not parts[0]:
+            continue
+        frontends.append(Frontend(
+            host=parts[0],
+            http_port=int(parts[1]) if len(parts) > 1 and parts[1] else http_port,
+            query_port=int(parts[2]) if len(parts) > 2 and parts[2] else query_port,
+        ))
+    if not frontends:
+        raise ValueError(f"No Doris FE in {hosts!r}")
+    return frontends
+
+
+class FrontendPool:
+    """Least-outstanding-requests balancing with passive and active health checks."""
+
+    def __init__(
+        self,
+        frontends: list[Frontend],
+        cooldown_seconds: float = 30.0,
+        probe_seconds: float = 10.0,
+        https: bool = False,
+    ):
+        self.frontends = frontends
+        self.cooldown_seconds = cooldown_seconds
+        self.probe_seconds = probe_seconds
+        self.protocol = "https" if https else "http"
+        self._lock = threading.Lock()
+        self._probe_thread: threading.Thread | None = None
+        if len(frontends) > 1 and probe_seconds > 0:
+            self._probe_thread = threading.Thread(target=self._probe_loop, daemon=True, name="doris-fe-probe")
+            self._probe_thread.start()
+
+    def base_url(self, fe: Frontend) -> str:
+        return f"{self.protocol}://{fe.host}:{fe.http_port}"
+
+    def _candidates(self, exclude: set[str]) -> list[Frontend]:
+        # Every FE is down: try them anyway, longest-down first, rather than fail outright
+        pool = [fe for fe in self.frontends if fe.name not in exclude]
+        healthy = [fe for fe in pool if fe.healthy]
+        if healthy:
+            return sorted(healthy, key=lambda fe: (fe.outstanding, fe.latency_ewma))
+        return sorted(pool, key=lambda fe: fe.down_until)
+
+    def pick(self, exclude: set[str] | None = None) -> Frontend:
+        with self._lock:
+            return self._candidates(exclude or set())[0]
+
+    @contextmanager
+    def track(self, fe: Frontend, kind: str) -> Iterator[None]:
+        """Count an in-flight request against `fe` and record its outcome."""
+        with self._lock:
+            fe.outstanding += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            if is_transport_error(e):
+                self.mark_failed(fe, kind, e)
+            raise
+        else:
+            elapsed = time.perf_counter() - start
+            FE_SECONDS.observe(elapsed, fe=fe.name, kind=kind)
+            with self._lock:
+                fe.requests += 1
+                fe.latency_ewma = elapsed if fe.latency_ewma == 0 else 0.8 * fe.latency_ewma + 0.2 * elapsed
+        finally:
+            with self._lock:
+                fe.outstanding -= 1
+
+    def mark_failed(self, fe: Frontend, kind: str, error: Exception) -> None:
+        FE_ERRORS.inc(fe=fe.name, kind=kind)
+        with self._lock:
+            fe.errors += 1
+            fe.last_error = f"{type(error).__name__}: {error}"[:300]
+            was_healthy = fe.healthy
+            fe.down_until = time.monotonic() + self.cooldown_seconds
+        if was_healthy and len(self.frontends) > 1:
+            logger.warning("Doris FE %s out of rotation for %.0fs: %s", fe.name, self.cooldown_seconds, error)
+
+    def call(
+        self, fn: Callable[[Frontend], T], kind: str = "sql", retryable: Callable[[Exception], bool] = is_transport_error,
+    ) -> T:
+        """
+        Run fn(fe) on the best FE; on an error `retryable` accepts (any
+        transport error by default), on the next one. Each FE is tried at
+        most once per call, and none once the request deadline has passed.
+        """
+        tried: set[str] = set()
+        while True:
+            if tried:
+                deadlines.check("doris_failover")
+            fe = self.pick(tried)
+            tried.add(fe.name)
+            try:
+                with self.track(fe, kind):
+                    return fn(fe)
+            except Exception as e:
+                if not retryable(e) or len(tried) == len(self.frontends):
+                    raise
+                logger.info("Doris FE %s failed (%s); failing over", fe.name, e)
+
+    def _probe_loop(self) -> None:
+        session = requests.Session()
+        session.trust_env = False
+        while True:
+            time.sleep(self.probe_seconds)
+            for fe in self.frontends:
+                try:
+                    resp = session.get(f"{self.base_url(fe)}/api/health", timeout=min(5.0, self.probe_seconds))
+                    # Any answer short of a server error means the FE is up
+                    ok = resp.status_code < 500
+                except requests.RequestException as e:
+                    ok = False
+                    resp = e
+                if ok and not fe.healthy:
+                    logger.info("Doris FE %s is healthy again", fe.name)
+                    with self._lock:
+                        fe.down_until = 0.0
+                elif not ok and fe.healthy:
+                    self.mark_failed(fe, "probe", RuntimeError(f"health probe failed: {resp}"))
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "fe": fe.name,
+                    "healthy": fe.healthy,
+                    "outstanding": fe.outstanding,
+                    "latency_ewma_ms": round(fe.latency_ewma * 1000, 2),
+                    "requests": fe.requests,
+                    "errors": fe.errors,
+                    "last_error": fe.last_error,
+                }
+                for fe in self.frontends
+            ]
+
+
+class BalancedSQL:
+    """The DorisSQL interface over every FE of a FrontendPool."""
+
+    def __init__(self, pool: FrontendPool, **client_kwargs: Any):
+        self.pool = pool
+        self.client_kwargs = client_kwargs
+
+    def client(self, fe: Frontend) -> DorisSQL:
+        return get_client(host=fe.host, http_port=fe.http_port, query_port=fe.query_port, **self.client_kwargs)
+
+    @staticmethod
+    def _attempt_timeout(timeout: int) -> int:
+        # Recomputed per attempt, so a failover does not get a fresh full timeout
+        return max(1, math.ceil(deadlines.timeout(timeout, "doris_failover")))
+
+    def query(self, sql: str, params: Sequence[Any] | None = None, timeout: int = 30):
+        return self.pool.call(lambda fe: self.client(fe).query(sql, params, timeout=self._attempt_timeout(timeout)))
+
+    def execute(self, statements: Sequence[str], timeout: int = 30) -> None:
+        # Statements may have run before a lost connection (RENAME, REPLACE, UPDATE
+        # must not run twice), so only a failure to connect moves them to another FE
+        self.pool.call(
+            lambda fe: self.client(fe).execute(statements, timeout=timeout), kind="ddl", retryable=is_connect_error,
+        )
+
+    def query_prepared(self, template: str, params: Sequence[Any], timeout: int = 30):
+        return self.pool.call(
+            lambda fe: self.client(fe).query_prepared(template, params, timeout=self._attempt_timeout(timeout))
+        )
+
+    def iter_rows(self, sql: str, batch_size: int = 1000, timeout: int = 300) -> Iterator[dict[str, Any]]:
+        # Fail over only until the first row; after that the export is partial
+        def first(fe: Frontend):
+            rows = self.client(fe).iter_rows(sql, batch_size, timeout)
+            return next(rows, None), rows
+
+        head, rows = self.pool.call(first, kind="export")
+        if head is None:
+            return
+        yield head
+        yield from rows
+
+
+_pools: dict[tuple, FrontendPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(hosts: str | Sequence[str], http_port: int = 8030, query_port: int = 9030, **kwargs: Any) -> FrontendPool:
+    """Process-wide FrontendPool for this FE list."""
+    key = (tuple(hosts) if not isinstance(hosts, str) else hosts, http_port, query_port, tuple(sorted(kwargs.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = FrontendPool(parse_frontends(hosts, http_port, query_port), **kwargs)
+        return pool
+
+
+def conf_pool(doris_conf) -> FrontendPool:
+    """Shared FrontendPool for the FEs of a conf.ini [doris] section."""
+    return get_pool(
+        doris_conf.get("host", "localhost"),
+        int(doris_conf.get("http_port", 8030)),
+        int(doris_conf.get("query_port", 9030)),
+        cooldown_seconds=float(doris_conf.get("fe_cooldown_seconds", 30)),
+        probe_seconds=float(doris_conf.get("fe_probe_seconds", 10)),
+    )
+
+
+def all_pools() -> list[FrontendPool]:
+    with _pools_lock:
+        return list(_pools.values())
@@ -1,3 +1,5 @@
+import re
+
 from conf import settings
 
 MESSAGES = {
@@ -21,6 +23,21 @@ MESSAGES = {
             "只返回优化后的查询，不要有任何解释。\n\n"
             "用户问题：{}"
         ),
+        "multi_query_prompt": (
+            "你是一个专业的搜索助手，负责在 Apache Doris 文档库中进行向量检索。\n"
+            "第一行：结合对话历史，将用户的最新问题重写为一个独立、清晰的搜索查询（替换代词）。\n"
+            "之后最多 {} 行：如果问题包含多个方面，每行写一个只针对其中一个方面的子查询；问题很简单时可以不写。\n"
+            "每行一个查询，不要编号，不要有任何解释。\n\n"
+            "对话历史：\n{}\n\n"
+            "用户问题：{}"
+        ),
+        "hyde_prompt": (
+            "你是 Apache Doris 文档的作者。请写一段简短的文档内容（不超过 150 字）来回答下面的问题，"
+            "使用文档的写法，可以包含 SQL 示例。对话历史仅用于理解问题。\n"
+            "只返回这段文档内容。\n\n"
+            "对话历史：\n{}\n\n"
+            "问题：{}"
+        ),
         "service_original_augmented": "原始问题: {} -> 优化后: {}",
         "chat_prompt_template": (
             "你是一个专业的 Apache Doris 中文文档助手，请根据给定的“检索上下文”来回答用户问题。\n\n"
@@ -60,6 +77,22 @@ MESSAGES = {
             "Return only the optimized query, without any explanation.\n\n"
             "User Question: {}"
         ),
+        "multi_query_prompt": (
+            "You are a professional search assistant for vector retrieval in the Apache Doris documentation.\n"
+            "First line: rewrite the user's latest question into an independent, clear search query, using the conversation history to replace pronouns.\n"
+            "Then at most {} lines: if the question has several parts, one sub-query per line that covers only one of them; write none for a simple question.\n"
+            "One query per line, no numbering, no explanation.\n\n"
+            "Conversation History:\n{}\n\n"
+            "User Question: {}"
+        ),
+        "hyde_prompt": (
+            "You are an author of the Apache Doris documentation. Write a short documentation passage (at most 120 words) "
+            "that answers the question below, in the style of the docs; SQL examples are welcome. "
+            "The conversation history is only there to understand the question.\n"
+            "Return only the passage.\n\n"
+            "Conversation History:\n{}\n\n"
+            "Question: {}"
+        ),
         "service_original_augmented": "Original: {} -> Augmented: {}",
         "chat_prompt_template": (
             "You are a professional Apache Doris documentation assistant. Please answer the user's question based on the provided 'Retrieved Context'.\n\n"
@@ -87,3 +120,62 @@ def get_message(key, *args):
     if args:
         return msg.format(*args)
     return msg
+
+
+# Documentation languages (see [docs] sources) and query language routing
+
+def doc_sources() -> list[tuple[str, str]]:
+    """[docs] sources as (lang, path) pairs; empty when only doc_root is used."""
+    sources = []
+    for entry in settings.docs.get('sources', '').split(','):
+        if not entry.strip():
+            continue
+        lang, sep, path = entry.partition('=')
+        if not sep or not lang.strip() or not path.strip():
+            raise ValueError(f"Invalid docs.sources entry {entry.strip()!r}; expected <lang>=<path>")
+        sources.append((lang.strip(), path.strip()))
+    return sources
+
+
+def lang_layout() -> str:
+    """'column' (one table with a `lang` column) or 'tables' (one table per language)."""
+    layout = settings.docs.get('lang_layout', 'column').strip().lower()
+    if layout not in ('column', 'tables'):
+        raise ValueError(f"Unsupported docs.lang_layout: {layout}. Use column or tables.")
+    return layout
+
+
+def lang_table(table: str, lang: str) -> str:
+    """Per-language table name for lang_layout = tables, e.g. zh-CN -> <table>_zh_cn."""
+    return f"{table}_{re.sub(r'[^0-9a-zA-Z]+', '_', lang).lower()}"
+
+
+# Script ranges that identify a language on their own
+_SCRIPTS = (
+    ("ja", re.compile(r"[\u3040-\u30ff]")),  # kana (kanji alone reads as zh)
+    ("ko", re.compile(r"[\uac00-\ud7af]")),
+    ("zh", re.compile(r"[\u4e00-\u9fff]")),
+)
+
+
+def detect_language(text: str) -> str:
+    """Coarse language of a query: ja, ko or zh by script, otherwise en."""
+    for lang, pattern in _SCRIPTS:
+        if pattern.search(text):
+            return lang
+    return 'en'
+
+
+def route_language(query: str) -> str | None:
+    """
+    Source language to search for `query` when [retrieval] route_by_language
+    is on: the first [docs] sources language matching the detected one
+    (zh matches zh-CN). None searches every language.
+    """
+    if not settings.retrieval.getboolean('route_by_language', False):
+        return None
+    detected = detect_language(query)
+    for lang, _ in doc_sources():
+        if lang.lower().split('-')[0] == detected:
+            return lang
+    return None
@@ -1,27 +1,78 @@
+import dataclasses
+import functools
+import re
 from pathlib import Path
+from typing import Literal
 
 import cocoindex
 from conf import settings
 from doris_target import DorisTarget
+from i18n import doc_sources, lang_layout, lang_table
+from fe_balancer import parse_frontends
+import cache_store
+import dedup
+import md_chunker
 from cocoindex.llm import LlmApiType
 from cocoindex.auth_registry import add_transient_auth_entry
 
 
-DOC_ROOT = Path(settings.docs.get("doc_root"))
+# Either one doc_root, or several doc trees tagged with their language:
+# [docs] sources = en=/path/to/docs, zh-CN=/path/to/i18n/zh-CN/...
+SOURCES = [(lang, Path(path)) for lang, path in doc_sources()]
+DOC_ROOT = Path(settings.docs.get("doc_root")) if not SOURCES else None
+# column: one table with a `lang` column; tables: <table_name>_<lang> per language
+LANG_LAYOUT = lang_layout() if SOURCES else None
+# Flow name scopes cocoindex's tracking state; shadow indexes built by
+# rag_eval.py use their own name so they don't disturb the main index
+FLOW_NAME = settings.docs.get("flow_name", "MdToDoris")
 
 # Doris connection from conf.ini
 _dc = settings.doris
-DORIS_FE_HOST = _dc.get("host", "localhost")
-DORIS_FE_PORT = int(_dc.get("http_port", 8030))
-DORIS_QUERY_PORT = int(_dc.get("query_port", 9030))
+# `host` may list several FEs; the first one identifies the target, all are used
+_fes = [h.strip() for h in _dc.get("host", "localhost").split(",") if h.strip()]
+_first_fe = parse_frontends(_fes[:1], int(_dc.get("http_port", 8030)), int(_dc.get("query_port", 9030)))[0]
+DORIS_FE_HOST = _first_fe.host
+DORIS_FE_PORT = _first_fe.http_port
+DORIS_QUERY_PORT = _first_fe.query_port
+DORIS_FE_HOSTS = _fes[1:] or None
 DORIS_DATABASE = _dc.get("db_name", "cocoindex_demo")
 DORIS_TABLE = _dc.get("table_name", "document_embeddings")
 DORIS_USER = _dc.get("user", "root")
 DORIS_PASSWORD = _dc.get("password", "")
+# "rebuild" loads into a staging table and swaps it in after building indexes
+DORIS_LOAD_MODE = _dc.get("load_mode", "incremental")
+# Local load checkpoints make a failed run resumable (see load_checkpoint.py)
+DORIS_CHECKPOINT_DIR = _dc.get("checkpoint_dir", "").strip() or None
+DORIS_PROGRESS_SECONDS = float(_dc.get("progress_seconds", 30))
+# Optional derived column the table is LIST partitioned by: section, version or lang
+PARTITION_BY = _dc.get("partition_by", "").strip().lower() or None
+if PARTITION_BY not in (None, "section", "version", "lang"):
+    raise ValueError(f"Unsupported doris.partition_by: {PARTITION_BY}. Use section, version or lang.")
+# Stream Load transport and live-update tuning
+DORIS_DIRECT_BACKENDS = _dc.getboolean("direct_backends", False)
+DORIS_GROUP_COMMIT = _dc.get("group_commit", "").strip() or None
+DORIS_COALESCE_ROWS = int(_dc.get("coalesce_rows", 0))
+DORIS_COALESCE_SECONDS = float(_dc.get("coalesce_seconds", 1.0))
 
-# Chunking from conf.ini
+# Chunking from conf.ini: recursive (SplitRecursively) or markdown (md_chunker)
+CHUNKER = settings.docs.get("chunker", "recursive").strip().lower()
+if CHUNKER not in ("recursive", "markdown"):
+    raise ValueError(f"Unsupported docs.chunker: {CHUNKER}. Use recursive or markdown.")
 CHUNK_SIZE = int(settings.docs.get("chunk_size", "500"))
 CHUNK_OVERLAP = int(settings.docs.get("chunk_overlap", "100"))
+# markdown: code blocks and tables up to this size are never split (default 4 x chunk_size)
+MAX_BLOCK_SIZE = int(settings.docs.get("max_block_size", "0")) or None
+
+# Near-duplicate chunks: off, exact or near (SimHash within dedup_distance bits);
+# see dedup.py. Duplicates are embedded once and stored once.
+DEDUP = settings.docs.get("dedup", "off").strip().lower()
+if DEDUP not in ("off", "exact", "near"):
+    raise ValueError(f"Unsupported docs.dedup: {DEDUP}. Use off, exact or near.")
+DEDUP = None if DEDUP == "off" else DEDUP
+DEDUP_DISTANCE = int(settings.docs.get("dedup_distance", "3"))
+# Embeddings kept for reuse by identical chunk text during a run (or across runs
+# with [cache] backend = sqlite)
+DEDUP_CACHE_BYTES = int(float(settings.docs.get("dedup_cache_mb", "256")) * 1024 * 1024)
 
 # Embedding settings from conf.ini
 _emb = settings.embedding
@@ -56,47 +107,204 @@ def text_to_embedding(
     )
 
 
-@cocoindex.flow_def(name="MdToDoris")
-def md_to_doris_flow(flow_builder: cocoindex.FlowBuilder, data_scope: cocoindex.DataScope) -> None:
-    data_scope["docs"] = flow_builder.add_source(
-        cocoindex.sources.LocalFile(
-            path=str(DOC_ROOT),
-            included_patterns=["**/*.md", "**/*.mdx"],
-            excluded_patterns=["**/*.pdf", "**/*.png", "**/*.jpg", "**/*.jpeg"],
+@functools.lru_cache(maxsize=1)
+def _embedding_client():
+    import openai
+    return openai.OpenAI(base_url=EMB_BASE_URL, api_key=EMB_API_KEY)
+
+
+@functools.lru_cache(maxsize=1)
+def _embedding_store():
+    return cache_store.open_store("index_embeddings", DEDUP_CACHE_BYTES)
+
+
+@cocoindex.op.function(batching=True, max_batch_size=64)
+def embed_deduplicated(texts: list[str]) -> list[cocoindex.Vector[cocoindex.Float32, Literal[EMB_DIM]]]:
+    """
+    Embeddings through the provider's OpenAI-compatible API, requesting each
+    distinct (normalized) text once; repeats reuse the stored vector.
+    """
+    store = _embedding_store()
+    keys = [cache_store.digest(EMB_MODEL, str(EMB_DIM), dedup.content_digest(t)) for t in texts]
+    vectors = [store.get(k) for k in keys]
+    missing: dict[str, int] = {}
+    for i, (k, v) in enumerate(zip(keys, vectors)):
+        if v is None and k not in missing:
+            missing[k] = i
+    if missing:
+        resp = _embedding_client().embeddings.create(
+            model=EMB_MODEL, input=[texts[i] for i in missing.values()], dimensions=EMB_DIM,
         )
-    )
+        for k, item in zip(missing, resp.data):
+            store.put(k, item.embedding)
+        fresh = {k: item.embedding for k, item in zip(missing, resp.data)}
+        vectors = [v if v is not None else fresh[k] for k, v in zip(keys, vectors)]
+    return vectors
+
+
+@cocoindex.op.function()
+def chunk_fingerprint(text: str) -> str:
+    """Duplicate-detection fingerprint of a chunk (see dedup.fingerprint)."""
+    return dedup.fingerprint(text, DEDUP)
+
+
+@cocoindex.op.function()
+def derive_partition(filename: str, root: str) -> str:
+    """Partition value for a document, derived from its path under its doc root."""
+    full_path = (Path(root) / filename).as_posix()
+    if PARTITION_BY == "section":
+        # Top-level directory, e.g. sql-manual/... -> sql-manual
+        parts = Path(filename).parts
+        return parts[0] if len(parts) > 1 else "_root"
+    if PARTITION_BY == "version":
+        # docusaurus layout: .../version-4.x/... ; unversioned docs are "current"
+        m = re.search(r"/version-([^/]+)/", full_path + "/")
+        return m.group(1) if m else "current"
+    # lang: .../i18n/<locale>/... ; the default locale is English
+    m = re.search(r"/i18n/([^/]+)/", full_path)
+    return m.group(1) if m else "en"
 
-    out = data_scope.add_collector()
 
-    with data_scope["docs"].row() as doc:
-        doc["chunks"] = doc["content"].transform(
-            cocoindex.functions.SplitRecursively(),
-            language="markdown",
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
+@dataclasses.dataclass
+class DocChunk:
+    location: cocoindex.Range
+    text: str
+    # Heading path + text; only used for the embedding
+    embed_text: str
+    title: str
+    heading_path: str
+    chunk_index: int
+    section_index: int
+
+
+@cocoindex.op.function()
+def split_markdown(content: str, filename: str) -> list[DocChunk]:
+    """Structure-aware chunks of a markdown/MDX document (see md_chunker)."""
+    chunks = md_chunker.chunk_markdown(
+        content, CHUNK_SIZE, MAX_BLOCK_SIZE, title=md_chunker.fallback_title(filename),
+    )
+    return [
+        DocChunk(
+            location=(c.start, c.end),
+            text=c.text,
+            embed_text=c.embed_text,
+            title=c.title,
+            heading_path=c.heading_path,
+            chunk_index=c.chunk_index,
+            section_index=c.section_index,
         )
+        for c in chunks
+    ]
+
+
+@cocoindex.op.function()
+def source_lang(filename: str, lang: str) -> str:
+    """Language of the doc tree a document came from."""
+    return lang
+
+
+def _doris_target(table: str, partition_column: str | None) -> DorisTarget:
+    return DorisTarget(
+        fe_host=DORIS_FE_HOST,
+        fe_http_port=DORIS_FE_PORT,
+        query_port=DORIS_QUERY_PORT,
+        database=DORIS_DATABASE,
+        table=table,
+        username=DORIS_USER,
+        password=DORIS_PASSWORD,
+        batch_size=5000,
+        load_mode=DORIS_LOAD_MODE,
+        checkpoint_dir=DORIS_CHECKPOINT_DIR,
+        progress_seconds=DORIS_PROGRESS_SECONDS,
+        partition_column=partition_column,
+        direct_backends=DORIS_DIRECT_BACKENDS,
+        group_commit=DORIS_GROUP_COMMIT,
+        coalesce_rows=DORIS_COALESCE_ROWS,
+        coalesce_seconds=DORIS_COALESCE_SECONDS,
+        fe_hosts=DORIS_FE_HOSTS,
+        dedup=DEDUP,
+        dedup_distance=DEDUP_DISTANCE,
+    )
+
+
+def _collect_chunks(docs, out, root: Path, lang: str | None) -> None:
+    """Chunk and embed one doc tree into `out`; lang tags rows in the column layout."""
+    tag_lang = lang is not None and LANG_LAYOUT == "column"
+    with docs.row() as doc:
+        extra_fields = {}
+        if tag_lang:
+            doc["lang"] = doc["filename"].transform(source_lang, lang=lang)
+            extra_fields["lang"] = doc["lang"]
+        if PARTITION_BY and not (tag_lang and PARTITION_BY == "lang"):
+            doc["partition"] = doc["filename"].transform(derive_partition, root=str(root))
+            extra_fields[PARTITION_BY] = doc["partition"]
+        if CHUNKER == "markdown":
+            doc["chunks"] = doc["content"].transform(split_markdown, filename=doc["filename"])
+        else:
+            doc["chunks"] = doc["content"].transform(
+                cocoindex.functions.SplitRecursively(),
+                language="markdown",
+                chunk_size=CHUNK_SIZE,
+                chunk_overlap=CHUNK_OVERLAP,
+            )
 
         with doc["chunks"].row() as chunk:
-            chunk["embedding"] = text_to_embedding(chunk["text"])
+            chunk_fields = {}
+            embed_input = chunk["text"]
+            if CHUNKER == "markdown":
+                embed_input = chunk["embed_text"]
+                chunk_fields = {
+                    name: chunk[name] for name in md_chunker.COLUMNS
+                }
+            if DEDUP:
+                chunk["embedding"] = embed_input.transform(embed_deduplicated)
+                chunk["fingerprint"] = chunk["text"].transform(chunk_fingerprint)
+                chunk_fields["fingerprint"] = chunk["fingerprint"]
+            else:
+                chunk["embedding"] = text_to_embedding(embed_input)
             out.collect(
                 _key=cocoindex.GeneratedField.UUID,
                 filename=doc["filename"],
                 location=chunk["location"],
                 text=chunk["text"],
                 embedding=chunk["embedding"],
+                **chunk_fields,
+                **extra_fields,
             )
 
-    out.export(
-        "md_embeddings",
-        DorisTarget(
-            fe_host=DORIS_FE_HOST,
-            fe_http_port=DORIS_FE_PORT,
-            query_port=DORIS_QUERY_PORT,
-            database=DORIS_DATABASE,
-            table=DORIS_TABLE,
-            username=DORIS_USER,
-            password=DORIS_PASSWORD,
-            batch_size=5000,
-        ),
-        primary_key_fields=["_key"],
-    )
\ No newline at end of file
+
+def _add_docs_source(flow_builder: cocoindex.FlowBuilder, root: Path):
+    return flow_builder.add_source(
+        cocoindex.sources.LocalFile(
+            path=str(root),
+            included_patterns=["**/*.md", "**/*.mdx"],
+            excluded_patterns=["**/*.pdf", "**/*.png", "**/*.jpg", "**/*.jpeg"],
+        )
+    )
+
+
+@cocoindex.flow_def(name=FLOW_NAME)
+def md_to_doris_flow(flow_builder: cocoindex.FlowBuilder, data_scope: cocoindex.DataScope) -> None:
+    if not SOURCES:
+        data_scope["docs"] = _add_docs_source(flow_builder, DOC_ROOT)
+        out = data_scope.add_collector()
+        _collect_chunks(data_scope["docs"], out, DOC_ROOT, None)
+        out.export("md_embeddings", _doris_target(DORIS_TABLE, PARTITION_BY), primary_key_fields=["_key"])
+        return
+
+    # Each doc tree is its own source; cocoindex processes them concurrently in one update
+    shared_out = data_scope.add_collector() if LANG_LAYOUT == "column" else None
+    for lang, root in SOURCES:
+        slug = lang_table("docs", lang)
+        data_scope[slug] = _add_docs_source(flow_builder, root)
+        out = shared_out or data_scope.add_collector()
+        _collect_chunks(data_scope[slug], out, root, lang)
+        if shared_out is None:
+            # Language is implied by the table; partition_by = lang would be a single value
+            partition = PARTITION_BY if PARTITION_BY != "lang" else None
+            out.export(
+                f"md_embeddings_{slug}", _doris_target(lang_table(DORIS_TABLE, lang), partition),
+                primary_key_fields=["_key"],
+            )
+    if shared_out is not None:
+        shared_out.export("md_embeddings", _doris_target(DORIS_TABLE, PARTITION_BY), primary_key_fields=["_key"])
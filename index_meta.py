@@ -0,0 +1,207 @@
+"""
+Index metadata shared between the indexer and the query side.
+
+A small UNIQUE KEY table in the target database holds key/value entries
+per logical table:
+
+    name        logical table name (e.g. document_embeddings)
+    meta_key    entry name, e.g. "generation"
+    meta_value  entry value
+    updated_at  last write time
+
+DorisTargetConnector writes a new "generation" after every successful
+load; readers compare it to detect that cached search results are stale.
+
+With DorisTarget(load_mode="versioned") every rebuild goes to a new
+physical table `<name>_v<N>`. The "current" entry names the version
+readers should query, and "retired:<version>" records when a version
+stopped being current so old versions can be dropped after a grace period.
+
+Usage:
+    python index_meta.py show
+    python index_meta.py rollback document_embeddings_v3
+"""
+
+import argparse
+import logging
+import re
+import threading
+import time
+
+from doris_http import execute_conf_sql
+
+logger = logging.getLogger(__name__)
+
+META_TABLE = "rag_index_meta"
+GENERATION_KEY = "generation"
+CURRENT_KEY = "current"
+RETIRED_PREFIX = "retired:"
+
+
+def _quote(value: str) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def create_meta_table_ddl(database: str, table: str = META_TABLE, replication_num: int = 1) -> str:
+    return f"""
+CREATE TABLE IF NOT EXISTS `{database}`.`{table}` (
+    `name` VARCHAR(256) NOT NULL,
+    `meta_key` VARCHAR(256) NOT NULL,
+    `meta_value` VARCHAR(1024),
+    `updated_at` DATETIME
+)
+UNIQUE KEY(`name`, `meta_key`)
+DISTRIBUTED BY HASH(`name`) BUCKETS 1
+PROPERTIES (
+    "replication_num" = "{replication_num}"
+)
+""".strip()
+
+
+def upsert_meta_sql(database: str, name: str, key: str, value: str, table: str = META_TABLE) -> str:
+    return (
+        f"INSERT INTO `{database}`.`{table}` (`name`, `meta_key`, `meta_value`, `updated_at`) "
+        f"VALUES ({_quote(name)}, {_quote(key)}, {_quote(value)}, NOW())"
+    )
+
+
+def select_meta_sql(database: str, name: str, key: str, table: str = META_TABLE) -> str:
+    return (
+        f"SELECT `meta_value` FROM `{database}`.`{table}` "
+        f"WHERE `name` = {_quote(name)} AND `meta_key` = {_quote(key)}"
+    )
+
+
+def new_generation() -> str:
+    """A fresh, unique generation marker (nanosecond timestamp)."""
+    return str(time.time_ns())
+
+
+def version_table(table: str, version: int) -> str:
+    return f"{table}_v{version}"
+
+
+def parse_version(table: str, name: str) -> int | None:
+    """Version number of `name` if it is a version table of `table`."""
+    m = re.fullmatch(re.escape(table) + r"_v(\d+)", name)
+    return int(m.group(1)) if m else None
+
+
+class MetaCache:
+    """
+    Meta table values, re-read at most every `check_seconds`. When a read
+    fails the last known value is kept; without one the error propagates.
+    """
+
+    def __init__(self, doris_conf, check_seconds: float, meta_table: str = META_TABLE):
+        self.doris_conf = doris_conf
+        self.check_seconds = check_seconds
+        self.meta_table = meta_table
+        self._values: dict[tuple[str, str], tuple[str | None, float]] = {}
+        self._lock = threading.Lock()
+
+    def _read(self, name: str, key: str) -> str | None:
+        sql = select_meta_sql(self.doris_conf.get("db_name"), name, key, self.meta_table)
+        _, rows = execute_conf_sql(self.doris_conf, sql, timeout=5)
+        return str(rows[0][0]) if rows else None
+
+    def get(self, name: str, key: str) -> str | None:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get((name, key))
+            if cached and now - cached[1] < self.check_seconds:
+                return cached[0]
+        try:
+            value = self._read(name, key)
+        except Exception as e:
+            if cached is None:
+                raise
+            logger.warning("Could not read %s/%s from %s: %s", name, key, self.meta_table, e)
+            value = cached[0]
+        with self._lock:
+            self._values[(name, key)] = (value, now)
+        return value
+
+
+_pointer_cache: MetaCache | None = None
+_pointer_lock = threading.Lock()
+
+
+def current_table(doris_conf=None, table: str | None = None) -> str:
+    """
+    Physical table readers should query for [doris] table_name (or `table`,
+    e.g. a per-language table): the published current version when
+    load_mode is versioned, else the table.
+    """
+    # conf.ini is only needed on the query side; the Doris target imports this module too
+    from conf import settings
+
+    global _pointer_cache
+    doris_conf = doris_conf or settings.doris
+    table = table or doris_conf.get("table_name")
+    if doris_conf.get("load_mode", "incremental").lower() != "versioned":
+        return table
+    meta_table = settings.retrieval.get("meta_table", META_TABLE)
+    if doris_conf is settings.doris:
+        with _pointer_lock:
+            if _pointer_cache is None:
+                _pointer_cache = MetaCache(
+                    doris_conf, float(settings.retrieval.get("pointer_refresh_seconds", 10)), meta_table,
+                )
+        cache = _pointer_cache
+    else:
+        cache = MetaCache(doris_conf, 0, meta_table)
+    try:
+        return cache.get(table, CURRENT_KEY) or table
+    except Exception as e:
+        logger.warning("Could not resolve the current version of %s, using the base table: %s", table, e)
+        return table
+
+
+def switch_current_sql(database: str, name: str, new_table: str, old_table: str | None,
+                       table: str = META_TABLE) -> list[str]:
+    """Statements pointing `name` at new_table and retiring old_table."""
+    statements = [upsert_meta_sql(database, name, CURRENT_KEY, new_table, table)]
+    if old_table and old_table != new_table:
+        statements.append(upsert_meta_sql(database, name, RETIRED_PREFIX + old_table, str(int(time.time())), table))
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect index metadata or roll back a versioned index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("show", help="Print all metadata entries for [doris] table_name")
+    rollback = sub.add_parser("rollback", help="Point readers at an existing version table")
+    rollback.add_argument("version_table", help="e.g. document_embeddings_v3")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+    from conf import settings
+    doris_conf = settings.doris
+    db, name = doris_conf.get("db_name"), doris_conf.get("table_name")
+    meta_table = settings.retrieval.get("meta_table", META_TABLE)
+    if args.command == "show":
+        _, rows = execute_conf_sql(
+            doris_conf,
+            f"SELECT `meta_key`, `meta_value`, `updated_at` FROM `{db}`.`{meta_table}` "
+            f"WHERE `name` = {_quote(name)} ORDER BY `meta_key`",
+        )
+        for key, value, updated in rows:
+            print(f"{key}\t{value}\t{updated}")
+        return
+
+    if parse_version(name, args.version_table) is None:
+        parser.error(f"{args.version_table} is not a version of {name}")
+    _, rows = execute_conf_sql(doris_conf, f"SHOW TABLES FROM `{db}` LIKE {_quote(args.version_table)}")
+    if not rows:
+        parser.error(f"{db}.{args.version_table} does not exist (it may have been garbage-collected)")
+    old = MetaCache(doris_conf, 0, meta_table).get(name, CURRENT_KEY)
+    statements = switch_current_sql(db, name, args.version_table, old, meta_table)
+    statements.append(upsert_meta_sql(db, name, GENERATION_KEY, new_generation(), meta_table))
+    for sql in statements:
+        execute_conf_sql(doris_conf, sql)
+    print(f"{name}: current {old} -> {args.version_table}")
+
+
+if __name__ == "__main__":
+    main()
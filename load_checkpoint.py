@@ -0,0 +1,213 @@
+"""
+Local load checkpoints that make long Doris loads resumable.
+
+With DorisTarget(checkpoint_dir=...), every committed Stream Load of a run
+is appended to `<checkpoint_dir>/<database>.<table>.jsonl`: its label,
+table, kind, row count and bytes, and a digest of each row's content by
+its key. When a run fails part-way (a load raises, the process is
+killed), the next run of the same target reads the file back and:
+
+- loads into the same staging (rebuild) or version (versioned) table
+  instead of starting a new one
+- skips upserts whose key already holds the same content in that table
+- labels each batch by the run and its content, so a batch whose commit
+  was in doubt when the run died is answered "Label Already Exists"
+  instead of being loaded twice
+
+Deletes are recorded too (a deleted key no longer counts as loaded) but
+never skipped. The file is removed once a run finishes cleanly (after the
+swap in rebuild and versioned modes), so the next run starts afresh. It
+grows with every loaded row, so it is meant for one-shot runs, not
+`cocoindex update -L`.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def row_digest(row: dict) -> str:
+    """Digest of a serialized row's content."""
+    data = json.dumps(row, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=10).hexdigest()
+
+
+def row_key(row: dict, key_fields: list[str], digest: str) -> str:
+    """Key of a row; rows missing a key field are keyed by their content."""
+    if all(k in row for k in key_fields):
+        return json.dumps([row[k] for k in key_fields], ensure_ascii=False)
+    return digest
+
+
+class LoadCheckpoint:
+    """Committed loads of one run of a target, persisted as JSON lines."""
+
+    def __init__(self, path: str, target: dict[str, Any]):
+        self.path = path
+        self.target = target
+        self.run_id = ""
+        self.load_table: str | None = None
+        self.started_at = 0.0
+        # Rows of the previous attempt, kept across a resume
+        self.resumed_rows = 0
+        # table -> row key -> content digest of the committed row
+        self._rows: dict[str, dict[str, str]] = {}
+        # Times a batch digest was committed in this run, for unique labels
+        self._batches: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    @classmethod
+    def open(cls, directory: str, target: dict[str, Any]) -> "LoadCheckpoint":
+        """The checkpoint of `target` in `directory`, with any unfinished run read back."""
+        os.makedirs(directory, exist_ok=True)
+        checkpoint = cls(os.path.join(directory, f"{target['database']}.{target['table']}.jsonl"), target)
+        checkpoint._read()
+        return checkpoint
+
+    @property
+    def active(self) -> bool:
+        """Whether loads are being recorded (between start() and complete()/close())."""
+        return self._file is not None
+
+    @property
+    def resumable(self) -> bool:
+        """Whether an unfinished run of the same target was found."""
+        return bool(self.run_id)
+
+    def _read(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for n, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may be cut short by the crash that ended the run
+                if n < len(lines) - 1:
+                    logger.warning("Ignoring corrupt line %d of load checkpoint %s", n + 1, self.path)
+                continue
+            if record.get("type") == "run":
+                if record.get("target") != self.target:
+                    logger.info("Load checkpoint %s belongs to another target; starting afresh", self.path)
+                    return
+                self.run_id = record["run_id"]
+                self.load_table = record.get("load_table")
+                self.started_at = float(record.get("started_at", 0))
+            elif record.get("type") == "batch" and self.run_id:
+                self._apply(record)
+        self.resumed_rows = sum(len(keys) for keys in self._rows.values())
+
+    def _apply(self, record: dict) -> None:
+        rows = self._rows.setdefault(record["table"], {})
+        if record["kind"] == "delete":
+            for key in record["keys"]:
+                rows.pop(key, None)
+        else:
+            rows.update(record["keys"])
+        self._batches[record["digest"]] = self._batches.get(record["digest"], 0) + 1
+
+    def _append(self, record: dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def start(self, load_table: str, resume: bool) -> None:
+        """Begin loading into `load_table`, continuing the unfinished run if `resume`."""
+        with self._lock:
+            if resume and self.resumable and self.load_table == load_table:
+                self._file = open(self.path, "a", encoding="utf-8")
+                logger.info(
+                    "Resuming load of %s from checkpoint %s: %d rows already committed",
+                    load_table, self.path, self.resumed_rows,
+                )
+                return
+            self.run_id = uuid.uuid4().hex[:12]
+            self.load_table = load_table
+            self.started_at = time.time()
+            self.resumed_rows = 0
+            self._rows.clear()
+            self._batches.clear()
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._append({
+                "type": "run", "run_id": self.run_id, "target": self.target,
+                "load_table": load_table, "started_at": self.started_at,
+            })
+
+    def pending(self, table: str, rows: list[dict], key_fields: list[str]) -> list[dict]:
+        """The rows not yet committed to `table` with the same content."""
+        with self._lock:
+            committed = self._rows.get(table)
+            if not committed:
+                return rows
+            kept = []
+            for row in rows:
+                digest = row_digest(row)
+                if committed.get(row_key(row, key_fields, digest)) != digest:
+                    kept.append(row)
+            return kept
+
+    def label(self, table: str, kind: str, data: bytes) -> str:
+        """
+        Stream Load label of a batch: the same for a batch resent after a
+        crash, different when identical content is loaded again later in the run.
+        """
+        digest = self._batch_digest(table, kind, data)
+        with self._lock:
+            n = self._batches.get(digest, 0)
+        return f"ckpt_{self.run_id}_{digest}_{n}"
+
+    @staticmethod
+    def _batch_digest(table: str, kind: str, data: bytes) -> str:
+        h = hashlib.blake2b(digest_size=12)
+        h.update(f"{table}\0{kind}\0".encode("utf-8"))
+        h.update(data)
+        return h.hexdigest()
+
+    def record(self, table: str, kind: str, label: str, rows: list[dict], key_fields: list[str], data: bytes) -> None:
+        """Persist a committed batch."""
+        if kind == "delete":
+            keys: Any = [row_key(row, key_fields, row_digest(row)) for row in rows]
+        else:
+            keys = {}
+            for row in rows:
+                digest = row_digest(row)
+                keys[row_key(row, key_fields, digest)] = digest
+        record = {
+            "type": "batch", "table": table, "kind": kind, "label": label, "rows": len(rows),
+            "bytes": len(data), "digest": self._batch_digest(table, kind, data), "keys": keys,
+        }
+        with self._lock:
+            if self._file is None:
+                return
+            self._append(record)
+            self._apply(record)
+
+    def complete(self) -> None:
+        """The run finished cleanly: remove the checkpoint."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.run_id = ""
+        logger.info("Load finished; removed checkpoint %s", self.path)
+
+    def close(self) -> None:
+        """Stop recording, keeping the checkpoint for the next run."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,450 @@
+"""
+Embedded local vector index for retrieval without a Doris round trip.
+
+The Doris table is exported to a version directory holding:
+- vectors.f32     float32 matrix (rows x dim), opened with numpy.memmap
+- norms.f32       squared L2 norm of every row
+- meta.jsonl      _key, filename, text, location per row (same order)
+- manifest.json   dim, row count, source table, last refresh time
+- hnsw.bin        optional hnswlib index (when index_type = hnsw)
+
+The index directory holds these version directories and a CURRENT file
+naming the live one.
+
+Search is exact numpy brute force over the memory-mapped matrix, or an
+approximate hnswlib search when the optional `hnswlib` package is
+installed. LocalVectorClient mirrors the DorisVectorClient interface used
+by rag_lib (open_table / search / limit / select / to_pandas / close).
+
+refresh() is incremental: it lists the keys in Doris, downloads only rows
+that are new, drops rows that were deleted, writes a new version directory
+and switches CURRENT to it in one rename, so readers always see one
+complete version. Refreshes of all processes sharing the directory are
+serialized by a lock file; a worker that finds a fresh enough version
+written by another one just loads it.
+
+Usage:
+    python local_index.py refresh [--path ./local_index] [--index-type flat|hnsw]
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from conf import settings
+from doris_http import conf_client
+from i18n import doc_sources, lang_layout
+import index_meta
+import md_chunker
+
+try:
+    import hnswlib  # type: ignore
+except Exception:  # optional dependency
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: refreshes are then only serialized within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+META_COLUMNS = ["_key", "filename", "text", "location"]
+_FETCH_BATCH = 500
+_CURRENT = "CURRENT"
+_LOCK = ".refresh.lock"
+
+
+def _parse_vector(value: Any) -> list[float]:
+    # The HTTP SQL endpoint returns ARRAY<FLOAT> as a string like "[0.1, 0.2]"
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [float(x) for x in value]
+
+
+def _parse_location(value: Any) -> Any:
+    if isinstance(value, str) and value.startswith("["):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _quote(value: str) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+class LocalIndex:
+    """Memory-mapped vector matrix plus metadata, loaded from an export directory."""
+
+    def __init__(self, path: str, index_type: str = "flat"):
+        self.path = path
+        self.index_type = index_type
+        self._lock = threading.Lock()
+        # (vectors, norms, meta, key_to_row, hnsw) swapped atomically on reload
+        self._state: tuple | None = None
+        self.manifest: dict[str, Any] = {}
+        # Directory of the loaded version
+        self.version_path: str | None = None
+        if self._current_path() is not None:
+            self.load()
+
+    @property
+    def loaded(self) -> bool:
+        return self._state is not None
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - float(self.manifest.get("refreshed_at", 0))
+
+    def _current_path(self) -> str | None:
+        """Directory of the live version: the one named by CURRENT, else an unversioned export."""
+        try:
+            with open(os.path.join(self.path, _CURRENT), encoding="utf-8") as f:
+                return os.path.join(self.path, f.read().strip())
+        except FileNotFoundError:
+            pass
+        return self.path if os.path.exists(os.path.join(self.path, "manifest.json")) else None
+
+    def load(self) -> None:
+        path = self._current_path()
+        if path is None:
+            raise FileNotFoundError(f"Local index at {self.path} has not been exported yet")
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        count, dim = int(manifest["count"]), int(manifest["dim"])
+        if count:
+            vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r",
+                                shape=(count, dim))
+            norms = np.memmap(os.path.join(path, "norms.f32"), dtype=np.float32, mode="r",
+                              shape=(count,))
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+            norms = np.zeros((0,), dtype=np.float32)
+        meta = []
+        with open(os.path.join(path, "meta.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                meta.append(json.loads(line))
+        hnsw = None
+        hnsw_path = os.path.join(path, "hnsw.bin")
+        if self.index_type == "hnsw" and hnswlib is not None and count and os.path.exists(hnsw_path):
+            hnsw = hnswlib.Index(space="l2", dim=dim)
+            hnsw.load_index(hnsw_path, max_elements=count)
+            hnsw.set_ef(max(64, int(manifest.get("ef", 64))))
+        key_to_row = {m["_key"]: i for i, m in enumerate(meta)}
+        with self._lock:
+            self._state = (vectors, norms, meta, key_to_row, hnsw)
+            self.manifest = manifest
+            self.version_path = path
+
+    def search(self, query_vec, top_k: int, where: dict[str, str] | None = None) -> list[tuple[int, float]]:
+        """Return (row, l2 distance) pairs of the nearest rows whose meta matches `where`."""
+        state = self._state
+        if state is None:
+            raise RuntimeError(f"Local index at {self.path} has not been exported yet")
+        vectors, norms, meta, _, hnsw = state
+        n = vectors.shape[0]
+        if n == 0:
+            return []
+        allowed = None
+        if where:
+            allowed = np.array(
+                [all(str(m.get(c)) == v for c, v in where.items()) for m in meta], dtype=bool
+            )
+            n = int(allowed.sum())
+            if n == 0:
+                return []
+        k = min(int(top_k), n)
+        q = np.asarray(query_vec, dtype=np.float32)
+        if hnsw is not None:
+            row_filter = (lambda i: bool(allowed[i])) if allowed is not None else None
+            labels, dists = hnsw.knn_query(q, k=k, filter=row_filter)
+            return [(int(i), float(np.sqrt(d))) for i, d in zip(labels[0], dists[0])]
+        # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+        d2 = norms - 2.0 * (vectors @ q) + float(q @ q)
+        if allowed is not None:
+            d2 = np.where(allowed, d2, np.inf)
+        idx = np.argpartition(d2, k - 1)[:k] if k < d2.shape[0] else np.arange(d2.shape[0])
+        idx = idx[np.argsort(d2[idx])][:k]
+        return [(int(i), float(np.sqrt(max(d2[i], 0.0)))) for i in idx]
+
+    def meta_rows(self) -> list[dict[str, Any]]:
+        """Metadata of every row (no vectors), e.g. to look up a chunk's neighbors."""
+        return self._state[2] if self._state else []
+
+    def rows(self, hits: list[tuple[int, float]], columns: list[str]) -> pd.DataFrame:
+        meta = self._state[2] if self._state else []
+        records = [{**{c: meta[i].get(c) for c in columns}, "distance": d} for i, d in hits]
+        return pd.DataFrame(records, columns=list(columns) + ["distance"])
+
+    # -------------------------------------------------------------------------
+    # Export / incremental refresh
+    # -------------------------------------------------------------------------
+
+    @contextlib.contextmanager
+    def _refresh_lock(self, wait: bool = True):
+        """Exclusive lock on the index directory across processes (BlockingIOError if busy and not `wait`)."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, _LOCK), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Released when the file is closed
+            yield
+
+    def refresh(
+        self, doris_conf=None, vector_column: str = "embedding", max_age: float | None = None, wait: bool = True,
+    ) -> dict[str, int]:
+        """
+        Sync with the Doris table; returns counts of added, removed and kept
+        rows. With `max_age`, a version written by another process less than
+        `max_age` seconds ago is loaded instead.
+        """
+        with self._refresh_lock(wait):
+            if self._current_path() not in (None, self.version_path):
+                self.load()
+            if max_age is not None and self.loaded and self.age_seconds < max_age:
+                return {"added": 0, "removed": 0, "kept": len(self._state[3])}
+            return self._refresh(doris_conf or settings.doris, vector_column)
+
+    def _refresh(self, doris_conf, vector_column: str) -> dict[str, int]:
+        if doc_sources() and lang_layout() == "tables":
+            raise ValueError("The local index needs docs.lang_layout = column; there is no single table to export")
+        db, table = doris_conf.get("db_name"), index_meta.current_table(doris_conf)
+        # Keep the partition column so filtered searches work locally too
+        partition_by = doris_conf.get("partition_by", "").strip().lower()
+        meta_columns = META_COLUMNS + ([partition_by] if partition_by else [])
+        if md_chunker.configured():
+            meta_columns += md_chunker.COLUMNS
+        # Multilingual docs in one table carry a filterable `lang` column
+        if doc_sources() and lang_layout() == "column" and "lang" not in meta_columns:
+            meta_columns.append("lang")
+        client = conf_client(doris_conf)
+        # Streamed, so large tables are not materialized as one result set
+        remote_keys = [str(r["_key"]) for r in client.iter_rows(f"SELECT `_key` FROM `{db}`.`{table}`")]
+        remote_set = set(remote_keys)
+
+        old = self._state
+        old_keys = old[3] if old else {}
+        new_keys = [k for k in remote_keys if k not in old_keys]
+        kept = [k for k in old_keys if k in remote_set]
+
+        cols = ", ".join(f"`{c}`" for c in meta_columns + [vector_column])
+        fetched = self._fetch(client, f"`{db}`.`{table}`", cols, new_keys, vector_column)
+        removed = len(old_keys) - len(kept)
+        dim = len(next(iter(fetched.values()))[vector_column]) if fetched else int(self.manifest.get("dim", 0))
+        if kept and dim != int(self.manifest.get("dim", 0)):
+            # A new embedding model: the kept vectors no longer fit, so every row is fetched again
+            logger.info("Local index %s: embedding dimension changed to %d, re-exporting all rows", self.path, dim)
+            fetched.update(self._fetch(client, f"`{db}`.`{table}`", cols, kept, vector_column))
+            kept = []
+
+        self._write(old, kept, fetched, vector_column, meta_columns, f"{db}.{table}", dim)
+        self.load()
+        stats = {"added": len(fetched), "removed": removed, "kept": len(kept)}
+        logger.info("Local index %s refreshed from %s.%s: %s", self.path, db, table, stats)
+        return stats
+
+    @staticmethod
+    def _fetch(client, table: str, cols: str, keys: list[str], vector_column: str) -> dict[str, dict[str, Any]]:
+        fetched: dict[str, dict[str, Any]] = {}
+        for i in range(0, len(keys), _FETCH_BATCH):
+            chunk = keys[i:i + _FETCH_BATCH]
+            sql = f"SELECT {cols} FROM {table} WHERE `_key` IN ({', '.join(_quote(k) for k in chunk)})"
+            for rec in client.iter_rows(sql):
+                rec["_key"] = str(rec["_key"])
+                rec["location"] = _parse_location(rec.get("location"))
+                rec[vector_column] = _parse_vector(rec[vector_column])
+                fetched[rec["_key"]] = rec
+        return fetched
+
+    def _write(
+        self, old, kept: list[str], fetched: dict[str, dict], vector_column: str,
+        meta_columns: list[str], source: str, dim: int,
+    ) -> None:
+        count = len(kept) + len(fetched)
+        # A new version directory; nothing reads it before CURRENT names it
+        tmp = tempfile.mkdtemp(prefix=f"v{int(time.time())}_", dir=self.path)
+
+        vectors_path = os.path.join(tmp, "vectors.f32")
+        if count:
+            vectors = np.memmap(vectors_path, dtype=np.float32, mode="w+", shape=(count, dim))
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+            open(vectors_path, "wb").close()
+        with open(os.path.join(tmp, "meta.jsonl"), "w", encoding="utf-8") as meta_out:
+            row = 0
+            if old is not None:
+                old_vectors, _, old_meta, old_rows, _ = old
+                for key in kept:
+                    i = old_rows[key]
+                    vectors[row] = old_vectors[i]
+                    meta_out.write(json.dumps(old_meta[i], ensure_ascii=False) + "\n")
+                    row += 1
+            for rec in fetched.values():
+                vectors[row] = np.asarray(rec[vector_column], dtype=np.float32)
+                meta_out.write(json.dumps({c: rec.get(c) for c in meta_columns}, ensure_ascii=False) + "\n")
+                row += 1
+
+        norms = np.einsum("ij,ij->i", vectors, vectors).astype(np.float32)
+        norms.tofile(os.path.join(tmp, "norms.f32"))
+        if count:
+            vectors.flush()
+
+        if self.index_type == "hnsw" and hnswlib is not None and count:
+            index = hnswlib.Index(space="l2", dim=dim)
+            index.init_index(max_elements=count, ef_construction=200, M=16)
+            index.add_items(np.asarray(vectors), np.arange(count))
+            index.save_index(os.path.join(tmp, "hnsw.bin"))
+
+        del vectors
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": dim, "count": count, "source": source, "refreshed_at": time.time()}, f)
+
+        # Switch readers to the new version in one rename
+        pointer = os.path.join(self.path, _CURRENT + ".tmp")
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(os.path.basename(tmp))
+        os.replace(pointer, os.path.join(self.path, _CURRENT))
+        self._remove_old_versions(keep={tmp, self.version_path})
+
+    def _remove_old_versions(self, keep: set) -> None:
+        """
+        Drop versions but the new and the previous one (a reader may still be
+        opening it), and the files of an unversioned export.
+        """
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if path in keep:
+                continue
+            if name.startswith("v") and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif name in ("vectors.f32", "norms.f32", "meta.jsonl", "hnsw.bin", "manifest.json"):
+                os.remove(path)
+
+
+# =============================================================================
+# DorisVectorClient-compatible facade
+# =============================================================================
+
+class _LocalQuery:
+    def __init__(self, index: LocalIndex, query_vec):
+        self._index = index
+        self._vec = query_vec
+        self._limit = 10
+        self._columns = list(META_COLUMNS)
+        self._where: dict[str, str] = {}
+
+    def limit(self, k: int) -> "_LocalQuery":
+        self._limit = int(k)
+        return self
+
+    def where(self, condition: str) -> "_LocalQuery":
+        """Equality filter in DorisVectorClient's format: column = 'value'."""
+        m = re.fullmatch(r"\s*(\w+)\s*=\s*'([^']*)'\s*", condition)
+        if not m:
+            raise ValueError(f"Unsupported local filter condition: {condition}")
+        self._where[m.group(1)] = m.group(2)
+        return self
+
+    def select(self, columns: list[str]) -> "_LocalQuery":
+        self._columns = list(columns)
+        return self
+
+    def to_pandas(self) -> pd.DataFrame:
+        return self._index.rows(self._index.search(self._vec, self._limit, self._where), self._columns)
+
+
+class _LocalTable:
+    def __init__(self, index: LocalIndex):
+        self._index = index
+
+    def search(self, query_vec, vector_column: str = "embedding") -> _LocalQuery:
+        return _LocalQuery(self._index, query_vec)
+
+
+class LocalVectorClient:
+    """Drop-in for DorisVectorClient backed by a LocalIndex."""
+
+    def __init__(self, index: LocalIndex):
+        self._index = index
+
+    def open_table(self, name: str) -> _LocalTable:
+        return _LocalTable(self._index)
+
+    def close(self) -> None:
+        pass
+
+
+_shared: LocalIndex | None = None
+_shared_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def get_local_index() -> LocalIndex:
+    """Process-wide LocalIndex configured by conf.ini [retrieval]."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            conf = settings.retrieval
+            _shared = LocalIndex(
+                conf.get("local_index_path", "./local_index"),
+                conf.get("local_index_type", "flat").lower(),
+            )
+        return _shared
+
+
+def refresh_in_background(index: LocalIndex, max_age: float | None = None) -> None:
+    """
+    Start a refresh unless one is already running in this process or
+    another; a version another process wrote less than `max_age` seconds
+    ago is loaded instead.
+    """
+    if _refreshing.is_set():
+        return
+    _refreshing.set()
+
+    def _run():
+        try:
+            index.refresh(max_age=max_age, wait=False)
+        except BlockingIOError:
+            logger.debug("Local index %s is being refreshed by another process", index.path)
+        except Exception as e:
+            logger.warning("Local index refresh failed: %s", e)
+        finally:
+            _refreshing.clear()
+
+    threading.Thread(target=_run, daemon=True, name="local-index-refresh").start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or refresh the local vector index")
+    parser.add_argument("command", choices=["refresh"], help="refresh (exports on first run)")
+    parser.add_argument("--path", help="Index directory (default: [retrieval] local_index_path)")
+    parser.add_argument("--index-type", choices=["flat", "hnsw"],
+                        help="Default: [retrieval] local_index_type")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+    conf = settings.retrieval
+    index = LocalIndex(
+        args.path or conf.get("local_index_path", "./local_index"),
+        (args.index_type or conf.get("local_index_type", "flat")).lower(),
+    )
+    stats = index.refresh()
+    print(f"{index.path}: {index.manifest['count']} rows, dim={index.manifest['dim']} {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Markdown chunking that follows the structure of Docusaurus docs.
+
+SplitRecursively cuts at a size budget, so it can split a SQL example or
+a table in half, and a chunk loses the section it belongs to. The
+markdown chunker ([docs] chunker = markdown) instead:
+
+- reads the front matter (title, ...) and drops it from the text
+- strips MDX: import/export lines, component tags such as <Tabs> (their
+  content is kept), admonition fences (:::tip) and comments
+- splits at headings and keeps every fenced code block and table whole
+  (up to max_block_size; longer ones are split at line boundaries, tables
+  repeating their header)
+- packs a section, and subsections that still fit, into chunks of up to
+  chunk_size characters
+- records each chunk's heading path ("Title > Section > Subsection"), its
+  ordinal in the document and its top-level section, so search hits can
+  be traced, and expanded, to their neighbors and enclosing section
+
+Chunks do not overlap; the heading path is prepended to the text that is
+embedded instead, so a chunk taken from the middle of a section keeps its
+context.
+"""
+
+import dataclasses
+import re
+from pathlib import PurePosixPath
+
+# Columns the markdown chunker adds to every row
+COLUMNS = ["title", "heading_path", "chunk_index", "section_index"]
+
+_FRONT_MATTER = re.compile(r"\A---[ \t]*\n(.*?)\n---[ \t]*(?:\n|\Z)", re.S)
+_FENCE = re.compile(r"^\s*(`{3,}|~{3,})")
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+# Explicit heading anchors: ## Title {#anchor}
+_ANCHOR = re.compile(r"\s*\{#[^}]*\}\s*$")
+_MDX_IMPORT = re.compile(r"^\s*(import|export)\s")
+_ADMONITION = re.compile(r"^\s*:::\s*(\w+)?\s*(.*)$")
+# Capitalized JSX components only; lowercase tags are plain HTML
+_COMPONENT_TAG = re.compile(r"</?[A-Z][\w.]*(?:\s[^<>]*)?/?>")
+_COMMENT = re.compile(r"<!--.*?-->|\{/\*.*?\*/\}", re.S)
+
+
+@dataclasses.dataclass
+class Block:
+    kind: str  # heading, code, table or text
+    text: str
+    start: int
+    end: int
+    level: int = 0
+    # (start, end) in the source of each line of `text`
+    spans: list[tuple[int, int]] = dataclasses.field(default_factory=list, repr=False)
+
+
+@dataclasses.dataclass
+class Chunk:
+    text: str
+    start: int
+    end: int
+    title: str
+    heading_path: str
+    chunk_index: int
+    section_index: int
+
+    @property
+    def embed_text(self) -> str:
+        """Text to embed: the heading path gives mid-section chunks their context."""
+        return f"{self.heading_path}\n\n{self.text}" if self.heading_path else self.text
+
+
+def parse_front_matter(content: str) -> tuple[dict[str, str], int]:
+    """Flat `key: value` pairs of the front matter, and the offset where the body starts."""
+    m = _FRONT_MATTER.match(content)
+    if not m:
+        return {}, 0
+    meta = {}
+    for line in m.group(1).splitlines():
+        key, sep, value = line.partition(":")
+        if sep and key.strip() and not key.startswith((" ", "\t", "-")):
+            meta[key.strip()] = value.strip().strip("'\"")
+    return meta, m.end()
+
+
+def _clean_mdx(line: str) -> str | None:
+    """Line without MDX syntax, or None when nothing is left of it."""
+    if _MDX_IMPORT.match(line):
+        return None
+    m = _ADMONITION.match(line)
+    if m:
+        # ":::tip Title" keeps its title; bare fences disappear
+        return m.group(2).strip() or None
+    cleaned = _COMPONENT_TAG.sub("", line)
+    if cleaned.strip() == "" and line.strip() != "":
+        return None
+    return cleaned
+
+
+def parse_blocks(content: str, body_start: int = 0) -> list[Block]:
+    """Headings, code blocks, tables and paragraphs, with offsets into `content`."""
+    # Comments may span lines; blank them out keeping every offset in place
+    text = _COMMENT.sub(lambda m: re.sub(r"[^\n]", " ", m.group(0)), content)
+    blocks: list[Block] = []
+    pending: list[str] = []
+    pending_spans: list[tuple[int, int]] = []
+    pending_kind = ""
+    pending_start = pending_end = 0
+    fence = ""
+
+    def flush() -> None:
+        nonlocal pending, pending_spans, pending_kind
+        if pending and "".join(pending).strip():
+            block_text = "\n".join(pending).strip("\n")
+            # Only trailing blank lines (of an unterminated fence) are stripped
+            spans = pending_spans[:block_text.count("\n") + 1]
+            blocks.append(Block(pending_kind, block_text, pending_start, pending_end, spans=spans))
+        pending, pending_spans, pending_kind = [], [], ""
+
+    offset = body_start
+    for raw in text[body_start:].splitlines(keepends=True):
+        line_start, offset = offset, offset + len(raw)
+        line = raw.rstrip("\n")
+        line_end = line_start + len(line)
+
+        if fence:
+            pending.append(line)
+            pending_spans.append((line_start, line_end))
+            pending_end = line_end
+            m = _FENCE.match(line)
+            if m and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence) and not line.strip()[len(m.group(1)):]:
+                fence = ""
+                flush()
+            continue
+        m = _FENCE.match(line)
+        if m:
+            flush()
+            fence = m.group(1)
+            pending, pending_kind, pending_start, pending_end = [line], "code", line_start, line_end
+            pending_spans = [(line_start, line_end)]
+            continue
+        m = _HEADING.match(line)
+        if m:
+            flush()
+            title = _ANCHOR.sub("", _COMPONENT_TAG.sub("", m.group(2))).strip()
+            blocks.append(Block("heading", f"{m.group(1)} {title}", line_start, line_end, len(m.group(1))))
+            continue
+        if not line.strip():
+            flush()
+            continue
+        kind = "table" if line.lstrip().startswith("|") else "text"
+        if pending and pending_kind != kind:
+            flush()
+        cleaned = line if kind == "table" else _clean_mdx(line)
+        if cleaned is None:
+            continue
+        if not pending:
+            pending_kind, pending_start = kind, line_start
+        pending.append(cleaned)
+        pending_spans.append((line_start, line_end))
+        pending_end = line_end
+    # An unterminated fence runs to the end of the document
+    flush()
+    return blocks
+
+
+def _split_block(block: Block, max_size: int) -> list[Block]:
+    """
+    Pieces of an oversized block at line boundaries (prose also between
+    words); table and code pieces stay valid on their own. Each piece
+    gets the offsets of its own lines; the first and last also cover the
+    table header or code fences.
+    """
+    lines = block.text.split("\n")
+    spans = block.spans if len(block.spans) == len(lines) else [(block.start, block.end)] * len(lines)
+    items = list(zip(lines, spans))
+    if block.kind == "text":
+        items = [wrapped for item in items for wrapped in _wrap_span(*item, max_size)]
+    head: list[str] = []
+    tail: list[str] = []
+    if block.kind == "table" and len(items) > 2:
+        head, items = [line for line, _ in items[:2]], items[2:]
+    elif block.kind == "code" and len(items) > 2:
+        head, items = [items[0][0]], items[1:]
+        if _FENCE.match(items[-1][0]):
+            tail, items = [items[-1][0]], items[:-1]
+    pieces, current, size = [], [], 0
+    base = sum(len(line) + 1 for line in head + tail)
+    for line, span in items:
+        if current and base + size + len(line) + 1 > max_size:
+            pieces.append(current)
+            current, size = [], 0
+        current.append((line, span))
+        size += len(line) + 1
+    if current:
+        pieces.append(current)
+    if block.kind == "code" and not tail:
+        tail = [head[0].strip()[:3]] if head else []
+    return [
+        Block(
+            block.kind,
+            "\n".join(head + [line for line, _ in piece] + tail),
+            block.start if i == 0 else piece[0][1][0],
+            block.end if i == len(pieces) - 1 else piece[-1][1][1],
+            block.level,
+            spans=[span for _, span in piece],
+        )
+        for i, piece in enumerate(pieces)
+    ]
+
+
+def _wrap_span(line: str, span: tuple[int, int], width: int) -> list[tuple[str, tuple[int, int]]]:
+    """_wrap, with each piece's offsets (MDX-cleaned lines clamped to the source line)."""
+    start, end = span
+    wrapped, pos = [], 0
+    for piece in _wrap(line, width):
+        pos = line.find(piece, pos)
+        wrapped.append((piece, (min(start + pos, end), min(start + pos + len(piece), end))))
+        pos += len(piece)
+    return wrapped
+
+
+def _wrap(line: str, width: int) -> list[str]:
+    if len(line) <= width:
+        return [line]
+    pieces, current = [], ""
+    for word in line.split(" "):
+        if current and len(current) + len(word) + 1 > width:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    return pieces + [current]
+
+
+def _size(blocks: list[Block]) -> int:
+    return sum(len(b.text) + 2 for b in blocks)
+
+
+def chunk_markdown(
+    content: str,
+    chunk_size: int = 1000,
+    max_block_size: int | None = None,
+    title: str | None = None,
+) -> list[Chunk]:
+    """Chunks of a markdown/MDX document; see the module docstring."""
+    meta, body_start = parse_front_matter(content)
+    title = meta.get("title") or title or ""
+    max_block_size = max_block_size or 4 * chunk_size
+
+    # Sections: a heading with the blocks up to the next heading
+    sections: list[tuple[tuple[tuple[int, str], ...], int, list[Block]]] = []
+    path: list[tuple[int, str]] = []
+    top = 0
+    current: list[Block] = []
+    for block in parse_blocks(content, body_start):
+        if block.kind == "heading":
+            if current:
+                sections.append((tuple(path), top, current))
+            if block.level <= 2 and (current or sections):
+                top += 1
+            path = [(lvl, t) for lvl, t in path if lvl < block.level]
+            path.append((block.level, block.text.lstrip("#").strip()))
+            current = [block]
+        else:
+            # Code and tables stay whole up to max_block_size; prose is split at chunk_size
+            limit = max_block_size if block.kind in ("code", "table") else chunk_size
+            if len(block.text) > limit:
+                current.extend(_split_block(block, limit))
+            else:
+                current.append(block)
+    if current:
+        sections.append((tuple(path), top, current))
+
+    def heading_path(section_path: tuple[tuple[int, str], ...]) -> str:
+        # An H1 is the document title already
+        parts = [t for _, t in section_path]
+        if title and not (section_path and section_path[0][0] == 1):
+            parts.insert(0, title)
+        return " > ".join(parts)
+
+    chunks: list[Chunk] = []
+
+    def emit(blocks: list[Block], section_path: tuple, section_index: int) -> None:
+        chunks.append(Chunk(
+            text="\n\n".join(b.text for b in blocks),
+            start=blocks[0].start,
+            end=blocks[-1].end,
+            title=title,
+            heading_path=heading_path(section_path),
+            chunk_index=len(chunks),
+            section_index=section_index,
+        ))
+
+    pack: list[Block] = []
+    pack_path: tuple = ()
+    pack_section = 0
+    for section_path, section_index, blocks in sections:
+        # Subsections join the chunk of their parent section while it has room
+        nested = pack and section_path[:len(pack_path)] == pack_path and len(section_path) > len(pack_path)
+        if pack and not (nested and section_index == pack_section and _size(pack) + _size(blocks) <= chunk_size):
+            emit(pack, pack_path, pack_section)
+            pack = []
+        if not pack:
+            pack_path, pack_section = section_path, section_index
+        for block in blocks:
+            # Blocks are never split across chunks; an oversized one gets a chunk of its own
+            if pack and _size(pack) + _size([block]) > chunk_size and (pack[-1].kind != "heading" or len(pack) > 1):
+                emit(pack, pack_path, pack_section)
+                pack = []
+                # Later parts of a section continue under its own heading path
+                pack_path = section_path
+            pack.append(block)
+    if pack:
+        emit(pack, pack_path, pack_section)
+    return chunks
+
+
+def configured() -> bool:
+    """Whether the index is built with [docs] chunker = markdown (so rows carry COLUMNS)."""
+    from conf import settings
+    return settings.docs.get("chunker", "recursive").strip().lower() == "markdown"
+
+
+def fallback_title(filename: str) -> str:
+    """Document title when there is no front matter title: the file name, humanized."""
+    stem = PurePosixPath(filename).stem
+    return re.sub(r"[-_]+", " ", stem).strip().capitalize()
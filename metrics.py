@@ -0,0 +1,326 @@
+"""
+Lightweight Prometheus metrics and per-request tracing.
+
+Provides a dependency-free metrics registry (counters and histograms with
+labels) rendered in the Prometheus text exposition format, plus request
+traces built from timed spans:
+
+    with metrics.trace("chat") as tr:
+        with metrics.span("embedding"):
+            ...
+        metrics.record_llm_tokens("generation", resp)
+    logger.info("trace %s", tr.to_json())
+
+Every span is observed in the `rag_stage_duration_seconds` histogram. The
+RAG service exposes the registry on /metrics; processes without an HTTP
+server (the indexer) can call start_metrics_server().
+"""
+
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket counts..., sum, count]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels: Any) -> float:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[-1] if state else 0.0
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, state in items:
+            for i, bound in enumerate(self.buckets):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(state[i])}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    """Holds metrics by name; registering an existing name returns it."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, help: str, labelnames: tuple[str, ...], **kwargs):
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                if not isinstance(existing, cls):
+                    raise ValueError(f"Metric {name} already registered as {existing.kind}")
+                return existing
+            metric = cls(name, help, labelnames, **kwargs)
+            self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_duration_seconds", "Duration of RAG pipeline stages.", ("stage",)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_request_duration_seconds", "End-to-end RAG request duration.", ("endpoint",)
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    "rag_requests_total", "RAG requests by endpoint and outcome.", ("endpoint", "status")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "rag_llm_tokens_total", "LLM tokens used per stage.", ("stage", "kind")
+)
+
+
+def render() -> str:
+    """Render the global registry in Prometheus text format."""
+    return REGISTRY.render()
+
+
+# =============================================================================
+# Request tracing
+# =============================================================================
+
+class Trace:
+    """Spans and token counts collected for one request."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration: float | None = None
+        self.spans: list[dict[str, Any]] = []
+        self.tokens: dict[str, dict[str, int]] = {}
+        self.status = "ok"
+
+    def add_span(self, stage: str, seconds: float, **attrs: Any) -> None:
+        self.spans.append({"stage": stage, "ms": round(seconds * 1000.0, 3), **attrs})
+
+    def add_tokens(self, stage: str, prompt: int, completion: int) -> None:
+        t = self.tokens.setdefault(stage, {"prompt": 0, "completion": 0})
+        t["prompt"] += prompt
+        t["completion"] += completion
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "request": self.name,
+            "status": self.status,
+            "total_ms": round((self.duration or 0.0) * 1000.0, 3),
+            "spans": self.spans,
+            "tokens": self.tokens,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+
+_current_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "rag_current_trace", default=None
+)
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def trace(endpoint: str) -> Iterator[Trace]:
+    """Start a request trace; records request duration and outcome."""
+    tr = Trace(endpoint)
+    token = _current_trace.set(tr)
+    try:
+        yield tr
+    except BaseException:
+        tr.status = "error"
+        raise
+    finally:
+        tr.duration = time.perf_counter() - tr.start
+        _current_trace.reset(token)
+        REQUEST_SECONDS.observe(tr.duration, endpoint=endpoint)
+        REQUESTS_TOTAL.inc(endpoint=endpoint, status=tr.status)
+
+
+@contextlib.contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[dict[str, Any]]:
+    """Time a pipeline stage; extra attributes can be added to the yielded dict."""
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        tr = _current_trace.get()
+        if tr is not None:
+            tr.add_span(stage, elapsed, **attrs)
+
+
+def token_usage(resp: Any) -> tuple[int, int]:
+    """Extract (prompt, completion) token counts from a LangChain message."""
+    usage = getattr(resp, "usage_metadata", None)
+    if usage:
+        return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    meta = getattr(resp, "response_metadata", None) or {}
+    usage = meta.get("token_usage") or meta.get("usage") or {}
+    return int(usage.get("prompt_tokens", 0) or 0), int(usage.get("completion_tokens", 0) or 0)
+
+
+def record_llm_tokens(stage: str, resp: Any) -> tuple[int, int]:
+    """Count LLM tokens for a stage in the registry and the current trace."""
+    prompt, completion = token_usage(resp)
+    LLM_TOKENS.inc(prompt, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(completion, stage=stage, kind="completion")
+    tr = _current_trace.get()
+    if tr is not None:
+        tr.add_tokens(stage, prompt, completion)
+    return prompt, completion
+
+
+# =============================================================================
+# Standalone exporter
+# =============================================================================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_exporter: ThreadingHTTPServer | None = None
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread (idempotent per process)."""
+    global _exporter
+    if _exporter is None:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        _exporter = server
+    return _exporter
@@ -0,0 +1,275 @@
+"""
+Multi-query and HyDE retrieval with reciprocal rank fusion.
+
+One rewritten query often misses half of a multi-part question ("create
+a partitioned table and load it from Kafka"). With [retrieval] strategy
+set, the question is searched from several angles:
+
+- multi_query  one LLM call rewrites the question (resolving the history,
+               like query_augment) and splits it into up to
+               `multi_query_count` focused sub-queries
+- hyde         the rewritten question plus a short hypothetical passage
+               answering it, which lands closer to the documentation
+               text in the embedding space than a question does
+- multi_hyde   both; the two LLM calls run concurrently
+
+All queries are embedded in one batched call and searched concurrently.
+The ranked lists are fused with RRF (a row scores the sum of
+1 / (rrf_k + rank) over the lists it is in) and the best top_k rows are
+expanded like a single search. At most `fanout_concurrency` searches of
+a question run at once, so one fan-out cannot take the whole shared pool.
+Searches still running after `fanout_budget_ms` are dropped (cancelled if
+they have not started) once the rewritten question's own search has
+finished, so a slow sub-query costs at most the budget; that search is
+waited for up to the request deadline. If the LLM call fails, retrieval
+falls back to the single-query path.
+"""
+
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait
+from typing import TYPE_CHECKING, Any, Callable
+
+from conf import settings
+from i18n import get_message, route_language
+import deadlines
+import metrics
+from admission import throttle
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("single", "multi_query", "hyde", "multi_hyde")
+
+# Numbering and bullets the LLM may put in front of each sub-query
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)、])\s*")
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def strategy() -> str:
+    """The configured [retrieval] strategy."""
+    value = settings.retrieval.get('strategy', 'single').strip().lower()
+    if value not in STRATEGIES:
+        raise ValueError(f"Unsupported retrieval.strategy: {value}. Use {', '.join(STRATEGIES)}.")
+    return value
+
+
+def _pool() -> ThreadPoolExecutor:
+    # Shared by all requests; sized for the searches of a few concurrent fan-outs
+    global _executor
+    if _executor is None:
+        workers = int(settings.retrieval.get('fanout_workers', 16))
+        _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="rag-fanout")
+    return _executor
+
+
+def _submit(fn: Callable, *args: Any):
+    # Run in a copy of the caller's context so spans land in its request trace
+    return _pool().submit(contextvars.copy_context().run, fn, *args)
+
+
+def _submit_capped(fn: Callable, calls: list[tuple], cap: int) -> list[Future]:
+    """
+    Futures of fn(*args) for each args in `calls`, at most `cap` running on
+    the shared pool at once; the others start as earlier ones finish, and
+    can be cancelled until then.
+    """
+    futures: list[Future] = [Future() for _ in calls]
+    queued = deque(range(len(calls)))
+    lock = threading.Lock()
+    context = contextvars.copy_context()
+
+    def start_next() -> None:
+        with lock:
+            while queued:
+                i = queued.popleft()
+                if futures[i].set_running_or_notify_cancel():
+                    break
+            else:
+                return
+        # Callbacks run in pool threads: each search gets its own copy of the caller's context
+        inner = _pool().submit(context.copy().run, fn, *calls[i])
+        inner.add_done_callback(lambda f, outer=futures[i]: finish(f, outer))
+
+    def finish(inner: Future, outer: Future) -> None:
+        if inner.exception() is not None:
+            outer.set_exception(inner.exception())
+        else:
+            outer.set_result(inner.result())
+        start_next()
+
+    for _ in range(min(max(1, cap), len(calls))):
+        start_next()
+    return futures
+
+
+def _history_text(history: list | None) -> str:
+    return "\n".join(f"{t.get('role', 'user')}: {t.get('content', '')}" for t in (history or [])[-5:])
+
+
+def _invoke(stage: str, prompt: str) -> str:
+    from rag_lib import get_llm, invoke_llm
+
+    throttle("llm")
+    with metrics.span(stage):
+        resp = invoke_llm(get_llm(), prompt, stage)
+    metrics.record_llm_tokens(stage, resp)
+    return (resp.content if hasattr(resp, "content") else str(resp)).strip()
+
+
+def parse_queries(text: str, limit: int) -> list[str]:
+    """Distinct non-empty lines of an LLM answer, without list markers; at most `limit`."""
+    queries: list[str] = []
+    for line in text.splitlines():
+        line = _LIST_MARKER.sub("", line).strip().strip('"')
+        if line and line not in queries:
+            queries.append(line)
+    return queries[:limit]
+
+
+def generate_queries(query: str, history: list | None, mode: str) -> list[str]:
+    """
+    Queries to search for `query`: the rewritten question first, then the
+    sub-queries and/or hypothetical passage of the strategy.
+    """
+    from rag_lib import query_augment
+
+    count = int(settings.retrieval.get('multi_query_count', 3))
+    history_text = _history_text(history)
+    tasks = {}
+    if mode in ('multi_query', 'multi_hyde'):
+        # The first line is the standalone question, so no separate augmentation call
+        tasks['multi'] = _submit(
+            _invoke, "multi_query", get_message("multi_query_prompt", count, history_text, query)
+        )
+    else:
+        tasks['rewrite'] = _submit(query_augment, query, history)
+    if mode in ('hyde', 'multi_hyde'):
+        tasks['hyde'] = _submit(_invoke, "hyde", get_message("hyde_prompt", history_text, query))
+
+    queries: list[str] = []
+    if 'multi' in tasks:
+        queries = parse_queries(tasks['multi'].result(), count + 1)
+    else:
+        queries = [tasks['rewrite'].result()]
+    if not queries:
+        queries = [query]
+    if 'hyde' in tasks:
+        try:
+            passage = tasks['hyde'].result()
+            if passage:
+                queries.append(passage)
+        except Exception as e:
+            # The rewritten question alone still retrieves
+            logger.warning("HyDE generation failed, searching without it: %s", e)
+    return queries
+
+
+def _primary_result(future: Future) -> "pd.DataFrame":
+    """The rewritten question's search results, waited for up to the request deadline."""
+    request = deadlines.current()
+    try:
+        return future.result(timeout=None if request is None else deadlines.timeout(request.remaining(), "fanout"))
+    except FuturesTimeout:
+        deadlines.DEADLINE_EVENTS.inc(stage="fanout", event="exceeded")
+        raise deadlines.DeadlineExceeded("fanout") from None
+
+
+def rrf_fuse(results: list["pd.DataFrame"], top_k: int, k: int = 60) -> "pd.DataFrame":
+    """
+    Reciprocal rank fusion of ranked search results, by `_key`. Rows keep
+    the columns of their first occurrence (with the smallest distance seen)
+    and gain `rrf_score`; the result is ordered by it.
+    """
+    import pandas as pd
+
+    scores: dict[str, float] = {}
+    rows: dict[str, dict[str, Any]] = {}
+    columns: list[str] = []
+    for df in results:
+        for col in df.columns:
+            if col not in columns:
+                columns.append(col)
+        for rank, row in enumerate(df.to_dict("records"), start=1):
+            key = str(row["_key"])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            first = rows.setdefault(key, row)
+            if "distance" in row and row["distance"] is not None and row["distance"] < first.get("distance", float("inf")):
+                first["distance"] = row["distance"]
+    best = sorted(scores, key=lambda key: -scores[key])[:top_k]
+    records = [{**rows[key], "rrf_score": round(scores[key], 6)} for key in best]
+    return pd.DataFrame(records, columns=columns + ["rrf_score"])
+
+
+def retrieve(
+    query: str,
+    history: list | None = None,
+    top_k: int = 5,
+    filters: dict | None = None,
+    fetch_cache=None,
+) -> tuple[str, "pd.DataFrame"]:
+    """
+    Context for `query` per [retrieval] strategy: (rewritten question, rows).
+    The single strategy is query_augment + retrieve_context.
+    """
+    from rag_lib import embed_queries, expand_context, query_augment, retrieve_context, search_by_vector
+
+    mode = strategy()
+    # Near the deadline a single query is searched
+    if mode != 'single' and not deadlines.allows("fanout"):
+        mode = 'single'
+    if mode != 'single':
+        try:
+            queries = generate_queries(query, history, mode)
+        except Exception as e:
+            logger.warning("Query generation for %s failed, using a single query: %s", mode, e)
+            mode = 'single'
+    if mode == 'single':
+        rewritten = query_augment(query, history)
+        return rewritten, retrieve_context(rewritten, top_k, filters, fetch_cache)
+
+    conf = settings.retrieval
+    budget = deadlines.timeout(float(conf.get('fanout_budget_ms', 1500)) / 1000.0, "fanout")
+    rrf_k = int(conf.get('rrf_k', 60))
+    # Each list goes a bit deeper than top_k so fusion can promote rows found by several queries
+    fetch_k = max(top_k, int(conf.get('fanout_top_k', top_k * 2)))
+    lang = route_language(query)
+
+    cap = int(conf.get('fanout_concurrency', 4))
+
+    with metrics.span("fanout", queries=len(queries)) as attrs:
+        vectors = embed_queries(queries)
+        futures = _submit_capped(search_by_vector, [(vec, fetch_k, filters, lang) for vec in vectors], cap)
+        deadline = time.perf_counter() + budget
+        try:
+            primary = _primary_result(futures[0])
+        except BaseException:
+            # Sub-query searches not started yet are not run for a failed request
+            for fut in futures[1:]:
+                fut.cancel()
+            raise
+        remaining = [f for f in futures[1:] if not f.done()]
+        if remaining:
+            wait(remaining, timeout=max(0.0, deadline - time.perf_counter()))
+        results = [primary]
+        failed = dropped = 0
+        for fut in futures[1:]:
+            if not fut.done():
+                # Not started yet: cancelled; running: left to finish, its result ignored
+                fut.cancel()
+                dropped += 1
+            elif fut.exception() is not None:
+                failed += 1
+                logger.warning("Sub-query search failed: %s", fut.exception())
+            else:
+                results.append(fut.result())
+        attrs.update(searched=len(results), dropped=dropped, failed=failed)
+        fused = rrf_fuse(results, top_k, rrf_k)
+    return queries[0], expand_context(fused, lang, fetch_cache)
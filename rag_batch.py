@@ -0,0 +1,244 @@
+"""
+Batch question answering for offline evaluation and bulk runs.
+
+Questions are read as JSONL (one {"id": ..., "query": ...} object per
+line; "question" is accepted as an alias for "query", and an optional
+"filters" object scopes the search like /api/chat). They are processed
+in windows:
+
+1. embed the whole window in one embedding call
+2. run the Doris ANN searches concurrently
+3. generate answers on a bounded LLM worker pool, overlapping with the
+   embedding and search of the next window
+
+Results are yielded as they complete, so callers can stream them out as
+JSONL. The output file doubles as the checkpoint: ids already present in
+it are skipped when a run is resumed.
+
+Used by the /api/batch endpoint of rag_service and `rag_cli.py --batch`.
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import IO, Any, Iterable, Iterator
+
+from conf import settings
+from i18n import route_language
+from rag_lib import (
+    build_prompt,
+    embed_queries,
+    expand_context,
+    generate_answer,
+    get_llm,
+    query_augment,
+    search_by_vector,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def batch_options(**overrides: Any) -> dict[str, Any]:
+    """Batch settings from conf.ini [batch], with non-None overrides applied."""
+    conf = settings.batch
+    opts = {
+        "top_k": int(conf.get("top_k", 5)),
+        "embed_batch_size": int(conf.get("embed_batch_size", 64)),
+        "search_concurrency": int(conf.get("search_concurrency", 8)),
+        "llm_concurrency": int(conf.get("llm_concurrency", 4)),
+        "augment": conf.getboolean("augment", False),
+        "generate": conf.getboolean("generate", True),
+    }
+    opts.update({k: v for k, v in overrides.items() if v is not None})
+    return opts
+
+
+def parse_questions(lines: Iterable[str | bytes]) -> Iterator[dict[str, Any]]:
+    """Parse JSONL questions; ids default to the 1-based line number."""
+    for lineno, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON on line {lineno}: {e}")
+        if isinstance(item, str):
+            item = {"query": item}
+        elif not isinstance(item, dict):
+            raise ValueError(f"Line {lineno} is not a JSON object or string")
+        query = item.get("query") or item.get("question")
+        if not query:
+            raise ValueError(f"Line {lineno} has no 'query' field")
+        item["query"] = str(query).strip()
+        item["id"] = str(item.get("id", lineno))
+        yield item
+
+
+def completed_ids(output_path: str) -> set[str]:
+    """Ids of successfully answered questions in an existing output file."""
+    done: set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # A partially written last line from an interrupted run
+                continue
+            if "error" not in rec and "id" in rec:
+                done.add(str(rec["id"]))
+    return done
+
+
+def _windows(items: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    window: list[dict] = []
+    for item in items:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def _sources_only(item: dict, context_df) -> dict[str, Any]:
+    _, sources = build_prompt(item["query"], [], context_df)
+    return {"id": item["id"], "query": item["query"], "sources": sources}
+
+
+def _answer(llm, item: dict, context_df, started: float) -> dict[str, Any]:
+    prompt, sources = build_prompt(item["query"], [], context_df)
+    answer = generate_answer(llm, prompt)
+    return {
+        "id": item["id"],
+        "query": item["query"],
+        "answer": answer,
+        "sources": sources,
+        "latency_ms": round((time.perf_counter() - started) * 1000.0, 1),
+    }
+
+
+def _error(item: dict, exc: BaseException) -> dict[str, Any]:
+    return {"id": item["id"], "query": item["query"], "error": f"{type(exc).__name__}: {exc}"}
+
+
+def answer_batch(
+    items: Iterable[dict],
+    top_k: int = 5,
+    embed_batch_size: int = 64,
+    search_concurrency: int = 8,
+    llm_concurrency: int = 4,
+    augment: bool = False,
+    generate: bool = True,
+    skip_ids: set[str] | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Answer questions in bulk, yielding one result dict per question in
+    completion order. Failures are reported per question as {"error": ...}
+    and do not stop the batch.
+    """
+    from context_expansion import FetchCache
+
+    skip_ids = skip_ids or set()
+    llm = get_llm() if (generate or augment) else None
+    # Bound in-flight generations so memory stays flat on large inputs
+    max_pending = max(1, llm_concurrency) * 4
+
+    with ThreadPoolExecutor(max_workers=max(1, search_concurrency)) as search_pool, \
+            ThreadPoolExecutor(max_workers=max(1, llm_concurrency)) as llm_pool:
+        pending: set[Future] = set()
+
+        def _drain(limit: int) -> Iterator[dict[str, Any]]:
+            nonlocal pending
+            while len(pending) > limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield fut.result()
+
+        todo = (item for item in items if item["id"] not in skip_ids)
+        for window in _windows(todo, max(1, embed_batch_size)):
+            started = time.perf_counter()
+            queries = [item["query"] for item in window]
+            if augment:
+                queries = list(llm_pool.map(_safe_augment, queries))
+            try:
+                vectors = embed_queries(queries)
+            except Exception as e:
+                logger.exception("Embedding failed for a window of %d questions", len(window))
+                for item in window:
+                    yield _error(item, e)
+                continue
+
+            # Questions of a window often hit the same files; their expansions share fetches
+            fetch_cache = FetchCache()
+            searches = [
+                search_pool.submit(_search, vec, top_k, item.get("filters"), route_language(query), fetch_cache)
+                for item, vec, query in zip(window, vectors, queries)
+            ]
+            for item, search in zip(window, searches):
+                try:
+                    context_df = search.result()
+                except Exception as e:
+                    yield _error(item, e)
+                    continue
+                if not generate:
+                    yield _sources_only(item, context_df)
+                    continue
+                pending.add(llm_pool.submit(_safe_answer, llm, item, context_df, started))
+                yield from _drain(max_pending)
+
+        yield from _drain(0)
+
+
+def _search(query_vec, top_k: int, filters, lang, fetch_cache):
+    return expand_context(search_by_vector(query_vec, top_k, filters, lang), lang, fetch_cache)
+
+
+def _safe_augment(query: str) -> str:
+    try:
+        return query_augment(query, [])
+    except Exception as e:
+        logger.warning("Query augmentation failed, searching the raw query: %s", e)
+        return query
+
+
+def _safe_answer(llm, item: dict, context_df, started: float) -> dict[str, Any]:
+    try:
+        return _answer(llm, item, context_df, started)
+    except Exception as e:
+        logger.warning("Generation failed for question %s: %s", item["id"], e)
+        return _error(item, e)
+
+
+def run_batch_file(input_path: str, output_path: str, **options: Any) -> dict[str, int]:
+    """
+    Answer every question in input_path, appending results to output_path.
+    Already answered ids in output_path are skipped, so an interrupted run
+    can simply be restarted. Returns counts of answered, failed and skipped.
+    """
+    opts = batch_options(**options)
+    done = completed_ids(output_path)
+    counts = {"answered": 0, "failed": 0, "skipped": len(done)}
+    started = time.time()
+    with open(input_path, encoding="utf-8") as fin, open(output_path, "a", encoding="utf-8") as fout:
+        for rec in answer_batch(parse_questions(fin), skip_ids=done, **opts):
+            _write_record(fout, rec)
+            counts["failed" if "error" in rec else "answered"] += 1
+            total = counts["answered"] + counts["failed"]
+            if total % 100 == 0:
+                logger.info(
+                    "Batch progress: %d processed (%.1f q/s)", total, total / (time.time() - started)
+                )
+    return counts
+
+
+def _write_record(out: IO[str], rec: dict[str, Any]) -> None:
+    out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    # Flush per record: the output file is the resume checkpoint
+    out.flush()
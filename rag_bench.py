@@ -0,0 +1,441 @@
+"""
+Offline load-testing and latency benchmark for the Doris RAG stack.
+
+Drives three targets against local stand-ins, so no network, LLM provider or
+Doris cluster is needed:
+- chat:     POST /api/chat on an in-process uvicorn running rag_service
+- retrieve: rag_lib.retrieve_context (embedding + ANN search)
+- mutate:   DorisTargetConnector.mutate (Stream Load ingest)
+
+The stand-ins are stub_openai.StubOpenAIServer (embeddings and chat
+completions) and fake_doris.FakeDorisServer (Stream Load and HTTP SQL). A
+generated conf.ini points the libraries at them through DORIS_RAG_CONF.
+
+For every target and concurrency level the report contains p50/p95/p99
+latency, QPS of successful requests, failed requests per second, rows/s
+and bytes/s. Results can be written as JSON and
+compared against a previous run to fail on regressions.
+
+Usage:
+    python rag_bench.py --targets chat,retrieve,mutate --concurrency 1,4,16 \\
+        --requests 200 --llm-latency-ms 150 --embed-latency-ms 20 \\
+        --doris-latency-ms 5 --output bench.json --baseline last_bench.json
+"""
+
+import argparse
+import dataclasses
+import json
+import math
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from fake_doris import FakeDorisServer, parse_fault
+from stub_openai import StubOpenAIServer, fake_embedding
+
+BENCH_DB = "rag_bench"
+BENCH_TABLE = "document_embeddings"
+BENCH_LOAD_TABLE = "bench_load"
+
+# Work function result: (rows, bytes) processed by one operation
+WorkFn = Callable[[int], tuple[int, int]]
+
+
+# =============================================================================
+# Load generation and statistics
+# =============================================================================
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+@dataclasses.dataclass
+class BenchResult:
+    target: str
+    concurrency: int
+    requests: int
+    errors: int
+    duration_s: float
+    latencies_ms: list[float]
+    rows: int
+    bytes: int
+
+    def summary(self) -> dict[str, Any]:
+        lat = sorted(self.latencies_ms)
+        dur = self.duration_s or 1e-9
+        return {
+            "target": self.target,
+            "concurrency": self.concurrency,
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50_ms": round(percentile(lat, 50), 3),
+            "p95_ms": round(percentile(lat, 95), 3),
+            "p99_ms": round(percentile(lat, 99), 3),
+            # Failures are reported apart, so they never pass for throughput
+            "qps": round((self.requests - self.errors) / dur, 2),
+            "errors_per_s": round(self.errors / dur, 2),
+            "rows_per_s": round(self.rows / dur, 2),
+            "bytes_per_s": round(self.bytes / dur, 2),
+        }
+
+
+def run_load(target: str, fn: WorkFn, concurrency: int, total: int, warmup: int = 0) -> BenchResult:
+    """Call fn `total` times from `concurrency` threads and collect latencies."""
+    for i in range(warmup):
+        fn(-1 - i)
+
+    latencies: list[float] = []
+    lock = threading.Lock()
+    counters = {"errors": 0, "rows": 0, "bytes": 0}
+
+    def _one(i: int) -> None:
+        t0 = time.perf_counter()
+        try:
+            rows, nbytes = fn(i)
+        except Exception as e:  # count and keep going; errors are part of the report
+            with lock:
+                counters["errors"] += 1
+            print(f"[{target}] request {i} failed: {e}", file=sys.stderr)
+            return
+        elapsed = (time.perf_counter() - t0) * 1000.0
+        with lock:
+            latencies.append(elapsed)
+            counters["rows"] += rows
+            counters["bytes"] += nbytes
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(_one, range(total)))
+    duration = time.perf_counter() - start
+
+    return BenchResult(
+        target=target,
+        concurrency=concurrency,
+        requests=total,
+        errors=counters["errors"],
+        duration_s=duration,
+        latencies_ms=latencies,
+        rows=counters["rows"],
+        bytes=counters["bytes"],
+    )
+
+
+# =============================================================================
+# Environment setup
+# =============================================================================
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_bench_conf(path: str, llm: StubOpenAIServer, doris: FakeDorisServer, embed_dim: int) -> None:
+    """Write a conf.ini pointing every client at the local stand-ins."""
+    host = doris.server_address[0]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"""[doris]
+host = {host}
+query_port = 0
+http_port = {doris.http_port}
+user = root
+password =
+db_name = {BENCH_DB}
+table_name = {BENCH_TABLE}
+query_protocol = http
+
+[embedding]
+type = openai
+model = stub-embedding
+embed_dim = {embed_dim}
+base_url = {llm.base_url}
+api_key = stub
+check_ctx_length = false
+
+[llm]
+type = openai
+model = stub-llm
+api_key = stub
+base_url = {llm.base_url}
+temperature = 0.2
+
+[docs]
+doc_root = .
+
+[app]
+language = en
+""")
+
+
+def seed_corpus(doris: FakeDorisServer, num_rows: int, embed_dim: int) -> None:
+    """Fill the fake Doris table with synthetic chunks to search against."""
+    rows = []
+    for i in range(num_rows):
+        text = f"Synthetic Doris document chunk {i} about tables, loads and queries."
+        rows.append({
+            "_key": str(uuid.uuid4()),
+            "filename": f"docs/bench/page_{i // 10}.md",
+            "location": [i * 500, i * 500 + 500],
+            "text": text,
+            "embedding": fake_embedding(text, embed_dim),
+        })
+    doris.load_rows(BENCH_DB, BENCH_TABLE, rows, 0)
+
+
+# =============================================================================
+# Targets
+# =============================================================================
+
+QUESTIONS = [
+    "How do I create a table with an ANN index?",
+    "What is Stream Load and how does it handle labels?",
+    "How do I tune compaction for many small loads?",
+    "Explain the DUPLICATE KEY model.",
+    "How can I query vectors with l2_distance_approximate?",
+]
+
+
+def make_retrieve_fn(top_k: int) -> WorkFn:
+    import rag_lib
+
+    def _fn(i: int) -> tuple[int, int]:
+        df = rag_lib.retrieve_context(QUESTIONS[i % len(QUESTIONS)], top_k=top_k)
+        nbytes = sum(len(str(t).encode("utf-8")) for t in df.get("text", []))
+        return len(df), nbytes
+
+    return _fn
+
+
+class ChatServer:
+    """rag_service running on uvicorn in a background thread."""
+
+    def __init__(self):
+        import uvicorn
+        import rag_service
+
+        self.port = _free_port()
+        config = uvicorn.Config(rag_service.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "ChatServer":
+        self.thread.start()
+        deadline = time.time() + 30
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("rag_service did not start within 30s")
+            time.sleep(0.05)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def make_chat_fn(base_url: str) -> WorkFn:
+    import requests
+
+    local = threading.local()
+
+    def _fn(i: int) -> tuple[int, int]:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = json.dumps({"query": QUESTIONS[i % len(QUESTIONS)], "history": []})
+        resp = session.post(
+            f"{base_url}/api/chat",
+            data=body,
+            headers={"Content-Type": "application/json"},
+            timeout=120,
+        )
+        resp.raise_for_status()
+        return len(resp.json().get("sources", [])), len(body) + len(resp.content)
+
+    return _fn
+
+
+def make_mutate_fn(doris: FakeDorisServer, rows_per_call: int, batch_size: int, embed_dim: int) -> WorkFn:
+    from doris_target import DorisTarget, DorisTargetConnector
+
+    spec = DorisTarget(
+        fe_host=doris.server_address[0],
+        fe_http_port=doris.http_port,
+        database=BENCH_DB,
+        table=BENCH_LOAD_TABLE,
+        batch_size=batch_size,
+        auto_create_table=False,
+        # The fake FE speaks HTTP only
+        sql_protocol="http",
+    )
+    prepared = DorisTargetConnector.prepare(spec)
+    # Pre-build row values so the benchmark measures serialization and load,
+    # not synthetic data generation
+    template = [
+        {
+            "filename": f"docs/bench/page_{i // 10}.md",
+            "location": [i * 500, i * 500 + 500],
+            "text": f"Synthetic chunk {i} " * 20,
+            "embedding": fake_embedding(f"chunk {i}", embed_dim),
+        }
+        for i in range(rows_per_call)
+    ]
+
+    def _fn(i: int) -> tuple[int, int]:
+        mutations = {str(uuid.uuid4()): value for value in template}
+        DorisTargetConnector.mutate((prepared, mutations))
+        # This call's own Stream Load bodies: the server's byte counter is shared by concurrent calls
+        rows = [{"_key": k, **v} for k, v in mutations.items()]
+        nbytes = sum(
+            len(json.dumps(rows[j:j + batch_size]).encode("utf-8")) for j in range(0, len(rows), batch_size)
+        )
+        return len(mutations), nbytes
+
+    return _fn
+
+
+# =============================================================================
+# Reporting
+# =============================================================================
+
+_COLUMNS = ["target", "concurrency", "requests", "errors", "p50_ms", "p95_ms", "p99_ms",
+            "qps", "errors_per_s", "rows_per_s", "bytes_per_s"]
+
+
+def print_report(summaries: list[dict[str, Any]]) -> None:
+    widths = {c: max(len(c), *(len(str(s[c])) for s in summaries)) for c in _COLUMNS}
+    print("  ".join(c.rjust(widths[c]) for c in _COLUMNS))
+    for s in summaries:
+        print("  ".join(str(s[c]).rjust(widths[c]) for c in _COLUMNS))
+
+
+def compare_with_baseline(
+    summaries: list[dict[str, Any]], baseline: list[dict[str, Any]], max_regression: float
+) -> list[str]:
+    """Return descriptions of p95 or QPS regressions beyond max_regression."""
+    base = {(b["target"], b["concurrency"]): b for b in baseline}
+    problems = []
+    for s in summaries:
+        b = base.get((s["target"], s["concurrency"]))
+        if not b:
+            continue
+        if b["p95_ms"] > 0 and s["p95_ms"] > b["p95_ms"] * (1 + max_regression):
+            problems.append(
+                f"{s['target']}@{s['concurrency']}: p95 {b['p95_ms']}ms -> {s['p95_ms']}ms"
+            )
+        if b["qps"] > 0 and s["qps"] < b["qps"] * (1 - max_regression):
+            problems.append(
+                f"{s['target']}@{s['concurrency']}: qps {b['qps']} -> {s['qps']}"
+            )
+    return problems
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline RAG latency benchmark")
+    parser.add_argument("--targets", default="chat,retrieve,mutate",
+                        help="Comma-separated subset of chat,retrieve,mutate")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per level")
+    parser.add_argument("--warmup", type=int, default=2, help="Warm-up requests per level")
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--corpus-rows", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rows-per-mutation", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--embed-latency-ms", type=float, default=10.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=100.0)
+    parser.add_argument("--doris-latency-ms", type=float, default=2.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--doris-backends", type=int, default=0,
+                        help="Fake BEs behind the fake FE; Stream Loads are redirected to them")
+    parser.add_argument("--doris-fault", action="append", default=[], metavar="KIND:MODE[:key=value,...]",
+                        help="Inject a fake Doris fault, e.g. stream_load:drop:rate=0.05 (repeatable)")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--baseline", help="Compare against a previous --output file")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed relative p95/QPS regression against the baseline")
+    args = parser.parse_args(argv)
+
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    llm = StubOpenAIServer(
+        embed_dim=args.embed_dim,
+        embed_latency_ms=args.embed_latency_ms,
+        chat_latency_ms=args.llm_latency_ms,
+        jitter_ms=args.jitter_ms,
+    ).start()
+    faults = [parse_fault(spec) for spec in args.doris_fault]
+    doris = FakeDorisServer(
+        latency_ms=args.doris_latency_ms, jitter_ms=args.jitter_ms, backends=args.doris_backends,
+    ).start()
+    for fault in faults:
+        doris.inject(fault.kind, fault.mode, fault.rate, fault.times, fault.delay_ms)
+    seed_corpus(doris, args.corpus_rows, args.embed_dim)
+
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    conf_path = os.path.join(workdir, "conf.ini")
+    write_bench_conf(conf_path, llm, doris, args.embed_dim)
+    # Must be set before conf/rag_lib are imported by the target factories
+    os.environ["DORIS_RAG_CONF"] = conf_path
+    os.environ.setdefault("DORIS_LOG_LEVEL", "WARNING")
+
+    chat_server = None
+    summaries: list[dict[str, Any]] = []
+    try:
+        for target in targets:
+            if target == "retrieve":
+                fn = make_retrieve_fn(args.top_k)
+            elif target == "chat":
+                chat_server = ChatServer().start()
+                fn = make_chat_fn(chat_server.url)
+            elif target == "mutate":
+                fn = make_mutate_fn(doris, args.rows_per_mutation, args.batch_size, args.embed_dim)
+            else:
+                parser.error(f"unknown target: {target}")
+            for level in levels:
+                result = run_load(target, fn, level, args.requests, warmup=args.warmup)
+                summaries.append(result.summary())
+    finally:
+        if chat_server is not None:
+            chat_server.stop()
+        doris.stop()
+        llm.stop()
+
+    print_report(summaries)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare_with_baseline(summaries, json.load(f), args.max_regression)
+        if problems:
+            print("Regressions against baseline:")
+            for p in problems:
+                print(f"  {p}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
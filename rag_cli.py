@@ -1,3 +1,5 @@
+import argparse
+
 from rag_lib import get_llm, retrieve_context, query_augment
 from i18n import get_message
 
@@ -26,5 +28,43 @@ def main():
         history.append({"role": "assistant", "content": ans_content})
 
 
+def batch_main(args):
+    from rag_batch import run_batch_file
+
+    counts = run_batch_file(
+        args.batch,
+        args.output,
+        top_k=args.top_k,
+        embed_batch_size=args.embed_batch_size,
+        search_concurrency=args.search_concurrency,
+        llm_concurrency=args.llm_concurrency,
+        augment=True if args.augment else None,
+        generate=False if args.no_generate else None,
+    )
+    print(
+        f"answered={counts['answered']} failed={counts['failed']} "
+        f"skipped (already in {args.output})={counts['skipped']}"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Doris RAG command-line client")
+    parser.add_argument("--batch", metavar="QUESTIONS.jsonl",
+                        help="Answer questions from a JSONL file instead of running interactively")
+    parser.add_argument("--output", default="answers.jsonl",
+                        help="JSONL output for --batch; rerun with the same file to resume")
+    parser.add_argument("--top-k", type=int)
+    parser.add_argument("--embed-batch-size", type=int)
+    parser.add_argument("--search-concurrency", type=int)
+    parser.add_argument("--llm-concurrency", type=int)
+    parser.add_argument("--augment", action="store_true", help="Rewrite each question with the LLM first")
+    parser.add_argument("--no-generate", action="store_true", help="Only retrieve sources, skip answers")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.batch:
+        batch_main(args)
+    else:
+        main()
@@ -0,0 +1,286 @@
+"""
+Retrieval-quality and latency evaluation across index configurations.
+
+For every configuration in an evaluation plan this tool:
+
+1. builds a shadow table (`<table_name>__eval_<name>`) by running the
+   md_to_doris_flow through `cocoindex update` with a generated conf.ini,
+   timing the ingest
+2. runs a labeled query set through rag_lib's embedding and search path
+   against that table, measuring recall@k, MRR and search latency
+3. reads the table's row count and data size from information_schema
+
+and reports all configurations side by side, marking the ones on the
+recall-versus-latency Pareto frontier.
+
+Plan file (JSON):
+    {
+      "queries": "eval/questions.jsonl",
+      "k": [1, 5, 10],
+      "configs": [
+        {"name": "cs500", "docs": {"chunk_size": 500, "chunk_overlap": 100}},
+        {"name": "cs1000", "docs": {"chunk_size": 1000, "chunk_overlap": 200}},
+        {"name": "md1000", "docs": {"chunker": "markdown", "chunk_size": 1000}},
+        {"name": "qwen4b", "embedding": {"model": "qwen/qwen3-embedding-4b", "embed_dim": 2560}}
+      ]
+    }
+
+Each config may override any conf.ini section. Query lines look like
+{"query": "...", "relevant": ["sql-manual/.../CREATE-TABLE.md", ...]}; a
+retrieved chunk is relevant when its filename ends with one of the listed
+paths.
+
+Usage:
+    python rag_eval.py eval_plan.json --output eval_report.json [--skip-build]
+"""
+
+import argparse
+import configparser
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+from conf import CONFIG_FILE
+from rag_bench import percentile
+
+DEFAULT_INDEX_CMD = ["cocoindex", "update", "--setup", "-f", "index_md_to_doris"]
+
+
+# =============================================================================
+# Plan handling
+# =============================================================================
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_]", "_", name)
+
+
+def shadow_conf(base_conf: str, cfg: dict[str, Any]) -> configparser.ConfigParser:
+    """Base configuration with the config's overrides and shadow table/flow names."""
+    parser = configparser.ConfigParser()
+    parser.read(base_conf)
+    for section, values in cfg.items():
+        if not isinstance(values, dict):
+            continue
+        if not parser.has_section(section):
+            parser.add_section(section)
+        for k, v in values.items():
+            parser.set(section, k, str(v))
+    name = _safe_name(cfg["name"])
+    base_table = parser.get("doris", "table_name", fallback="document_embeddings")
+    parser.set("doris", "table_name", f"{base_table}__eval_{name}")
+    if not parser.has_section("docs"):
+        parser.add_section("docs")
+    parser.set("docs", "flow_name", f"MdToDoris_eval_{name}")
+    return parser
+
+
+def load_queries(path: str) -> list[dict[str, Any]]:
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item["relevant"] = [str(r) for r in item.get("relevant", [])]
+            queries.append(item)
+    return queries
+
+
+# =============================================================================
+# Metrics
+# =============================================================================
+
+def _is_relevant(filename: str, relevant: list[str]) -> bool:
+    return any(filename == r or filename.endswith("/" + r.lstrip("/")) for r in relevant)
+
+
+def score_ranking(filenames: list[str], relevant: list[str], ks: list[int]) -> dict[str, float]:
+    """Recall@k over distinct relevant documents, plus reciprocal rank."""
+    scores: dict[str, float] = {}
+    if not relevant:
+        return scores
+    for k in ks:
+        hit = {r for r in relevant if any(_is_relevant(f, [r]) for f in filenames[:k])}
+        scores[f"recall@{k}"] = len(hit) / len(relevant)
+    rr = 0.0
+    for rank, f in enumerate(filenames, start=1):
+        if _is_relevant(f, relevant):
+            rr = 1.0 / rank
+            break
+    scores["mrr"] = rr
+    return scores
+
+
+def pareto_frontier(rows: list[dict[str, Any]], recall_key: str) -> set[str]:
+    """Configs not dominated on (higher recall, lower p95 search latency)."""
+    frontier = set()
+    for r in rows:
+        dominated = any(
+            o is not r
+            and o[recall_key] >= r[recall_key]
+            and o["search_p95_ms"] <= r["search_p95_ms"]
+            and (o[recall_key] > r[recall_key] or o["search_p95_ms"] < r["search_p95_ms"])
+            for o in rows
+        )
+        if not dominated:
+            frontier.add(r["name"])
+    return frontier
+
+
+# =============================================================================
+# Phases
+# =============================================================================
+
+def build_index(conf_path: str, cmd: list[str]) -> float:
+    """Run the indexing flow with the shadow config; returns ingest seconds."""
+    env = dict(os.environ, DORIS_RAG_CONF=conf_path)
+    start = time.perf_counter()
+    subprocess.run(cmd, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def query_phase(queries_path: str, ks: list[int]) -> dict[str, Any]:
+    """
+    Evaluate retrieval for the config named by DORIS_RAG_CONF. Runs in a
+    subprocess so conf, embedding model and table come from that config.
+    """
+    import rag_lib
+    from conf import settings
+
+    queries = load_queries(queries_path)
+    top_k = max(ks)
+    vectors = rag_lib.embed_queries([q["query"] for q in queries])
+
+    latencies: list[float] = []
+    totals: dict[str, float] = {}
+    labeled = 0
+    for q, vec in zip(queries, vectors):
+        start = time.perf_counter()
+        df = rag_lib.search_by_vector(vec, top_k)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        filenames = [str(f) for f in df.get("filename", [])]
+        if q["relevant"]:
+            labeled += 1
+        for key, val in score_ranking(filenames, q["relevant"], ks).items():
+            totals[key] = totals.get(key, 0.0) + val
+
+    lat = sorted(latencies)
+    # Recall and MRR are averaged over the queries that have relevant labels
+    result: dict[str, Any] = {k: round(v / labeled, 4) for k, v in totals.items()}
+    result.update({
+        "queries": len(queries),
+        "labeled_queries": labeled,
+        "search_p50_ms": round(percentile(lat, 50), 2),
+        "search_p95_ms": round(percentile(lat, 95), 2),
+    })
+    result.update(table_stats(settings.doris))
+    return result
+
+
+def table_stats(doris_conf) -> dict[str, Any]:
+    """Row count and on-disk size of the configured table."""
+    from doris_http import execute_conf_sql
+
+    db = doris_conf.get("db_name")
+    table = doris_conf.get("table_name")
+    sql = (
+        "SELECT TABLE_ROWS, DATA_LENGTH FROM information_schema.tables "
+        f"WHERE TABLE_SCHEMA = '{db}' AND TABLE_NAME = '{table}'"
+    )
+    try:
+        _, rows = execute_conf_sql(doris_conf, sql)
+    except Exception as e:
+        print(f"Could not read table stats for {db}.{table}: {e}", file=sys.stderr)
+        return {"rows": None, "index_bytes": None}
+    if not rows:
+        return {"rows": None, "index_bytes": None}
+    return {"rows": int(rows[0][0] or 0), "index_bytes": int(rows[0][1] or 0)}
+
+
+def run_query_subprocess(conf_path: str, queries_path: str, ks: list[int]) -> dict[str, Any]:
+    env = dict(os.environ, DORIS_RAG_CONF=conf_path)
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--query-phase", queries_path,
+         "--k", ",".join(str(k) for k in ks)],
+        env=env, check=True, capture_output=True, text=True,
+    )
+    # The result is the last stdout line; anything before it is library output
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# =============================================================================
+# Reporting
+# =============================================================================
+
+def print_report(rows: list[dict[str, Any]], ks: list[int], frontier: set[str]) -> None:
+    cols = ["name"] + [f"recall@{k}" for k in ks] + [
+        "mrr", "search_p50_ms", "search_p95_ms", "rows", "index_bytes", "ingest_s", "frontier",
+    ]
+    table = [{**r, "frontier": "*" if r["name"] in frontier else ""} for r in rows]
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in table)) for c in cols}
+    print("  ".join(c.rjust(widths[c]) for c in cols))
+    for r in table:
+        print("  ".join(str(r.get(c, "")).rjust(widths[c]) for c in cols))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality per index configuration")
+    parser.add_argument("plan", nargs="?", help="Evaluation plan JSON")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--skip-build", action="store_true",
+                        help="Reuse existing shadow tables (ingest time is not measured)")
+    parser.add_argument("--index-cmd", default=" ".join(DEFAULT_INDEX_CMD),
+                        help="Command that builds the index for DORIS_RAG_CONF")
+    parser.add_argument("--query-phase", metavar="QUERIES", help=argparse.SUPPRESS)
+    parser.add_argument("--k", default="1,5,10", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.query_phase:
+        ks = [int(k) for k in args.k.split(",")]
+        print(json.dumps(query_phase(args.query_phase, ks)))
+        return 0
+    if not args.plan:
+        parser.error("an evaluation plan is required")
+
+    with open(args.plan, encoding="utf-8") as f:
+        plan = json.load(f)
+    ks = sorted(int(k) for k in plan.get("k", [1, 5, 10]))
+    queries_path = os.path.abspath(plan["queries"])
+    workdir = tempfile.mkdtemp(prefix="rag_eval_")
+
+    rows: list[dict[str, Any]] = []
+    for cfg in plan["configs"]:
+        name = cfg["name"]
+        conf_path = os.path.join(workdir, f"{_safe_name(name)}.ini")
+        with open(conf_path, "w", encoding="utf-8") as f:
+            shadow_conf(CONFIG_FILE, cfg).write(f)
+
+        ingest_s = None
+        if not args.skip_build:
+            print(f"[{name}] building shadow index ...")
+            ingest_s = round(build_index(conf_path, args.index_cmd.split()), 1)
+        print(f"[{name}] running {queries_path} ...")
+        result = run_query_subprocess(conf_path, queries_path, ks)
+        rows.append({"name": name, **result, "ingest_s": ingest_s, "config": cfg})
+
+    recall_key = f"recall@{ks[-1]}"
+    if all(recall_key in r for r in rows):
+        frontier = pareto_frontier(rows, recall_key)
+    else:
+        frontier = set()
+        print(f"No query in {queries_path} has 'relevant' labels; skipping recall and the Pareto frontier")
+    print_report(rows, ks, frontier)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"k": ks, "frontier": sorted(frontier), "results": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,75 +1,408 @@
+from __future__ import annotations
+
+import functools
+import logging
+import math
 import os
-import pandas as pd
-from doris_vector_search import DorisVectorClient, AuthOptions
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from typing import TYPE_CHECKING
+
 from conf import settings
-from i18n import get_message
+import cache_store
+from i18n import doc_sources, get_message, lang_layout, lang_table, route_language
+from doris_http import conf_client
+import deadlines
+import index_meta
+import md_chunker
+import metrics
+from admission import throttle
+
+# pandas, langchain, doris_vector_search and the local index pull in heavy
+# dependencies; they are imported on first use to keep startup fast
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RESULT_COLUMNS = ["_key", "filename", "text", "location"]
+
 
+def result_columns() -> list[str]:
+    """Columns returned by searches; markdown-chunked indexes add the heading path and ordinals."""
+    return RESULT_COLUMNS + (md_chunker.COLUMNS if md_chunker.configured() else [])
+
+
+@functools.lru_cache(maxsize=1)
 def get_embedding_model():
+    """Process-wide embedding client; reusing it keeps its HTTP connections warm."""
     emb_conf = settings.embedding
     emb_type = emb_conf.get('type', 'ollama').lower()
     
     if emb_type == 'ollama':
+        from langchain_community.embeddings import OllamaEmbeddings
         return OllamaEmbeddings(
             model=emb_conf.get('model', 'bge-m3:latest'),
             base_url=emb_conf.get('base_url', 'http://localhost:11434')
         )
     elif emb_type == 'openai':
+        from langchain_openai import OpenAIEmbeddings
         return OpenAIEmbeddings(
             model=emb_conf.get('model'),
             api_key=emb_conf.get('api_key'),
-            base_url=emb_conf.get('base_url')
+            base_url=emb_conf.get('base_url'),
+            request_timeout=float(emb_conf.get('timeout', 30)),
+            max_retries=int(emb_conf.get('max_retries', 2)),
+            # Tokenizing locally with tiktoken only makes sense for OpenAI models
+            check_embedding_ctx_length=emb_conf.getboolean('check_ctx_length', True),
         )
     else:
         raise ValueError(f"Unsupported embedding type: {emb_type}")
 
+@functools.lru_cache(maxsize=1)
 def get_llm():
+    """Process-wide chat model client."""
     llm_conf = settings.llm
     llm_type = llm_conf.get('type', 'openai').lower()
     
     if llm_type == 'openai':
+        from langchain_openai import ChatOpenAI
         return ChatOpenAI(
             model=llm_conf.get('model'),
             api_key=llm_conf.get('api_key'),
             base_url=llm_conf.get('base_url'),
-            temperature=float(llm_conf.get('temperature', 0.2))
+            temperature=float(llm_conf.get('temperature', 0.2)),
+            timeout=_llm_timeout(),
+            max_retries=int(llm_conf.get('max_retries', 2)),
         )
     else:
         raise ValueError(f"Unsupported LLM type: {llm_type}")
 
-def retrieve_context(query: str, top_k: int = 5) -> pd.DataFrame:
-    embeddings = get_embedding_model()
-    query_vec = embeddings.embed_query(query)
+def _llm_timeout() -> float:
+    return float(settings.llm.get('timeout', 60))
+
+
+def invoke_llm(llm, prompt: str, stage: str):
+    """llm.invoke bounded by the request deadline (see deadlines)."""
+    return llm.invoke(prompt, timeout=deadlines.timeout(_llm_timeout(), stage))
+
+
+def _vector_literal(vec) -> str:
+    return "[" + ",".join(repr(float(x)) for x in vec) + "]"
+
+
+def _sql_string(value: str) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def normalize_filters(filters: dict | None) -> dict[str, list[str]]:
+    """
+    Validate search filters ({column: value or [values]}). Only the partition
+    column ([doris] partition_by) can be filtered on, so every filter prunes
+    partitions instead of post-filtering ANN results; with [docs] sources in
+    the column layout, `lang` can be too (partition by it to prune as well).
+    """
+    if not filters:
+        return {}
+    filterable = _filterable_columns()
+    normalized = {}
+    for column, value in filters.items():
+        if column not in filterable:
+            raise ValueError(f"Cannot filter on '{column}'; filterable columns: {', '.join(filterable) or 'none'}")
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        normalized[column] = sorted(str(v) for v in values)
+    return normalized
+
+
+def _filterable_columns() -> list[str]:
+    columns = []
+    partition_by = settings.doris.get('partition_by', '').strip().lower()
+    if partition_by:
+        columns.append(partition_by)
+    if doc_sources() and lang_layout() == 'column' and 'lang' not in columns:
+        columns.append('lang')
+    return columns
+
+
+def _where_conditions(filters: dict[str, list[str]]) -> list[str]:
+    """Filters as DorisVectorClient-style `column = 'value'` conditions (one value each)."""
+    conditions = []
+    for column, values in filters.items():
+        if len(values) != 1:
+            raise ValueError(
+                f"Filtering '{column}' on several values needs [doris] query_protocol = mysql or http"
+            )
+        conditions.append(f"{column} = {_sql_string(values[0])}")
+    return conditions
+
+
+def _ann_template(table: str, top_k: int, filters: dict[str, list[str]], query_timeout: int | None = None) -> str:
+    """
+    ANN query with `?` for the vector and filter values (in that order);
+    with query_timeout (seconds), the FE aborts it after that long.
+    """
+    db = settings.doris.get('db_name')
+    cols = ", ".join(f"`{c}`" for c in result_columns())
+    where = " AND ".join(
+        f"`{column}` IN ({', '.join('?' for _ in values)})" for column, values in filters.items()
+    )
+    hint = f"/*+ SET_VAR(query_timeout = {int(query_timeout)}) */ " if query_timeout else ""
+    return (
+        f"SELECT {hint}{cols}, l2_distance_approximate(`embedding`, CAST(? AS ARRAY<FLOAT>)) AS distance "
+        f"FROM `{db}`.`{table}` {'WHERE ' + where + ' ' if where else ''}ORDER BY distance LIMIT {int(top_k)}"
+    )
+
+
+def _search_via_sql(query_vec, top_k: int, table: str, filters: dict[str, list[str]]) -> pd.DataFrame:
+    """Run the ANN query on the shared SQL client (a prepared statement over MySQL)."""
+    params = [_vector_literal(query_vec)] + [v for values in filters.values() for v in values]
+    timeout = deadlines.timeout(30, "doris_search")
+    # Whole seconds keep the number of distinct prepared templates small
+    query_timeout = max(1, math.ceil(timeout)) if deadlines.current() is not None else None
+    columns, rows = conf_client(settings.doris).query_prepared(
+        _ann_template(table, top_k, filters, query_timeout), params, timeout=max(1, math.ceil(timeout))
+    )
+    import pandas as pd
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _embedding_key(text: str) -> str:
+    emb_conf = settings.embedding
+    return cache_store.digest(emb_conf.get('type', 'ollama'), emb_conf.get('model', ''), text)
+
+
+def embed_query(query: str) -> list:
+    store = cache_store.named_store("embeddings")
+    key = _embedding_key(query) if store is not None else None
+    if key is not None:
+        cached = store.get(key)
+        if cached is not None:
+            return cached
+    deadlines.check("embedding")
+    throttle("embedding")
+    with metrics.span("embedding"):
+        vec = get_embedding_model().embed_query(query)
+    if key is not None:
+        store.put(key, vec)
+    return vec
+
+
+def embed_queries(queries: list) -> list:
+    """Embed many queries in one provider call (only those not cached)."""
+    queries = list(queries)
+    store = cache_store.named_store("embeddings")
+    keys = [_embedding_key(q) for q in queries] if store is not None else []
+    vectors = [store.get(k) for k in keys] if keys else [None] * len(queries)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        deadlines.check("embedding")
+        throttle("embedding")
+        with metrics.span("embedding", batch=len(missing)):
+            embedded = get_embedding_model().embed_documents([queries[i] for i in missing])
+        for i, vec in zip(missing, embedded):
+            vectors[i] = vec
+            if keys:
+                store.put(keys[i], vec)
+    return vectors
+
+
+def _base_table(lang: str | None) -> str:
+    """Logical table searched for `lang`: per-language with lang_layout = tables."""
+    table = settings.doris.get('table_name')
+    if lang and lang_layout() == 'tables':
+        return lang_table(table, lang)
+    return table
+
+
+def _per_language_tables() -> bool:
+    """Whether docs live only in per-language tables (there is no `table_name` table)."""
+    return bool(doc_sources()) and lang_layout() == 'tables'
+
+
+def retrieval_backend() -> str:
+    """The [retrieval] backend: 'doris', 'local' or 'auto' (Doris with local fallback)."""
+    backend = settings.retrieval.get('backend', 'doris').strip().lower()
+    if backend not in ('doris', 'local', 'auto'):
+        raise ValueError(f"Unsupported retrieval.backend: {backend}. Use doris, local or auto.")
+    # The local index mirrors the single `table_name` table
+    if backend != 'doris' and _per_language_tables():
+        raise ValueError(
+            f"retrieval.backend = {backend} needs docs.lang_layout = column; "
+            "the local index cannot hold per-language tables"
+        )
+    return backend
+
+
+def _search_all_languages(query_vec, top_k: int, filters: dict[str, list[str]]) -> pd.DataFrame:
+    """Search every language table (or those of a `lang` filter) and keep the closest top_k hits."""
+    import pandas as pd
+
+    langs = [lang for lang, _ in doc_sources()]
+    # The tables have no lang column; a lang filter picks tables instead
+    wanted = filters.pop('lang', None)
+    if wanted is not None:
+        langs = [lang for lang in langs if lang in wanted]
+    results = [search_by_vector(query_vec, top_k, filters, lang=lang).assign(lang=lang) for lang in langs]
+    if not results:
+        return pd.DataFrame(columns=result_columns() + ['lang'])
+    merged = pd.concat(results, ignore_index=True)
+    # One embedding model scores every table, so distances compare across them
+    if 'distance' in merged.columns:
+        merged = merged.sort_values('distance', kind='stable')
+    return merged.head(top_k).reset_index(drop=True)
+
+
+def search_by_vector(query_vec, top_k: int = 5, filters: dict | None = None, lang: str | None = None) -> pd.DataFrame:
+    # lang: a [docs] sources language to restrict the search to (see route_language)
+    import retrieval_cache
+
+    backend = retrieval_backend()
+    filters = normalize_filters(filters)
+    deadlines.check("doris_search")
+    if lang is None and backend != 'local' and _per_language_tables():
+        return _search_all_languages(query_vec, top_k, dict(filters))
+    base_table = _base_table(lang)
+    if lang and lang_layout() != 'tables' and 'lang' not in filters:
+        filters = {**filters, 'lang': [lang]}
+    with metrics.span("doris_search", top_k=top_k) as attrs:
+        if filters:
+            attrs["filters"] = filters
+        if lang:
+            attrs["lang"] = lang
+        if backend == 'local':
+            df = _search_local(query_vec, top_k, filters)
+            attrs["backend"] = "local"
+            attrs["rows"] = len(df)
+            return df
+        # Physical table: the current version when the index is versioned
+        table = index_meta.current_table(table=base_table)
+        attrs["table"] = table
+        # Only Doris results are cached: they are what the index generation tracks
+        key = retrieval_cache.cache_key(table, query_vec, top_k, filters, name=base_table)
+        df = retrieval_cache.lookup(key)
+        if df is not None:
+            attrs["backend"] = "cache"
+        else:
+            try:
+                df = _search_doris(query_vec, top_k, table, filters)
+                attrs["backend"] = "doris"
+                retrieval_cache.store(key, df)
+            except Exception as e:
+                if backend != 'auto':
+                    raise
+                logger.warning("Doris search failed (%s); falling back to the local index", e)
+                df = _search_local(query_vec, top_k, filters)
+                attrs["backend"] = "local_fallback"
+        attrs["rows"] = len(df)
+    return df
+
+
+def _search_doris(query_vec, top_k: int, table: str, filters: dict[str, list[str]]) -> pd.DataFrame:
+    throttle("doris")
+    # 'mysql' (pooled connections) and 'http' (FE SQL endpoint) share doris_http's
+    # SQL client; 'client' opens a doris_vector_search client per search
+    if settings.doris.get('query_protocol', 'mysql').lower() == 'client':
+        return _search_via_client(query_vec, top_k, table, filters)
+    return _search_via_sql(query_vec, top_k, table, filters)
+
+
+def _search_local(query_vec, top_k: int, filters: dict[str, list[str]]) -> pd.DataFrame:
+    from local_index import LocalVectorClient, get_local_index, refresh_in_background
+
+    index = get_local_index()
+    refresh_seconds = float(settings.retrieval.get('local_refresh_seconds', 0))
+    if refresh_seconds > 0 and index.age_seconds > refresh_seconds:
+        refresh_in_background(index, max_age=refresh_seconds)
+    client = LocalVectorClient(index)
+    table = client.open_table(settings.doris.get('table_name'))
+    query = table.search(query_vec, vector_column="embedding").limit(top_k).select(result_columns())
+    for condition in _where_conditions(filters):
+        query = query.where(condition)
+    return query.to_pandas()
+
+
+def _search_via_client(query_vec, top_k: int, table_name: str, filters: dict[str, list[str]]) -> pd.DataFrame:
+    from fe_balancer import conf_pool
+
+    # A new doris_vector_search client per search, on the least busy FE
+    return conf_pool(settings.doris).call(
+        lambda fe: _client_search(fe, query_vec, top_k, table_name, filters)
+    )
+
+
+def _client_search(fe, query_vec, top_k: int, table_name: str, filters: dict[str, list[str]]) -> pd.DataFrame:
+    from doris_vector_search import DorisVectorClient, AuthOptions
 
     doris_conf = settings.doris
     auth = AuthOptions(
-        host=doris_conf.get('host', 'localhost'),
-        query_port=int(doris_conf.get('query_port', 9030)),
-        http_port=int(doris_conf.get('http_port', 8030)),
+        host=fe.host,
+        query_port=fe.query_port,
+        http_port=fe.http_port,
         user=doris_conf.get('user', 'root'),
         password=doris_conf.get('password', ''),
     )
     
     client = DorisVectorClient(doris_conf.get('db_name'), auth_options=auth)
-    table = client.open_table(doris_conf.get('table_name'))
+    table = client.open_table(table_name)
     try:
-        df = (
-            table.search(query_vec, vector_column="embedding")
-            .limit(top_k)
-            .select(["_key", "filename", "text", "location"])
-            .to_pandas()
-        )
+        query = table.search(query_vec, vector_column="embedding").limit(top_k).select(result_columns())
+        for condition in _where_conditions(filters):
+            query = query.where(condition)
+        df = query.to_pandas()
     finally:
         client.close()
     return df
 
+
+def expand_context(df: pd.DataFrame, lang: str | None = None, fetch_cache=None) -> pd.DataFrame:
+    """Widen search hits to neighboring chunks or sections per [retrieval] expand."""
+    import context_expansion
+
+    if context_expansion.mode() == 'none' or df.empty or not deadlines.allows("expand"):
+        return df
+    backend = retrieval_backend()
+    try:
+        if backend != 'local':
+            try:
+                if lang is None and _per_language_tables() and 'lang' in df.columns:
+                    return _expand_per_language(df, fetch_cache)
+                table = index_meta.current_table(table=_base_table(lang))
+                return context_expansion.expand_hits(df, table, cache=fetch_cache)
+            except Exception:
+                if backend != 'auto':
+                    raise
+        return context_expansion.expand_hits(df, settings.doris.get('table_name'), local=True, cache=fetch_cache)
+    except Exception as e:
+        # Unexpanded hits are still a usable context
+        logger.warning("Context expansion failed, using the matching chunks only: %s", e)
+        return df
+
+
+def _expand_per_language(df: pd.DataFrame, fetch_cache=None) -> pd.DataFrame:
+    """Expand hits merged from several language tables, each in its own table, keeping their order."""
+    import context_expansion
+    import pandas as pd
+
+    ranked = df.assign(_rank=range(len(df)))
+    parts = [
+        context_expansion.expand_hits(hits, index_meta.current_table(table=_base_table(lang)), cache=fetch_cache)
+        for lang, hits in ranked.groupby('lang', sort=False)
+    ]
+    return pd.concat(parts).sort_values('_rank').drop(columns='_rank').reset_index(drop=True)
+
+
+def retrieve_context(query: str, top_k: int = 5, filters: dict | None = None, fetch_cache=None) -> pd.DataFrame:
+    lang = route_language(query)
+    df = search_by_vector(embed_query(query), top_k, filters, lang=lang)
+    return expand_context(df, lang, fetch_cache)
+
 def query_augment(query: str, history: list = None) -> str:
     """
     Augment the user query using LLM.
     If history is provided, it helps in coreference resolution.
     Otherwise, it refines the query for better retrieval.
+    Near the request deadline the query is used as is.
     """
+    if not deadlines.allows("augmentation"):
+        return query
     llm = get_llm()
     
     if history and len(history) > 0:
@@ -84,5 +417,88 @@ def query_augment(query: str, history: list = None) -> str:
     else:
         prompt = get_message("augment_prompt_no_history", query)
 
-    resp = llm.invoke(prompt)
+    throttle("llm")
+    with metrics.span("augmentation"):
+        resp = invoke_llm(llm, prompt, "augmentation")
+    metrics.record_llm_tokens("augmentation", resp)
     return resp.content.strip() if hasattr(resp, "content") else str(resp).strip()
+
+
+def build_prompt(query: str, history: list, context_df) -> tuple:
+    """Format retrieved rows and history into the chat prompt; returns (prompt, sources)."""
+    context_blocks = []
+    sources = []
+    for _, row in context_df.iterrows():
+      filename = row.get("filename", "")
+      text = row.get("text", "")
+      key = row.get("_key", "")
+      location = row.get("location")
+      heading_path = row.get("heading_path") or ""
+
+      # Normalize values to JSON-serializable types
+      try:
+        key = str(key) if key is not None else ""
+      except Exception:
+        key = ""
+
+      # Convert numpy arrays or pandas objects to plain Python lists
+      if hasattr(location, "tolist"):
+        try:
+          location = location.tolist()
+        except Exception:
+          location = None
+      elif isinstance(location, tuple):
+        location = list(location)
+      elif not isinstance(location, list):
+        # Keep None or simple scalars; otherwise drop
+        if not (location is None or isinstance(location, (int, float, str))):
+          location = None
+
+      label = f"{filename} > {heading_path}" if heading_path else filename
+      block = f"[{get_message('source_label')}: {label}]\n{text}"
+      context_blocks.append(block)
+      source = {
+        "key": key,
+        "filename": filename,
+        "location": location,
+      }
+      if heading_path:
+        source["heading_path"] = heading_path
+      sources.append(source)
+
+    context_text = "\n\n---\n\n".join(context_blocks)
+
+    history_text = ""
+    for turn in history:
+        role = turn.get("role", "user")
+        content = turn.get("content", "")
+        history_text += f"{role.upper()}: {content}\n"
+
+    template = get_message("chat_prompt_template")
+    prompt = template.format(
+        history=history_text.strip(),
+        context=context_text.strip(),
+        question=query.strip(),
+    )
+    return prompt, sources
+
+
+def generate_answer(llm, prompt: str) -> str:
+    """Run the final generation call with rate limiting, timing and token accounting."""
+    # The prompt embeds the retrieved context, so a reindex changes the key
+    store = cache_store.named_store("answers")
+    if store is not None:
+        llm_conf = settings.llm
+        key = cache_store.digest(llm_conf.get('model', ''), llm_conf.get('temperature', '0.2'), prompt)
+        cached = store.get(key)
+        if cached is not None:
+            return cached
+    deadlines.check("generation")
+    throttle("llm")
+    with metrics.span("generation"):
+        resp = invoke_llm(llm, prompt, "generation")
+    metrics.record_llm_tokens("generation", resp)
+    answer = resp.content if hasattr(resp, "content") else str(resp)
+    if store is not None:
+        store.put(key, answer)
+    return answer
@@ -1,15 +1,48 @@
-from typing import List
-
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+import asyncio
+import json
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from rag_lib import get_llm, retrieve_context, query_augment
+from rag_lib import build_prompt, generate_answer, get_llm, normalize_filters
+import multi_query
 from i18n import get_message
+import metrics
+from admission import AdmissionController, ServiceOverloaded
+from deadlines import Deadline, DeadlineExceeded, RequestCancelled
+import deadlines
+from rag_batch import answer_batch, batch_options, parse_questions
+from conf import settings
+from startup import WarmUp
+
+logger = logging.getLogger(__name__)
+# Uvicorn only configures its own loggers; attach a console handler for ours
+if not logger.handlers:
+    _h = logging.StreamHandler()
+    _h.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    logger.addHandler(_h)
+logger.setLevel(getattr(logging, os.getenv("RAG_LOG_LEVEL", "INFO").upper(), logging.INFO))
+
+warmup = WarmUp.from_settings()
 
 
-app = FastAPI(title="Doris RAG Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load models and open upstream connections before /health/ready turns green
+    warmup.start()
+    yield
+    warmup.stop()
+
+
+app = FastAPI(title="Doris RAG Service", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,10 +51,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+admission = AdmissionController.from_settings()
+# Batch jobs are long-running; cap how many run at once
+batch_slots = threading.BoundedSemaphore(int(settings.batch.get("max_jobs", 1)))
+
+
+@app.exception_handler(ServiceOverloaded)
+async def overloaded_handler(request: Request, exc: ServiceOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": exc.retry_after_header},
+    )
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.exception_handler(RequestCancelled)
+async def cancelled_handler(request: Request, exc: RequestCancelled):
+    # The client is gone; the status only shows up in access logs
+    return JSONResponse(status_code=499, content={"detail": str(exc)})
+
 
 class ChatRequest(BaseModel):
     query: str
     history: List[dict] = []
+    # e.g. {"version": "4.x"}; only the [doris] partition_by column is filterable
+    filters: Optional[dict] = None
+    # Time budget in milliseconds, capped at [service] request_timeout
+    timeout_ms: Optional[int] = None
 
 
 class ChatResponse(BaseModel):
@@ -30,73 +91,132 @@ class ChatResponse(BaseModel):
 
 
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, request: Request):
+    # Counted from arrival: time queued for admission uses up the budget too
+    deadline = Deadline.for_request(req.timeout_ms)
     query = req.query.strip()
     if not query:
         return ChatResponse(answer="", sources=[])
+    try:
+        filters = normalize_filters(req.filters)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+
+    # Watched from arrival, so a client that leaves while queued frees its place
+    watcher = asyncio.create_task(_watch_disconnect(request, deadline))
+    try:
+        # Blocking pipeline runs in the threadpool so admitted requests overlap
+        async with admission.admit(deadline):
+            return await run_in_threadpool(_chat, query, req.history, filters, deadline)
+    finally:
+        watcher.cancel()
+
+
+async def _watch_disconnect(request: Request, deadline: Deadline, interval: float = 0.25) -> None:
+    """Cancel the deadline when the client goes away, so the pipeline stops at its next stage."""
+    while not deadline.cancelled:
+        if await request.is_disconnected():
+            logger.info("Client disconnected; cancelling the request")
+            deadline.cancel("client disconnected")
+            return
+        await asyncio.sleep(interval)
+
+
+def _chat(
+    query: str,
+    history: List[dict],
+    filters: Optional[dict] = None,
+    deadline: Optional[Deadline] = None,
+) -> ChatResponse:
+    with deadlines.scope(deadline), metrics.trace("chat") as tr:
+        # Augmentation and search, as one query or fanned out per [retrieval] strategy
+        augmented_query, context_df = multi_query.retrieve(query, history, top_k=5, filters=filters)
+        logger.info(get_message("service_original_augmented", query, augmented_query))
+
+        with metrics.span("prompt_build"):
+            prompt, sources = build_prompt(query, history, context_df)
+
+        answer = generate_answer(get_llm(), prompt)
+
+    logger.info("request trace %s", tr.to_json())
+    return ChatResponse(answer=answer, sources=sources)
 
-    augmented_query = query_augment(query, req.history)
-    print(get_message("service_original_augmented", query, augmented_query))
 
-    context_df = retrieve_context(augmented_query, top_k=5)
+@app.post("/api/batch")
+async def batch(
+    request: Request,
+    top_k: Optional[int] = None,
+    generate: Optional[bool] = None,
+    augment: Optional[bool] = None,
+):
+    """
+    Answer a JSONL request body of {"id", "query"} objects, streaming one
+    JSONL result per question as it completes. To resume an interrupted
+    batch, resend only the ids missing from the received output.
+    """
+    body = await request.body()
+    try:
+        items = list(parse_questions(body.splitlines()))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    opts = batch_options(top_k=top_k, generate=generate, augment=augment)
+    if not batch_slots.acquire(blocking=False):
+        raise ServiceOverloaded("too many batch jobs running", retry_after=60)
+    try:
+        # The job's LLM workers take chat slots for as long as it runs
+        reserved = await admission.reserve(opts["llm_concurrency"] if opts["generate"] or opts["augment"] else 0)
+    except BaseException:
+        batch_slots.release()
+        raise
+
+    def _stream():
+        for rec in answer_batch(items, **opts):
+            yield json.dumps(rec, ensure_ascii=False) + "\n"
+
+    return _BatchResponse(_stream(), reserved, media_type="application/x-ndjson")
+
+
+class _BatchResponse(StreamingResponse):
+    """Releases its batch and admission slots however the response ends, even if streaming never starts."""
+
+    def __init__(self, content, reserved: int, **kwargs):
+        super().__init__(content, **kwargs)
+        self.reserved = reserved
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release(self.reserved)
+            batch_slots.release()
 
-    context_blocks = []
-    sources = []
-    for _, row in context_df.iterrows():
-      filename = row.get("filename", "")
-      text = row.get("text", "")
-      key = row.get("_key", "")
-      location = row.get("location")
 
-      # Normalize values to JSON-serializable types
-      try:
-        key = str(key) if key is not None else ""
-      except Exception:
-        key = ""
+@app.get("/api/admission")
+async def admission_status():
+    return admission.snapshot()
 
-      # Convert numpy arrays or pandas objects to plain Python lists
-      if hasattr(location, "tolist"):
-        try:
-          location = location.tolist()
-        except Exception:
-          location = None
-      elif isinstance(location, tuple):
-        location = list(location)
-      elif not isinstance(location, list):
-        # Keep None or simple scalars; otherwise drop
-        if not (location is None or isinstance(location, (int, float, str))):
-          location = None
-
-      block = f"[{get_message('source_label')}: {filename}]\n{text}"
-      context_blocks.append(block)
-      sources.append(
-        {
-          "key": key,
-          "filename": filename,
-          "location": location,
-        }
-      )
-
-    context_text = "\n\n---\n\n".join(context_blocks)
-
-    history_text = ""
-    for turn in req.history:
-        role = turn.get("role", "user")
-        content = turn.get("content", "")
-        history_text += f"{role.upper()}: {content}\n"
-
-    template = get_message("chat_prompt_template")
-    prompt = template.format(
-        history=history_text.strip(),
-        context=context_text.strip(),
-        question=query.strip(),
-    )
 
-    llm = get_llm()
-    resp = llm.invoke(prompt)
-    answer = resp.content if hasattr(resp, "content") else str(resp)
+@app.get("/api/doris")
+async def doris_status():
+    """Per-FE health, outstanding requests and latency."""
+    import fe_balancer
+    return {"frontends": [fe for pool in fe_balancer.all_pools() for fe in pool.snapshot()]}
 
-    return ChatResponse(answer=answer, sources=sources)
+
+@app.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    state = warmup.snapshot()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -150,7 +270,7 @@ async def index():
         const sdiv = document.createElement('div');
         sdiv.className = 'sources';
         sdiv.textContent = '{get_message('ui_source_ref')}' + sources.map(s => {{
-          const name = s.filename || s.path || 'source';
+          const name = (s.filename || s.path || 'source') + (s.heading_path ? ` > ${{s.heading_path}}` : '');
           const loc = (s.location !== undefined && s.location !== null) ? ` @ ${{Array.isArray(s.location) ? s.location.join(',') : s.location}}` : '';
           return name + loc;
         }}).join(' | ');
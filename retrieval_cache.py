@@ -0,0 +1,136 @@
+"""
+Search-result cache between rag_lib and the Doris table.
+
+Different chat turns often retrieve with (nearly) the same query vector,
+so the ANN search results are cached under a key made of:
+
+- the table and its current index generation
+- top_k and any search filters
+- the query vector quantized to [retrieval] cache_quantization, hashed
+
+Entries live in a cache_store namespace bounded by [retrieval]
+cache_max_mb: per process, or shared by all workers on the host with
+[cache] backend = sqlite. The generation is read from the index meta table (see
+index_meta.py), which DorisTargetConnector bumps after every successful
+load; a new generation makes all older entries unreachable, and they age
+out of the LRU.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from conf import settings
+import cache_store
+import index_meta
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = metrics.REGISTRY.counter(
+    "rag_retrieval_cache_lookups_total", "Retrieval cache lookups.", ("result",)
+)
+
+
+def vector_digest(vec, quantization: float) -> str:
+    """Hash of the vector rounded to multiples of `quantization`."""
+    arr = np.asarray(vec, dtype=np.float32)
+    if quantization > 0:
+        arr = np.round(arr / quantization).astype(np.int32)
+    return hashlib.blake2b(arr.tobytes(), digest_size=16).hexdigest()
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class RetrievalCache:
+    """Search results in a cache_store namespace, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int, quantization: float = 0.001, store=None):
+        self.quantization = quantization
+        self.store = store if store is not None else cache_store.MemoryStore(max_bytes, _frame_bytes)
+
+    def key(self, table: str, generation: str, vec, top_k: int, filters: dict | None = None) -> str:
+        filters_key = json.dumps(filters, sort_keys=True, default=str) if filters else ""
+        return "|".join((table, generation, str(int(top_k)), filters_key, vector_digest(vec, self.quantization)))
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        df = self.store.get(key)
+        if df is None:
+            CACHE_LOOKUPS.inc(result="miss")
+            return None
+        CACHE_LOOKUPS.inc(result="hit")
+        # Callers may modify the frame; never hand out the cached object
+        return df.copy()
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        self.store.put(key, df.copy())
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+
+_cache: RetrievalCache | None = None
+_tracker: index_meta.MetaCache | None = None
+_init_lock = threading.Lock()
+
+
+def get_cache() -> tuple[RetrievalCache, index_meta.MetaCache] | None:
+    """Process-wide cache and generation tracker, or None when disabled."""
+    global _cache, _tracker
+    conf = settings.retrieval
+    if not conf.getboolean('cache_enabled', False):
+        return None
+    with _init_lock:
+        if _cache is None:
+            max_bytes = int(float(conf.get('cache_max_mb', 64)) * 1024 * 1024)
+            _cache = RetrievalCache(
+                max_bytes=max_bytes,
+                quantization=float(conf.get('cache_quantization', 0.001)),
+                store=cache_store.open_store("retrieval", max_bytes, _frame_bytes),
+            )
+            # A meta table outage degrades to slightly stale results instead of failing searches
+            _tracker = index_meta.MetaCache(
+                settings.doris,
+                float(conf.get('generation_check_seconds', 5)),
+                conf.get('meta_table', index_meta.META_TABLE),
+            )
+    return _cache, _tracker
+
+
+def cache_key(table: str, vec, top_k: int, filters: dict | None = None, name: str | None = None) -> str | None:
+    """
+    Key for a search of `table` (the physical version table, so entries of
+    different versions never mix), or None when caching is off or unavailable.
+    `name` is the logical table whose generation applies ([doris] table_name).
+    """
+    state = get_cache()
+    if state is None:
+        return None
+    cache, tracker = state
+    try:
+        # Raises only while no generation has ever been read
+        generation = tracker.get(name or settings.doris.get('table_name'), index_meta.GENERATION_KEY) or "0"
+    except Exception as e:
+        logger.warning("Retrieval cache bypassed, index generation unavailable: %s", e)
+        return None
+    return cache.key(table, generation, vec, top_k, filters)
+
+
+def lookup(key: str | None) -> pd.DataFrame | None:
+    if key is None or _cache is None:
+        return None
+    return _cache.get(key)
+
+
+def store(key: str | None, df: pd.DataFrame) -> None:
+    if key is not None and _cache is not None:
+        _cache.put(key, df)
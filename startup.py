@@ -0,0 +1,127 @@
+"""
+Service warm-up and health state.
+
+rag_lib imports its heavy dependencies lazily, so the service process
+starts fast. WarmUp then runs in a background thread from the FastAPI
+lifespan and does, before the first request would have to:
+
+- embedding  build the embedding client and embed a short string
+             (imports langchain, opens the HTTP/TLS connection)
+- llm        build the chat client and list the provider's models
+- doris      run SELECT 1 and resolve the current index table
+- local      load the local index (only with [retrieval] backend local/auto)
+
+Failed steps are retried every `warmup_retry_seconds`. /health/live
+reports the process is up; /health/ready returns 200 only once every
+configured step has succeeded, so autoscaled pods join the load balancer
+at steady-state latency.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_embedding() -> None:
+    from rag_lib import get_embedding_model
+    get_embedding_model().embed_query("warm-up")
+
+
+def _warm_llm() -> None:
+    from rag_lib import get_llm
+    llm = get_llm()
+    # Any response, even 404, leaves a pooled connection behind
+    root_client = getattr(llm, "root_client", None)
+    if root_client is not None:
+        try:
+            root_client.models.list()
+        except Exception as e:
+            logger.debug("Model listing failed during warm-up: %s", e)
+
+
+def _warm_doris() -> None:
+    from doris_http import execute_conf_sql
+    import index_meta
+    import pandas  # noqa: F401  (search results are DataFrames)
+
+    execute_conf_sql(settings.doris, "SELECT 1", timeout=10)
+    index_meta.current_table()
+
+
+def _warm_local() -> None:
+    from local_index import get_local_index
+    get_local_index().load()
+
+
+STEPS: dict[str, Callable[[], None]] = {
+    "embedding": _warm_embedding,
+    "llm": _warm_llm,
+    "doris": _warm_doris,
+    "local": _warm_local,
+}
+
+
+class WarmUp:
+    """Runs warm-up steps in the background and tracks their state."""
+
+    def __init__(self, steps: list[str], retry_seconds: float = 10.0):
+        unknown = [s for s in steps if s not in STEPS]
+        if unknown:
+            raise ValueError(f"Unknown warm-up steps: {', '.join(unknown)}")
+        self.steps = steps
+        self.retry_seconds = retry_seconds
+        self.state: dict[str, dict[str, Any]] = {s: {"status": "pending"} for s in steps}
+        self.started_at = time.time()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_settings(cls) -> "WarmUp":
+        conf = settings.service
+        from rag_lib import retrieval_backend
+
+        steps = [s.strip() for s in conf.get("warmup", "embedding,llm,doris").split(",") if s.strip()]
+        # An unusable backend fails the service at startup rather than every search
+        if retrieval_backend() in ("local", "auto") and "local" not in steps:
+            steps.append("local")
+        return cls(steps, float(conf.get("warmup_retry_seconds", 10)))
+
+    @property
+    def ready(self) -> bool:
+        return all(v["status"] == "ok" for v in self.state.values())
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True, name="warm-up")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        # Let a step in progress finish rather than killing it at interpreter exit
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        pending = list(self.steps)
+        while pending and not self._stop.is_set():
+            for step in list(pending):
+                start = time.perf_counter()
+                try:
+                    STEPS[step]()
+                except Exception as e:
+                    self.state[step] = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+                    logger.warning("Warm-up step %s failed: %s", step, e)
+                    continue
+                self.state[step] = {"status": "ok", "seconds": round(time.perf_counter() - start, 3)}
+                pending.remove(step)
+            if pending:
+                self._stop.wait(self.retry_seconds)
+        if not pending:
+            logger.info("Warm-up finished in %.1fs: %s", time.time() - self.started_at, self.state)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"ready": self.ready, "steps": self.state}
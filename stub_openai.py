@@ -0,0 +1,189 @@
+"""
+Stub OpenAI-compatible server for offline benchmarking.
+
+Implements the two endpoints the RAG service uses:
+- POST /v1/embeddings        -> deterministic pseudo-random unit vectors
+- POST /v1/chat/completions  -> canned answer with token usage
+
+Latency per endpoint is configurable (fixed delay plus uniform jitter), so
+the benchmark can model a slow provider without any network access.
+
+Usage:
+    python stub_openai.py --port 18080 --embed-dim 1024 --chat-latency-ms 200
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    """Deterministic unit vector derived from the text hash."""
+    seed = struct.unpack("<Q", hashlib.sha256(text.encode("utf-8")).digest()[:8])[0]
+    rng = random.Random(seed)
+    vec = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = sum(x * x for x in vec) ** 0.5 or 1.0
+    return [x / norm for x in vec]
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """OpenAI-compatible HTTP server with configurable latency."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        embed_dim: int = 1024,
+        embed_latency_ms: float = 0.0,
+        chat_latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        answer: str = "This is a stub answer.",
+    ):
+        super().__init__((host, port), _StubHandler)
+        self.embed_dim = embed_dim
+        self.embed_latency_ms = embed_latency_ms
+        self.chat_latency_ms = chat_latency_ms
+        self.jitter_ms = jitter_ms
+        self.answer = answer
+        self.request_counts = {"embeddings": 0, "chat": 0}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def sleep(self, base_ms: float) -> None:
+        delay = base_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def count(self, kind: str) -> None:
+        with self._lock:
+            self.request_counts[kind] += 1
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: StubOpenAIServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("stub-openai: " + format, *args)
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON"}})
+            return
+
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path.endswith("/embeddings"):
+            self._embeddings(req)
+        elif path.endswith("/chat/completions"):
+            self._chat(req)
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _embeddings(self, req: dict) -> None:
+        self.server.count("embeddings")
+        inputs = req.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dim = int(req.get("dimensions") or self.server.embed_dim)
+        self.server.sleep(self.server.embed_latency_ms)
+        data = [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(str(text), dim)}
+            for i, text in enumerate(inputs)
+        ]
+        tokens = sum(len(str(t).split()) for t in inputs)
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": req.get("model", "stub-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _chat(self, req: dict) -> None:
+        self.server.count("chat")
+        messages = req.get("messages") or []
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+        self.server.sleep(self.server.chat_latency_ms)
+        answer = self.server.answer
+        completion_tokens = len(answer.split())
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "stub-llm"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--embed-dim", type=int, default=1024)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubOpenAIServer(
+        host=args.host,
+        port=args.port,
+        embed_dim=args.embed_dim,
+        embed_latency_ms=args.embed_latency_ms,
+        chat_latency_ms=args.chat_latency_ms,
+        jitter_ms=args.jitter_ms,
+    )
+    print(f"Stub OpenAI server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()